@@ -0,0 +1,41 @@
+import sys
+import time
+import tracemalloc
+
+from nanocalc.expr import walk
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+
+STATEMENT = "x = (x + 1) * 2 - f(x, 3) / 4 if x < 10 and y[2] != [1, 2]\n"
+
+SIZES = [100000]
+
+
+def bench(n, repeat=3):
+    tokens = tokenize(STATEMENT * n)
+
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        parse(tokens)
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    program = parse(tokens)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    nodes = sum(1 for _ in walk(program))
+    return nodes, size, best
+
+
+def main(sizes=SIZES):
+    print(f"{'stmnts':>10} {'nodes':>10} {'MB':>10} {'B/node':>10} {'seconds':>10}")
+    for n in sizes:
+        nodes, size, t = bench(n)
+        mb = size / 1e6
+        print(f"{n:>10} {nodes:>10} {mb:>10.1f} {size / nodes:>10.1f} {t:>10.4f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
@@ -0,0 +1,67 @@
+import sys
+import time
+import tracemalloc
+
+from nanocalc import backend
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+
+WORKLOADS = {
+    'sin': 'x = 0..2*pi..{n}; sin(x) * 2',
+    'poly': 'x = 0..1..{n}; 3*x^3 - 2*x^2 + x - 1',
+    'compare': 'x = 1..{n}; #(x % 3 == 0)',
+}
+
+
+def bench(program, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        program.eval()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def footprint(program):
+    # memory held by the result, e.g. a list variable of n numbers
+    tracemalloc.start()
+    result = program.eval()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main(sizes=(1000, 100000, 1000000)):
+    backends = [b for b in backend.BACKENDS if b != 'numpy' or backend.np is not None]
+
+    for workload, source in WORKLOADS.items():
+        print(workload)
+        for n in sizes:
+            program = parse(tokenize(source.format(n=n)))
+
+            times = {}
+            for name in backends:
+                backend.set_backend(name)
+                times[name] = bench(program)
+            backend.set_backend('list')
+
+            line = ' '.join(f"{b} {t * 1e9 / n:>8.1f}ns/elem" for b, t in times.items())
+            print(f"{n:>10} {line}")
+
+    print('memory')
+    for n in sizes:
+        program = parse(tokenize(f'x = 0..1..{n}; y = 1..{n}; x*y'))
+
+        held = {}
+        for name in backends:
+            backend.set_backend(name)
+            held[name] = footprint(program)
+        backend.set_backend('list')
+
+        line = ' '.join(f"{b} {m / n:>8.1f}B/elem" for b, m in held.items())
+        print(f"{n:>10} {line}")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or (1000, 100000, 1000000))
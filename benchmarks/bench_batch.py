@@ -0,0 +1,76 @@
+import random
+import sys
+import time
+
+from nanocalc import Session, backend
+
+DEFINITIONS = """
+f(x, y) = sqrt(x^2 + y^2) * 2 + 1
+"""
+
+FORMULA = "f(x, y)"
+
+SIZES = [100000]
+
+
+def timed(f, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = f()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench(engine, n):
+    session = Session(engine)
+    session.eval(DEFINITIONS)
+    x = [random.random() for _ in range(n)]
+    y = [random.random() for _ in range(n)]
+
+    program = session.parse(FORMULA)
+    run = session.compile(program)
+
+    def loop():
+        results = []
+        for a, b in zip(x, y):
+            session['x'] = a
+            session['y'] = b
+            results.append(run(session.globals))
+        return results
+
+    batch = session.batch(FORMULA)
+    t_loop, expected = timed(loop)
+    t_rows, actual = timed(lambda: batch.rows({'x': x, 'y': y}, n))
+    assert actual == expected
+    t_batch, actual = timed(lambda: batch({'x': x, 'y': y}))
+    assert actual == expected
+
+    times = {'loop': t_loop, 'rows': t_rows, 'batch': t_batch}
+    if backend.np is not None:
+        backend.set_backend('numpy')
+        try:
+            xs, ys = backend.np.array(x), backend.np.array(y)
+            t_numpy, actual = timed(lambda: batch({'x': xs, 'y': ys}))
+            assert max(abs(actual - expected)) < 1e-9
+            times['numpy'] = t_numpy
+        finally:
+            backend.set_backend('list')
+
+    return times
+
+
+def main(sizes=SIZES):
+    for n in sizes:
+        print(f"{n} rows, ns/row")
+        print(f"{'engine':>10} {'loop':>10} {'rows':>10} {'batch':>10} {'numpy':>10}")
+        for engine in ['tree', 'closure', 'python']:
+            t = bench(engine, n)
+            cols = [f"{t[k] * 1e9 / n:>10.1f}" for k in ('loop', 'rows', 'batch')]
+            numpy = f"{t['numpy'] * 1e9 / n:.1f}" if 'numpy' in t else '-'
+            cols.append(f"{numpy:>10}")
+            print(f"{engine:>10} {' '.join(cols)}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
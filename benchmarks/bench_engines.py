@@ -0,0 +1,80 @@
+import contextlib
+import io
+import os
+import sys
+import time
+
+from nanocalc.codegen import compile_python
+from nanocalc.compiler import compile
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.stack import compile_stack
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+ENGINES = {
+    'tree': lambda program: program.eval,
+    'closure': compile,
+    'python': compile_python,
+    'stack': compile_stack,
+}
+
+FUNCTIONS = """
+f(x) = x^2 + 2*x + 1
+g(x) = {
+    0 if x < 0
+    f(x) / (1 + x)
+}
+s = 0
+for i in 1..100000
+    s = s + g(i - 50)
+s
+"""
+
+PIPELINE = """
+sum sin(1..Inf..1000000)^2 + cos(1..Inf..1000000)^2
+"""
+
+
+def load(workload):
+    if os.path.exists(workload):
+        with open(workload) as f:
+            return f.read()
+    if workload == 'functions':
+        return FUNCTIONS
+    if workload == 'pipeline':
+        return PIPELINE
+    with open(os.path.join(EXAMPLES, f'{workload}.nc')) as f:
+        return f.read()
+
+
+def bench(program, engine, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        GLOBALS._d.clear()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            t0 = time.perf_counter()
+            result = ENGINES[engine](program)()
+            best = min(best, time.perf_counter() - t0)
+    return best, (result, out.getvalue())
+
+
+def main(workloads=('rule110', 'functions', 'pipeline')):
+    for workload in workloads:
+        program = parse(tokenize(load(workload)))
+
+        print(workload)
+        times = {}
+        outputs = {}
+        for engine in ENGINES:
+            times[engine], outputs[engine] = bench(program, engine)
+            speedup = times['tree'] / times[engine]
+            print(f"{engine:>10} {times[engine]:>10.4f}s {speedup:>8.2f}x")
+
+        for engine in ENGINES:
+            assert outputs[engine] == outputs['tree'], engine
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ('rule110', 'functions', 'pipeline'))
@@ -0,0 +1,43 @@
+import sys
+import time
+
+from nanocalc.lexer import tokenize
+
+SNIPPET = """\
+# rule 110 step
+f(i) = {
+    0 if state[i-1..i+1] == [1, 1, 1]
+    1 if state[i-1..i+1] == [1, 1, 0]
+}
+x = 0...1..+0.25; y = 2.5e-3 * sin(pi/4) + .5
+for j in 1..#state { next[j] = f(j) }
+write "row\\n" x y
+"""
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20]
+
+
+def make_input(size):
+    n = size // len(SNIPPET) + 1
+    return (SNIPPET * n)[:size].rsplit('\n', 1)[0] + '\n'
+
+
+def bench(size, repeat=3):
+    s = make_input(size)
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        tokens = tokenize(s)
+        best = min(best, time.perf_counter() - t0)
+    return len(s), len(tokens), best
+
+
+def main(sizes=SIZES):
+    print(f"{'bytes':>10} {'tokens':>10} {'seconds':>10} {'ns/byte':>10}")
+    for size in sizes:
+        nbytes, ntokens, t = bench(size, repeat=1 if size > (1 << 20) else 3)
+        print(f"{nbytes:>10} {ntokens:>10} {t:>10.4f} {t / nbytes * 1e9:>10.1f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
@@ -0,0 +1,85 @@
+import contextlib
+import io
+import os
+import sys
+import time
+
+from nanocalc.codegen import compile_python
+from nanocalc.compiler import compile
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.optimize import Folder, optimize
+from nanocalc.parser import parse
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+ENGINES = {
+    'tree': lambda program: program.eval,
+    'closure': compile,
+    'python': compile_python,
+}
+
+CONSTANTS = """
+s = 0
+for i in 1..200000 {
+    x = 2*pi/360 * i
+    s = s + sin(x)*1 + sqrt(2)/2 - e^0
+}
+s
+"""
+
+INVARIANTS = """
+a = 3
+b = 4
+s = 0
+for i in 1..200000 {
+    s = s + sqrt(a*a + b*b) * i / (a*b + 1)
+}
+s
+"""
+
+WORKLOADS = {'constants': CONSTANTS, 'invariants': INVARIANTS}
+
+
+def bench(program, engine, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        GLOBALS._d.clear()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            t0 = time.perf_counter()
+            result = ENGINES[engine](program)()
+            best = min(best, time.perf_counter() - t0)
+    return best, (result, out.getvalue())
+
+
+def load(workload):
+    if workload in WORKLOADS:
+        return WORKLOADS[workload]
+    with open(os.path.join(EXAMPLES, f'{workload}.nc')) as f:
+        return f.read()
+
+
+def fold(program):
+    # -O without moving loop invariants, to tell the two passes apart
+    return Folder(program, GLOBALS).fold(program)
+
+
+def main(workloads=('constants', 'invariants', 'rule110', 'for-loop')):
+    for workload in workloads:
+        program = parse(tokenize(load(workload)))
+        folded = fold(program)
+        optimized = optimize(program)
+
+        print(workload)
+        print(f"{'engine':>10} {'-O0':>10} {'fold':>10} {'-O':>10} {'speedup':>10}")
+        for engine in ENGINES:
+            t0, expected = bench(program, engine)
+            t1, actual = bench(folded, engine)
+            assert actual == expected, engine
+            t2, actual = bench(optimized, engine)
+            assert actual == expected, engine
+            print(f"{engine:>10} {t0:>9.4f}s {t1:>9.4f}s {t2:>9.4f}s {t0 / t2:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ('constants', 'invariants', 'rule110', 'for-loop'))
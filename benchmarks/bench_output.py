@@ -0,0 +1,82 @@
+import io
+import os
+import sys
+import time
+
+from nanocalc import Session
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+PRINT = """
+for i in 1..20000 {
+    print i i^2 "x"
+}
+"""
+
+TABLE = """
+x = 1..20000
+table x x^2 x^3
+"""
+
+
+class Counter(io.RawIOBase):
+    # a file that only counts the writes that reach it, like syscalls
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.writes += 1
+        self.bytes += len(b)
+        return len(b)
+
+
+def load(workload):
+    if workload == 'print':
+        return PRINT
+    if workload == 'table':
+        return TABLE
+    with open(os.path.join(EXAMPLES, f'{workload}.nc')) as f:
+        return f.read()
+
+
+def bench(source, engine, size, tty, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        raw = Counter()
+        stdout = io.TextIOWrapper(io.BufferedWriter(raw), line_buffering=tty)
+        session = Session(engine, output_size=size)
+        program = session.parse(source)
+        sys.stdout, saved = stdout, sys.stdout
+        try:
+            t0 = time.perf_counter()
+            session.run(program)
+            best = min(best, time.perf_counter() - t0)
+        finally:
+            sys.stdout = saved
+    return best, raw.writes, raw.bytes
+
+
+def main(workloads=('rule110', 'print', 'table')):
+    print(
+        f"{'workload':>10} {'engine':>8} {'stdout':>6} {'buffer':>8} "
+        f"{'time':>10} {'writes':>8}"
+    )
+    for workload in workloads:
+        source = load(workload)
+        for engine in ('tree', 'python'):
+            for tty in (False, True):
+                for size in (0, Session().output.size):
+                    t, writes, _ = bench(source, engine, size, tty)
+                    kind = 'tty' if tty else 'pipe'
+                    print(
+                        f"{workload:>10} {engine:>8} {kind:>6} {size:>8} "
+                        f"{t:>9.4f}s {writes:>8}"
+                    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ('rule110', 'print', 'table'))
@@ -0,0 +1,64 @@
+import contextlib
+import io
+import os
+import sys
+import time
+
+from nanocalc import Session, parallel
+
+FIB = """
+fib(n) = { n if n < 2; fib(n - 1) + fib(n - 2) }
+"""
+
+LOOP = FIB + """
+for i in 1..400 {
+    x = fib(i % 8 + 10)
+    print x
+}
+"""
+
+FORMULA = "fib(n % 8 + 10)"
+
+
+def timed(f, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            t0 = time.perf_counter()
+            result = f()
+            best = min(best, time.perf_counter() - t0)
+    return best, (result, out.getvalue())
+
+
+def loop(engine, jobs):
+    session = Session(engine)
+    return parallel.run(session, session.parse(LOOP), jobs)
+
+
+def batch(engine, jobs):
+    columns = {'n': list(range(400))}
+    return parallel.parallel_batch(FORMULA, columns, FIB, engine, jobs)
+
+
+WORKLOADS = {'loop': loop, 'batch': batch}
+
+
+def main(engines=('tree', 'closure', 'python')):
+    cores = os.cpu_count() or 1
+    jobs = sorted({1, 2, cores} | {j for j in (4, 8) if j <= cores})
+    print(f'{cores} cores')
+    for name, workload in WORKLOADS.items():
+        print(name)
+        print(f"{'engine':>10}" + ''.join(f"{f'-j{j}':>10}" for j in jobs))
+        for engine in engines:
+            t1, expected = timed(lambda: workload(engine, 1))
+            times = [t1]
+            for j in jobs[1:]:
+                t, actual = timed(lambda: workload(engine, j))
+                assert actual == expected, (engine, j)
+                times.append(t)
+            print(f'{engine:>10}' + ''.join(f'{t:>9.3f}s' for t in times))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ('tree', 'closure', 'python'))
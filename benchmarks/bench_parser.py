@@ -0,0 +1,30 @@
+import sys
+import time
+
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+
+STATEMENT = "x = (x + 1) * 2 - f(x, 3) / 4\n"
+
+SIZES = [1000, 10000, 100000]
+
+
+def bench(n, repeat=3):
+    tokens = tokenize(STATEMENT * n)
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        parse(tokens)
+        best = min(best, time.perf_counter() - t0)
+    return len(tokens), best
+
+
+def main(sizes=SIZES):
+    print(f"{'stmnts':>10} {'tokens':>10} {'seconds':>10} {'us/token':>10}")
+    for n in sizes:
+        ntokens, t = bench(n)
+        print(f"{n:>10} {ntokens:>10} {t:>10.4f} {t / ntokens * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
@@ -0,0 +1,60 @@
+import sys
+import time
+
+from nanocalc.codegen import compile_python
+from nanocalc.compiler import compile
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+
+ENGINES = {
+    'tree': lambda program: program.eval,
+    'closure': compile,
+    'python': compile_python,
+}
+
+PROGRAMS = {
+    # a loop written as recursion, like examples/loop.nc
+    'loop': """
+    f(x, n) = {{ {{ y = x + 1; f(y, n) }} if x < n; nil }}
+    f(0, {n})
+    """,
+    'accumulator': """
+    g(n, a) = {{ a if n == 0; g(n - 1, a + n) }}
+    g({n}, 0)
+    """,
+    'mutual': """
+    even(n) = {{ 1 if n == 0; odd(n - 1) }}
+    odd(n) = {{ 0 if n == 0; even(n - 1) }}
+    even({n})
+    """,
+}
+
+
+def bench(program, engine, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        GLOBALS._d.clear()
+        t0 = time.perf_counter()
+        result = ENGINES[engine](program)()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main(depths=(10000, 100000, 1000000)):
+    print(f"{'program':<12} {'depth':>8} " + ' '.join(f'{e:>14}' for e in ENGINES))
+    for name, source in PROGRAMS.items():
+        for n in depths:
+            program = parse(tokenize(source.format(n=n)))
+            times = []
+            expected = None
+            for engine in ENGINES:
+                t, result = bench(program, engine)
+                assert expected is None or result == expected, engine
+                expected = result
+                times.append(f'{t * 1e9 / n:>7.0f}ns/call')
+            print(f'{name:<12} {n:>8} ' + ' '.join(f'{t:>14}' for t in times))
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or (10000, 100000, 1000000))
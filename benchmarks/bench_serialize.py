@@ -0,0 +1,66 @@
+import gc
+import pickle
+import sys
+import time
+
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.serialize import deserialize, serialize
+
+STATEMENT = "x = (x + 1) * 2 - f(x, 3) / 4 if x < 10 and y[2] != [1, 2]\n"
+
+SIZES = [1000, 10000, 100000]
+
+
+def best(f, *args, repeat=3):
+    t = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        f(*args)
+        t = min(t, time.perf_counter() - t0)
+    return t
+
+
+def pickle_loads(data):
+    # the same advantage deserialize gives itself
+    gc.disable()
+    try:
+        return pickle.loads(data)
+    finally:
+        gc.enable()
+
+
+def bench(n):
+    source = STATEMENT * n
+    program = parse(tokenize(source))
+    data = serialize(program)
+    pickled = pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+
+    assert repr(deserialize(data)) == repr(program)
+
+    return {
+        'source': len(source),
+        'size': len(data),
+        'pickle': len(pickled),
+        'parse': best(lambda: parse(tokenize(source))),
+        'load': best(deserialize, data),
+        'unpickle': best(pickle_loads, pickled),
+    }
+
+
+def main(sizes=SIZES):
+    print(
+        f"{'stmnts':>8} {'source':>10} {'size':>10} {'pickle':>10}"
+        f" {'parse':>9} {'load':>9} {'unpickle':>9} {'speedup':>8}"
+    )
+    for n in sizes:
+        r = bench(n)
+        print(
+            f"{n:>8} {r['source']:>10} {r['size']:>10} {r['pickle']:>10}"
+            f" {r['parse']:>8.4f}s {r['load']:>8.4f}s {r['unpickle']:>8.4f}s"
+            f" {r['parse'] / r['load']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
@@ -0,0 +1,67 @@
+import sys
+import threading
+import time
+import tracemalloc
+
+from nanocalc import Session
+
+FORMULA = "f(x) = x^2 + 2*x + 1; f(k)"
+
+COUNTS = [10000]
+
+
+def per_session(f, n, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for k in range(n):
+            f(k)
+        best = min(best, time.perf_counter() - t0)
+    return best / n
+
+
+def create(k):
+    return Session()
+
+
+def evaluate(k):
+    session = Session()
+    session['k'] = k
+    return session.eval(FORMULA)
+
+
+def threaded(n, nthreads=8):
+    def work():
+        for k in range(n // nthreads):
+            evaluate(k)
+
+    threads = [threading.Thread(target=work) for _ in range(nthreads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return (time.perf_counter() - t0) / n
+
+
+def memory(n):
+    tracemalloc.start()
+    sessions = [Session() for _ in range(n)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del sessions
+    return size / n
+
+
+def main(counts=COUNTS):
+    print(f"{'sessions':>10} {'create':>10} {'eval':>10} {'threads':>10} {'bytes':>10}")
+    for n in counts:
+        t0 = per_session(create, n) * 1e6
+        t1 = per_session(evaluate, n) * 1e6
+        t2 = threaded(n) * 1e6
+        b = memory(n)
+        print(f"{n:>10} {t0:>8.2f}us {t1:>8.2f}us {t2:>8.2f}us {b:>10.0f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or COUNTS)
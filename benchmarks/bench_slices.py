@@ -0,0 +1,54 @@
+import sys
+import time
+
+from nanocalc.codegen import compile_python
+from nanocalc.compiler import compile
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+
+ENGINES = {
+    'tree': lambda program: program.eval,
+    'closure': compile,
+    'python': compile_python,
+}
+
+# windows around every position, wrapping around the ends of v
+WINDOWS = """
+v = 0..0..{n}
+for i in 1..{n} {{ v[i] = i % 3 }}
+c = 0
+for i in 1..{n} {{
+    c = c + 1 if v[i-1..i+1] == [0, 1, 2]
+    c = c + 1 if v[i-{w}..i+{w}..+{w}] == [0, 1, 2]
+}}
+c
+"""
+
+
+def bench(program, engine, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        GLOBALS._d.clear()
+        t0 = time.perf_counter()
+        result = ENGINES[engine](program)()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main(sizes=(1000, 10000, 100000)):
+    print(f"{'n':>8} " + ' '.join(f'{e:>14}' for e in ENGINES))
+    for n in sizes:
+        program = parse(tokenize(WINDOWS.format(n=n, w=n // 4)))
+        times = []
+        expected = None
+        for engine in ENGINES:
+            t, result = bench(program, engine)
+            assert expected is None or result == expected, engine
+            expected = result
+            times.append(f'{t * 1e9 / n:>9.0f}ns/el')
+        print(f'{n:>8} ' + ' '.join(f'{t:>14}' for t in times))
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or (1000, 10000, 100000))
@@ -0,0 +1,69 @@
+import io
+import sys
+import time
+import tracemalloc
+
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.stream import statements
+
+SIZES = [10000, 100000]
+
+
+def script(n):
+    lines = ['f(x) = {\n', '  y = x*2\n', '  y + 1\n', '}\n']
+    for i in range(n):
+        lines.append(f'x = f({i})\n')
+    return ''.join(lines)
+
+
+def whole(f):
+    program = parse(tokenize(f.read()))
+    return program.left[:1], len(program.left)
+
+
+def stream(f):
+    first = None
+    count = 0
+    for program in statements(f):
+        first = first or program.left[:1]
+        count += len(program.left)
+    return first, count
+
+
+def first_statement(f):
+    return next(statements(f)).left[:1]
+
+
+def measure(parse, source):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = parse(io.StringIO(source))
+    t = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return t, peak, result
+
+
+def main(sizes=SIZES):
+    print(f"{'lines':>8} {'mode':>8} {'total':>10} {'first':>10} {'peak':>10}")
+    for n in sizes:
+        source = script(n)
+        t_first, _, _ = measure(first_statement, source)
+        t_whole, m_whole, expected = measure(whole, source)
+        t_stream, m_stream, actual = measure(stream, source)
+        assert repr(actual) == repr(expected)
+
+        # without streaming the first statement runs after the whole parse
+        print(
+            f"{n:>8} {'whole':>8} {t_whole:>9.3f}s {t_whole:>9.3f}s "
+            f"{m_whole / 2**20:>8.1f}MB"
+        )
+        print(
+            f"{n:>8} {'stream':>8} {t_stream:>9.3f}s {t_first:>9.5f}s "
+            f"{m_stream / 2**20:>8.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or SIZES)
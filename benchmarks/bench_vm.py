@@ -0,0 +1,55 @@
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.vm import codes, compile_vm, lower
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def bench(run, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        GLOBALS._d.clear()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            t0 = time.perf_counter()
+            try:
+                result = run()
+            except BaseException as e:
+                result = type(e)
+            best = min(best, time.perf_counter() - t0)
+    return best, (result, out.getvalue())
+
+
+def main(files=None):
+    files = files or sorted(glob.glob(os.path.join(EXAMPLES, '*.nc')))
+    header = ['instrs', 'lower', 'eval', 'vm']
+    print(f"{'example':<22} {header[0]:>7} " + ' '.join(f'{h:>10}' for h in header[1:]))
+    for fname in files:
+        with open(fname) as f:
+            program = parse(tokenize(f.read()))
+
+        t0 = time.perf_counter()
+        code = lower(program)
+        lowering = time.perf_counter() - t0
+
+        tree, expected = bench(program.eval)
+        vm, actual = bench(compile_vm(program))
+        assert actual == expected, fname
+
+        name = os.path.basename(fname)
+        size = sum(len(c.instructions) for c in codes(code))
+        print(
+            f"{name:<22} {size:>7} {lowering * 1e3:>8.3f}ms "
+            f"{tree * 1e3:>8.3f}ms {vm * 1e3:>8.3f}ms {tree / vm:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,309 @@
+import argparse
+import atexit
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.session import ENGINES, Session
+
+# Workloads for the lexer, the parser, the evaluator and the output commands,
+# each scaled by a factor and timed with time.perf_counter. Results are
+# written as JSON, and a previous result file can be given to --compare to
+# see what got faster or slower between two commits:
+#
+#   python -m benchmarks.suite --json before.json
+#   git checkout other
+#   python -m benchmarks.suite --compare before.json
+#
+# With pytest-benchmark installed, `pytest benchmarks/suite.py` runs the same
+# workloads through its benchmark fixture.
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+STATEMENT = 'x = (x + 1) * 2 - f(x, 3) / 4 if x < 10 and not y; s = "text"\n'
+
+ARITHMETIC = 'x = (x + 3) * 2 % 1000 - y / 7 + 2^3 - (x - y) * (x + y) % 13\n'
+
+# Where the evaluator workloads print to; shared by all of them, so that only
+# one file is open however many run
+DEVNULL = open(os.devnull, 'w')
+atexit.register(DEVNULL.close)
+
+
+def source(name):
+    with open(os.path.join(EXAMPLES, name)) as f:
+        return f.read()
+
+
+def nested(depth):
+    # a statement nested depth levels deep in parentheses and blocks
+    expr = 'x'
+    for i in range(depth):
+        expr = f'({expr} + {i})' if i % 2 else f'{{ y = {i}; {expr} * 2 }}'
+    return f'z = {expr}\n'
+
+
+def evaluator(text, engine):
+    # compile once, then run in a fresh session each time
+    session = Session(engine, file=DEVNULL)
+    code = session.compile(session.parse(text))
+
+    def run():
+        session = Session(engine, file=DEVNULL)
+        try:
+            return code(session.globals)
+        finally:
+            session.flush()
+
+    return run
+
+
+def lexer_long(scale, engine):
+    text = STATEMENT * (4000 * scale)
+    return len(text), 'bytes', lambda: tokenize(text)
+
+
+def parser_wide(scale, engine):
+    tokens = tokenize(STATEMENT * (2000 * scale))
+    return len(tokens), 'tokens', lambda: parse(tokens)
+
+
+def parser_deep(scale, engine):
+    tokens = tokenize(nested(60) * (20 * scale))
+    return len(tokens), 'tokens', lambda: parse(tokens)
+
+
+def parser_chain(scale, engine):
+    # one left-deep expression, as generated code tends to have
+    tokens = tokenize(' + '.join(['x'] * (5000 * scale)) + '\n')
+    return len(tokens), 'tokens', lambda: parse(tokens)
+
+
+def eval_arithmetic(scale, engine):
+    n = 2000 * scale
+    return n, 'stmnts', evaluator('x = 1; y = 2\n' + ARITHMETIC * n, engine)
+
+
+def eval_range(scale, engine):
+    n = 100000 * scale
+    text = f"""
+    x = 1..{n}
+    y = x * 2 + 1
+    z = sqrt(x) + y % 3
+    sum (1..{n})^2 - (1..{n})
+    """
+    return n, 'elems', evaluator(text, engine)
+
+
+def eval_calls(scale, engine):
+    n = 5000 * scale
+    text = f"""
+    f(x) = x^2 + 2*x + 1
+    g(x) = {{ 0 if x < 0; f(x) / (1 + x) }}
+    s = 0
+    for i in 1..{n} {{ s = s + g(i - 50) + f(i) }}
+    s
+    """
+    return n, 'iters', evaluator(text, engine)
+
+
+def eval_loop(scale, engine):
+    n = 100 * scale
+    text = f"""
+    s = 0
+    for i in 1..{n} {{
+        for j in 1..100 {{ s = s + (i * j) % 7 }}
+    }}
+    s
+    """
+    return n * 100, 'iters', evaluator(text, engine)
+
+
+def eval_recursion(scale, engine):
+    n = 5000 * scale
+    text = f'g(n, a) = {{ a if n == 0; g(n - 1, a + n) }}; g({n}, 0)'
+    return n, 'calls', evaluator(text, engine)
+
+
+def eval_rule110(scale, engine):
+    n = 16 * scale
+    text = source('rule110.nc').replace('N = 512', f'N = {n}')
+    return n, 'rows', evaluator(text, engine)
+
+
+def commands_print(scale, engine):
+    n = 5000 * scale
+    text = f'for i in 1..{n} {{ print i i^2 "x" }}'
+    return n, 'lines', evaluator(text, engine)
+
+
+def commands_write(scale, engine):
+    n = 5000 * scale
+    text = f"""
+    for i in 1..{n} {{ write i " " i/2 "\\n" }}
+    write 1..{n} "\\n"
+    """
+    return 2 * n, 'lines', evaluator(text, engine)
+
+
+def commands_table(scale, engine):
+    n = 20000 * scale
+    text = f'x = 1..{n}; table x x^2 sqrt(x)'
+    return n, 'rows', evaluator(text, engine)
+
+
+WORKLOADS = {
+    'lexer.long': lexer_long,
+    'parser.wide': parser_wide,
+    'parser.deep': parser_deep,
+    'parser.chain': parser_chain,
+    'eval.arithmetic': eval_arithmetic,
+    'eval.range': eval_range,
+    'eval.calls': eval_calls,
+    'eval.loop': eval_loop,
+    'eval.recursion': eval_recursion,
+    'eval.rule110': eval_rule110,
+    'commands.print': commands_print,
+    'commands.write': commands_write,
+    'commands.table': commands_table,
+}
+
+
+def measure(run, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def commit():
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(__file__),
+        )
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def run_suite(names, scale=1, engine='tree', repeat=5):
+    results = {}
+    for name in names:
+        size, unit, run = WORKLOADS[name](scale, engine)
+        run()  # warm up caches, e.g. compiled code
+        times = measure(run, repeat)
+        results[name] = {
+            'size': size,
+            'unit': unit,
+            'min': min(times),
+            'median': statistics.median(times),
+            'times': times,
+        }
+        yield name, results[name]
+
+
+def report(results, scale, engine, repeat):
+    return {
+        'commit': commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'engine': engine,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def main(argv=None):
+    argp = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    argp.add_argument('workloads', nargs='*', help='names or prefixes, e.g. eval')
+    argp.add_argument('--scale', type=int, default=1)
+    argp.add_argument('--repeat', type=int, default=5)
+    argp.add_argument('-e', '--engine', choices=list(ENGINES), default='tree')
+    argp.add_argument('--json', type=str, help='write the results to this file')
+    argp.add_argument('--compare', type=str, help='results of an earlier run')
+    argp.add_argument('--threshold', type=float, default=0.1)
+    args = argp.parse_args(argv)
+
+    names = [
+        n
+        for n in WORKLOADS
+        if not args.workloads or any(n.startswith(w) for w in args.workloads)
+    ]
+    if not names:
+        argp.error(f"no workloads match {' '.join(args.workloads)}")
+
+    before = {}
+    if args.compare:
+        with open(args.compare) as f:
+            data = json.load(f)
+        # times at another scale or of another engine are not comparable
+        for key in ('engine', 'scale'):
+            if data.get(key) != getattr(args, key):
+                argp.error(
+                    f"{args.compare} is for {key} {data.get(key)}, "
+                    f"not {getattr(args, key)}"
+                )
+        before = data['results']
+
+    header = ['size', 'min', 'median', 'ns/unit']
+    print(f"{'workload':<18} " + ' '.join(f'{h:>10}' for h in header))
+    results = {}
+    slower = []
+    for name, r in run_suite(names, args.scale, args.engine, args.repeat):
+        results[name] = r
+        line = (
+            f"{name:<18} {r['size']:>10} {r['min']:>9.4f}s {r['median']:>9.4f}s "
+            f"{r['min'] / r['size'] * 1e9:>10.1f} {r['unit']}"
+        )
+        old = before.get(name)
+        if old is not None and old['size'] == r['size']:
+            ratio = r['min'] / old['min']
+            line += f" {ratio:>7.2f}x"
+            if ratio > 1 + args.threshold:
+                slower.append(name)
+                line += ' slower'
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            data = report(results, args.scale, args.engine, args.repeat)
+            json.dump(data, f, indent=2)
+
+    if slower:
+        print(f"slower than {args.compare}: {', '.join(slower)}")
+        return 1
+    return 0
+
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+if pytest is not None:
+
+    @pytest.mark.parametrize('name', list(WORKLOADS))
+    def test_workload(request, name):
+        # the benchmark fixture is only there with pytest-benchmark installed
+        pytest.importorskip('pytest_benchmark')
+        benchmark = request.getfixturevalue('benchmark')
+        size, unit, run = WORKLOADS[name](1, 'tree')
+        benchmark(run)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
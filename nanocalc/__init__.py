@@ -0,0 +1,6 @@
+__version__ = '0.1.0'
+
+from .compiler import compile
+from .session import Session
+
+__all__ = ['Session', 'compile']
@@ -6,42 +6,97 @@ import subprocess
 
 from .lexer import tokenize
 from .parser import parse
-from .expr import GLOBALS, draw_tree
+from .expr import draw_tree
+from .optimize import optimize
+from .session import ENGINES, Session
 from .common import TRACE, ExprError
+from .profiler import Profiler, locate
+from . import backend, cache, parallel, vm
 
 
-def repl(args):
+def repl(session, args):
     for line in sys.stdin:
         tokens = tokenize(line)
         if args.tokens:
             print(tokens)
         expr = parse(tokens)
-        result = expr.eval()
+        if args.optimize:
+            # later lines may rebind what a function defined here reads
+            expr = optimize(expr, session.globals, partial=True)
+        result = session.run(expr)
         if result is not None:
-            GLOBALS['_'] = result
-            GLOBALS['ans'] = result
-            print('=', result)
+            session['_'] = result
+            session['ans'] = result
+            print('=', backend.tolist(result))
 
 
-def _main(args):
+def stream(session, lines, args):
+    result = None
+    for program in session.statements(lines):
+        result = parallel.run(session, program, args.jobs)
+    return result
+
+
+def _main(session, args):
+    if args.file is None and not args.input and sys.stdin.isatty():
+        repl(session, args)
+        return
+
+    listing = args.tokens or args.ast or args.dis or args.profile
+    if args.stream and not args.input and not listing:
+        if args.file is None:
+            result = stream(session, sys.stdin, args)
+        else:
+            with open(args.file) as f:
+                result = stream(session, f, args)
+        if result is not None:
+            print(backend.tolist(result))
+        return
+
     if args.file is not None:
         with open(args.file) as f:
             input = f.read()
     elif len(args.input) > 0:
         input = '\n'.join(args.input)
-    elif not sys.stdin.isatty():
+    else:
         input = sys.stdin.read()
+
+    positions = None
+    if args.file is not None and args.cache and not (args.tokens or args.profile):
+        program = cache.load_program(
+            input, args.optimize, args.cache_dir, session.globals
+        )
     else:
-        repl(args)
+        offsets = [] if args.profile else None
+        tokens = tokenize(input, offsets=offsets)
+        if args.tokens:
+            print(tokens)
+        program = parse(tokens)
+        if args.profile:
+            positions = locate(program, tokens, offsets, input)
+        if args.optimize:
+            program = optimize(program, session.globals)
+
+    if args.dis:
+        # list the instructions of the vm engine instead of running
+        print(vm.disassemble(vm.lower(program)))
         return
 
-    tokens = tokenize(input)
-    if args.tokens:
-        print(tokens)
-    program = parse(tokens)
-    result = program.eval()
+    if args.profile:
+        # time every node with the tree engine and report on stderr
+        profiler = Profiler(program, positions)
+        with profiler:
+            result = session.run(program)
+    else:
+        result = parallel.run(session, program, args.jobs)
     if result is not None:
-        print(result)
+        print(backend.tolist(result))
+
+    if args.profile:
+        profiler.report(sys.stderr, args.top)
+        if args.folded:
+            with open(args.folded, 'w') as f:
+                profiler.write_folded(f)
 
     if args.ast:
         draw_tree(program, "ast")
@@ -54,10 +109,25 @@ def main():
     argp.add_argument('-f', '--file', type=str)
     argp.add_argument('--ast', action='store_true')
     argp.add_argument('--tokens', action='store_true')
+    argp.add_argument('--dis', action='store_true')
+    argp.add_argument('-e', '--engine', choices=list(ENGINES), default='tree')
+    argp.add_argument('-b', '--backend', choices=backend.BACKENDS, default='list')
+    argp.add_argument('-O', dest='optimize', action='store_true')
+    argp.add_argument('-j', '--jobs', type=int, default=1)
+    argp.add_argument('-s', '--stream', action='store_true')
+    argp.add_argument('--no-cache', dest='cache', action='store_false')
+    argp.add_argument('--cache-dir', type=str)
+    argp.add_argument('--profile', action='store_true')
+    argp.add_argument('--top', type=int, default=20)
+    argp.add_argument('--folded', type=str)
     args = argp.parse_args()
 
+    if args.profile and args.engine != 'tree':
+        argp.error('--profile needs the tree engine')
+
     try:
-        _main(args)
+        backend.set_backend(args.backend)
+        _main(Session(args.engine, args.optimize), args)
         return 0
     except ExprError as e:
         if TRACE:
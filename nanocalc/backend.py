@@ -0,0 +1,365 @@
+from .common import EvalError
+from array import array
+import math
+import operator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BACKENDS = ['list', 'numpy', 'array']
+
+INT64_MAX = 2**63 - 1
+
+# The Python type of the items of an array.array by typecode, or of a NumPy
+# array by dtype kind; an item of any other type does not fit.
+ITEM_TYPES = {'q': int, 'd': float, 'i': int, 'f': float, 'b': bool}
+
+# True when list and range values are arrays; checked on the hot path of
+# binop_reduce and friends, so it is a plain module attribute. The arrays are
+# NumPy arrays, or with typed set, array.array of int64 or float64.
+enabled = False
+typed = False
+
+if np is not None:
+    LIST_TYPES = (list, array, np.ndarray)
+    VALUE_TYPES = (list, array, np.ndarray, np.generic)
+
+    UFUNCS = {
+        math.sin: np.sin,
+        math.cos: np.cos,
+        math.tan: np.tan,
+        math.asin: np.arcsin,
+        math.acos: np.arccos,
+        math.atan: np.arctan,
+        math.sqrt: np.sqrt,
+        math.exp: np.exp,
+    }
+else:
+    LIST_TYPES = (list, array)
+    VALUE_TYPES = (list, array)
+
+    UFUNCS = {}
+
+
+def set_backend(name):
+    global enabled, typed
+
+    if name not in BACKENDS:
+        raise EvalError(f"unknown backend: {name}")
+
+    if name == 'numpy' and np is None:
+        raise EvalError("the numpy backend requires numpy to be installed")
+
+    enabled = name != 'list'
+    typed = name == 'array'
+
+
+def get_backend():
+    if typed:
+        return 'array'
+    return 'numpy' if enabled else 'list'
+
+
+def pack(values):
+    # A list of only ints or only floats as an array, which takes a quarter
+    # of the memory and hands its buffer to NumPy without a copy. Anything
+    # else, bools included, stays a list.
+    kinds = set(map(type, values))
+    if kinds == {int}:
+        try:
+            return array('q', values)
+        except OverflowError:
+            return values
+    if kinds == {float}:
+        return array('d', values)
+
+    return values
+
+
+def as_array(v):
+    # Numeric lists become arrays; anything else (strings, nested lists,
+    # nil) is left to the pure-Python path.
+    if typed:
+        if isinstance(v, array):
+            return v
+        v = pack(list(v))
+        return v if isinstance(v, array) else None
+
+    if isinstance(v, np.ndarray):
+        return v
+
+    a = np.asarray(v)
+    if a.ndim != 1 or a.dtype.kind not in 'biuf':
+        return None
+
+    return a
+
+
+def truth(v):
+    # bool(v) as the list backend has it: a NumPy array, which refuses to be
+    # one, is true when it is not empty, like a list
+    if np is not None and type(v) is np.ndarray:
+        return len(v) != 0
+
+    return bool(v)
+
+
+def items(v):
+    # what a for loop over v binds: Python numbers, not the NumPy scalars
+    # iterating an array gives
+    if np is not None and type(v) is np.ndarray:
+        return v.tolist()
+
+    return v
+
+
+def is_array(v):
+    return isinstance(v, LIST_TYPES)
+
+
+def binop(op, left, right):
+    if typed:
+        return typed_binop(op, left, right)
+
+    if is_array(left):
+        left = as_array(left)
+        if left is None:
+            return NotImplemented
+    if is_array(right):
+        right = as_array(right)
+        if right is None:
+            return NotImplemented
+
+    if is_array(left) and is_array(right) and len(left) != len(right):
+        raise EvalError('expected lists to have the same length')
+
+    if may_overflow(op, left, right):
+        return exact_binop(op, left, right)
+
+    try:
+        with np.errstate(divide='raise', invalid='raise'):
+            return op(left, right)
+    except FloatingPointError:
+        # a zero divisor, or a nan from inf - inf and the like; do as the
+        # list backend does, which raises or computes it with Python numbers
+        return exact_binop(op, left, right)
+    except (TypeError, ValueError, OverflowError):
+        return NotImplemented
+
+
+def magnitude(v):
+    # the largest absolute value of an int or an integer array, or None
+    if isinstance(v, np.ndarray):
+        if v.dtype.kind != 'i':
+            return None
+        return max(-int(v.min()), int(v.max())) if len(v) else 0
+    if isinstance(v, (int, np.integer)):
+        return abs(int(v))
+    return None
+
+
+BOUNDED_OPS = (operator.add, operator.sub, operator.mul, operator.pow)
+
+
+def may_overflow(op, left, right):
+    # NumPy integers wrap around where Python ints grow, so sums, products
+    # and powers are checked against bounds first
+    if op not in BOUNDED_OPS:
+        return False
+
+    a = magnitude(left)
+    b = magnitude(right)
+    if a is None or b is None:
+        return False
+
+    if op is operator.pow:
+        # a^b < 2^(bits(a)*b)
+        return b * a.bit_length() > 63
+    if op is operator.mul:
+        return a * b > INT64_MAX
+    return a + b > INT64_MAX
+
+
+def total(v):
+    # sum v, with Python ints where the sum could leave int64
+    a = magnitude(v)
+    if a is not None and a * len(v) > INT64_MAX:
+        return sum(v.tolist())
+
+    return item(v.sum())
+
+
+def product(v):
+    # the product of v, with Python ints where it could leave int64;
+    # |x1*...*xn| < 2^(bits(max |x|)*n)
+    a = magnitude(v)
+    if a is not None and a.bit_length() * len(v) > 63:
+        return math.prod(v.tolist())
+
+    return item(v.prod())
+
+
+def exact_binop(op, left, right):
+    # with Python numbers, as the list backend computes it; an array again
+    # if the result fits in one, else a list
+    result = typed_binop(op, tolist(left), tolist(right))
+    return np.array(result) if isinstance(result, array) else result
+
+
+def unop(op, right):
+    if typed:
+        return pack([op(x) for x in right])
+
+    right = as_array(right)
+    if right is None:
+        return NotImplemented
+
+    if right.dtype.kind == 'b':
+        # NumPy refuses to negate bools; Python makes ints of them
+        right = right.astype(np.int64)
+    elif right.dtype.kind == 'i' and magnitude(right) > INT64_MAX:
+        # -(-2^63) wraps around
+        return exact_unop(op, right)
+
+    return op(right)
+
+
+def exact_unop(op, right):
+    result = pack([op(x) for x in right.tolist()])
+    return np.array(result) if isinstance(result, array) else result
+
+
+def func(f, *args):
+    if typed:
+        return typed_func(f, *args)
+
+    ufunc = UFUNCS.get(f)
+    if ufunc is None or len(args) != 1:
+        return NotImplemented
+
+    (arg,) = args
+    arg = as_array(arg)
+    if arg is None:
+        return NotImplemented
+
+    return ufunc(arg)
+
+
+def index(var, idx):
+    N = len(var)
+    if typed:
+        if isinstance(idx, array):
+            return pack([var[(i - 1) % N] for i in idx])
+        return NotImplemented
+
+    if isinstance(idx, np.integer):
+        return item(var[(int(idx) - 1) % N])
+
+    if isinstance(idx, np.ndarray) and idx.dtype.kind in 'iu':
+        positions = (idx - 1) % N
+        if isinstance(var, np.ndarray):
+            return var[positions]
+        return [var[i] for i in positions]
+
+    return NotImplemented
+
+
+def range_array(left, right, step, type, values):
+    # values is the generator the list backend would return; the common
+    # shapes are rebuilt with arange, computing the same left + i*step values.
+    if typed:
+        return pack(list(values))
+
+    ints = isinstance(left, int) and isinstance(right, int)
+
+    if type == 'incr' and ints and isinstance(step, int):
+        return np.arange(left, right + 1, step)
+
+    if type == 'count' and (step == 'auto' or isinstance(step, int)):
+        if ints and step == 'auto':
+            return np.arange(left, right + 1)
+
+        count = 50 if step == 'auto' else step
+        if ints and right == left:
+            return np.full(count, left)
+        if ints and (right - left) % (count - 1) == 0:
+            return np.arange(left, right + 1, (right - left) // (count - 1))
+
+        return left + np.arange(count) * ((right - left) / (count - 1))
+
+    return np.array(list(values))
+
+
+def typed_binop(op, left, right):
+    if is_array(left) and is_array(right):
+        if len(left) != len(right):
+            raise EvalError('expected lists to have the same length')
+        return pack([op(x, y) for (x, y) in zip(left, right)])
+    elif is_array(left):
+        return pack([op(x, right) for x in left])
+
+    return pack([op(left, x) for x in right])
+
+
+def typed_func(f, *args):
+    lists = [i for i, a in enumerate(args) if is_array(a)]
+    if len(lists) == 1:
+        (k,) = lists
+        return pack([f(*args[:k], x, *args[k + 1 :]) for x in args[k]])
+
+    if len(lists) == len(args):
+        return pack([f(*a) for a in zip(*args)])
+
+    return NotImplemented
+
+
+def setitem(var, i, value):
+    # var[i] = value, stored as the list backend would. An array whose items
+    # have another type than value, which it would convert or reject, is
+    # copied to a list instead; that list is returned for the caller to use
+    # in place of var, else var itself.
+    #
+    # Neither kind of array can change its item type in place, so only the
+    # name assigned through sees the copy: other names bound to the same
+    # array, and lists or callers holding it, keep the array as it was. The
+    # list backend changes the one list all of them share.
+    if isinstance(var, array):
+        kind = ITEM_TYPES[var.typecode]
+    elif np is not None and isinstance(var, np.ndarray) and var.dtype.kind != 'O':
+        kind = ITEM_TYPES.get(var.dtype.kind)
+    else:
+        var[i] = value
+        return var
+    value = item(value)
+    if type(value) is kind and (
+        kind is not int or -INT64_MAX - 1 <= value <= INT64_MAX
+    ):
+        var[i] = value
+        return var
+
+    values = tolist(var)
+    values[i] = value
+    return values
+
+
+def item(v):
+    if np is not None and isinstance(v, np.generic):
+        return v.item()
+
+    return v
+
+
+def tolist(v):
+    # plain Python values all the way down, nested lists included
+    if isinstance(v, array):
+        return v.tolist()
+
+    if np is not None and isinstance(v, (np.ndarray, np.generic)):
+        return v.tolist()
+
+    if isinstance(v, list) and any(isinstance(x, VALUE_TYPES) for x in v):
+        return [tolist(x) for x in v]
+
+    return v
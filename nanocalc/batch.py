@@ -0,0 +1,187 @@
+from .common import EvalError
+from .expr import (
+    BINOPS,
+    LIST_TYPES,
+    PURE_FUNCTIONS,
+    Context,
+    binop_reduce,
+    func_reduce,
+    lookup,
+    reduce,
+    unop_reduce,
+    walk,
+)
+from . import backend
+import operator
+
+SCALARS = {int, float, bool, str}
+
+
+class Fallback(Exception):
+    pass
+
+
+def is_scalar(v):
+    return type(backend.item(v)) in SCALARS
+
+
+class Batch:
+    # One expression evaluated for every row of a set of columns. When it is
+    # elementwise - arithmetic, comparisons and calls on columns and scalars -
+    # it is evaluated once with whole columns as values, which binop_reduce,
+    # func_reduce and the numpy backend broadcast over. Anything else runs the
+    # compiled program once per row.
+    def __init__(self, session, program):
+        self.session = session
+        self.program = program
+        self.row = None
+
+        self.expr = program
+        if program.type == 'stmnts' and len(program.left) == 1:
+            self.expr = program.left[0]
+
+    def __call__(self, columns):
+        try:
+            return self.evaluate(columns)
+        finally:
+            self.session.flush()
+
+    def evaluate(self, columns):
+        columns, n = self.columns(columns)
+
+        if self.elementwise(self.expr, columns.keys()):
+            try:
+                result = self.column(self.expr, columns, n)
+            except Fallback:
+                return self.rows(columns, n)
+
+            if isinstance(result, LIST_TYPES):
+                return result
+            return [result] * n
+
+        return self.rows(columns, n)
+
+    def columns(self, columns):
+        n = None
+        values = {}
+        for name, value in columns.items():
+            if isinstance(value, (tuple, *LIST_TYPES)):
+                if n is not None and len(value) != n:
+                    raise EvalError("batch: columns have different lengths")
+                n = len(value)
+
+                if isinstance(value, tuple):
+                    value = list(value)
+                if backend.enabled:
+                    array = backend.as_array(value)
+                    value = value if array is None else array
+                else:
+                    value = backend.tolist(value)
+
+            values[name] = value
+
+        if n is None:
+            raise EvalError("batch: expected at least one column")
+
+        return values, n
+
+    def lookup(self, name):
+        return lookup(self.session.globals, name)
+
+    def elementwise(self, e, names):
+        t = e.type
+        if t is None:
+            return self.elementwise(e.left, names)
+        elif t == 'literal':
+            return True
+        elif t == 'var':
+            if e.right is not None:
+                return False
+            return e.left in names or is_scalar(self.lookup(e.left))
+        elif t == '-' and e.right is None:
+            return self.elementwise(e.left, names)
+        elif t in BINOPS:
+            return self.elementwise(e.left, names) and self.elementwise(e.right, names)
+        elif t == 'fcall':
+            if e.left in names or not callable(self.lookup(e.left)):
+                return False
+            return all(self.elementwise(a, names) for a in e.right)
+
+        return False
+
+    def direct(self, f, nargs, seen=()):
+        # whether f can take whole columns for its parameters: its body has to
+        # be elementwise in them, like the expression itself
+        fdef = getattr(f, 'fdef', None)
+        if fdef is None or f in seen:
+            return False
+
+        plist = fdef.left.right
+        if len(plist) != nargs or any(p.type != 'var' for p in plist):
+            return False
+
+        if not self.elementwise(fdef.right, {p.left for p in plist}):
+            return False
+
+        # the functions it calls get whole columns as well, and are not there
+        # to be checked by column, so they have to return columns of scalars
+        for e in walk(fdef.right):
+            if e.type == 'fcall':
+                g = self.lookup(e.left)
+                if g not in PURE_FUNCTIONS and not self.direct(
+                    g, len(e.right), seen + (f,)
+                ):
+                    return False
+
+        return True
+
+    def column(self, e, env, n):
+        t = e.type
+        if t is None:
+            return self.column(e.left, env, n)
+        elif t == 'literal':
+            return e.left
+        elif t == 'var':
+            return env[e.left] if e.left in env else self.lookup(e.left)
+        elif t == '-' and e.right is None:
+            return unop_reduce(operator.neg, None, self.column(e.left, env, n))
+        elif t in BINOPS:
+            left = self.column(e.left, env, n)
+            right = self.column(e.right, env, n)
+            return binop_reduce(BINOPS[t], None, left, right)
+
+        f = self.lookup(e.left)
+        args = [self.column(a, env, n) for a in e.right]
+        if self.direct(f, len(args)):
+            return f(*args)
+
+        # func_reduce maps over one or all list arguments, not some of them
+        count = sum(isinstance(a, LIST_TYPES) for a in args)
+        if 1 < count < len(args):
+            args = [a if isinstance(a, LIST_TYPES) else [a] * n for a in args]
+
+        result = reduce(func_reduce(f, None, *args))
+        if f not in PURE_FUNCTIONS and isinstance(result, LIST_TYPES):
+            # a function of a row that returns a list can not be used as a
+            # column by the operators around it
+            if not all(map(is_scalar, result)):
+                raise Fallback()
+
+        return result
+
+    def rows(self, columns, n):
+        if self.row is None:
+            self.row = self.session.compile(self.program)
+
+        names = list(columns)
+        values = [
+            columns[k] if isinstance(columns[k], LIST_TYPES) else [columns[k]] * n
+            for k in names
+        ]
+
+        results = []
+        for row in zip(*values):
+            d = dict(zip(names, map(backend.item, row)))
+            results.append(reduce(self.row(Context(d, self.session.globals))))
+
+        return results
@@ -0,0 +1,106 @@
+import contextlib
+import hashlib
+import os
+import re
+import tempfile
+
+from . import __version__
+from .common import FormatError
+from .expr import GLOBALS
+from .lexer import tokenize
+from .optimize import optimize
+from .parser import parse
+from .serialize import deserialize, serialize
+
+# Bump when Expr trees change shape between releases, so that old entries
+# are no longer found.
+FORMAT = 3
+
+# Entries kept per directory; the least recently used go first, which is also
+# where the entries of other nanocalc versions end up.
+MAX_ENTRIES = 256
+
+# The names cache_key gives entries; prune leaves everything else alone, since
+# the directory may be shared with other files.
+ENTRY_NAME = re.compile(r'[0-9a-f]{64}')
+
+
+def cache_dir():
+    if 'NANOCALC_CACHE_DIR' in os.environ:
+        return os.environ['NANOCALC_CACHE_DIR']
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(root, 'nanocalc')
+
+
+def cache_key(source):
+    h = hashlib.sha256(f'{__version__}:{FORMAT}:'.encode())
+    h.update(source.encode())
+    return h.hexdigest()
+
+
+def load(path):
+    try:
+        with open(path, 'rb') as f:
+            program = deserialize(f.read())
+    except (OSError, FormatError):
+        # missing, truncated or written by an incompatible nanocalc: parse
+        # again and let store replace it
+        return None
+
+    # mark the entry as used, for prune
+    with contextlib.suppress(OSError):
+        os.utime(path)
+    return program
+
+
+def store(path, program):
+    # write to a temporary file first so that concurrent runs never see a
+    # partial entry
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = serialize(program)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        prune(os.path.dirname(path), MAX_ENTRIES)
+    except OSError:
+        # an unwritable cache only costs the parse
+        pass
+
+
+def prune(directory, size):
+    entries = []
+    for entry in os.scandir(directory):
+        if not ENTRY_NAME.fullmatch(entry.name):
+            continue
+        try:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            entries.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            pass
+    entries.sort(reverse=True)
+    for _, path in entries[size:]:
+        try:
+            os.unlink(path)
+        except OSError:
+            # removed by a concurrent run
+            pass
+
+
+def load_program(source, optimized=False, directory=None, context=GLOBALS):
+    # only the parse is cached: the constant folding depends on the context
+    path = os.path.join(directory or cache_dir(), cache_key(source))
+    program = load(path)
+    if program is None:
+        program = parse(tokenize(source))
+        store(path, program)
+
+    if optimized:
+        program = optimize(program, context)
+    return program
@@ -0,0 +1,733 @@
+from .backend import items, truth
+from .common import EvalError
+from .expr import (
+    BINOPS,
+    COMPARISONS,
+    GLOBALS,
+    SCALARS,
+    SEQUENCE_TYPES,
+    TAIL_TYPES,
+    UNSET,
+    Context,
+    TailCall,
+    all_reduce,
+    assign_item,
+    binop_reduce,
+    func_reduce,
+    index_reduce,
+    command,
+    literal_list,
+    local_assignments,
+    range_reduce,
+    reduce,
+    slice_operands,
+    slice_reduce,
+    slice_view,
+    store_item,
+    tail_call,
+    tail_case,
+    trampoline,
+    unop_reduce,
+    walk,
+)
+from functools import lru_cache, partial
+import ast
+import builtins
+import operator
+import types
+
+AST_BINOPS = {
+    '+': ast.Add,
+    '-': ast.Sub,
+    '*': ast.Mult,
+    '/': ast.Div,
+    '^': ast.Pow,
+    '%': ast.Mod,
+    '<': ast.Lt,
+    '>': ast.Gt,
+    '<=': ast.LtE,
+    '>=': ast.GtE,
+    '==': ast.Eq,
+    '!=': ast.NotEq,
+}
+
+OP_NAMES = {op: f'__op{i}' for i, op in enumerate(BINOPS)}
+
+
+class Unlowerable(Exception):
+    pass
+
+
+def snapshot(d, parent):
+    return Context({k: v for k, v in d.items() if v is not UNSET}, parent=parent)
+
+
+def call_tree(fdef, context, *args):
+    plist = fdef.left.right
+    args = [a for a in args if a is not UNSET]
+    ctx = Context({p.left: a for p, a in zip(plist, args)}, parent=context)
+    return fdef.right._eval(ctx)
+
+
+def raise_error(message):
+    raise EvalError(message)
+
+
+RUNTIME = {
+    '__S': frozenset(SCALARS),
+    '__UNSET': UNSET,
+    '__Gen': types.GeneratorType,
+    '__SEQ': SEQUENCE_TYPES,
+    '__reduce': reduce,
+    '__truth': truth,
+    '__items': items,
+    '__command': command,
+    '__binop': binop_reduce,
+    '__unop': unop_reduce,
+    '__neg': operator.neg,
+    '__func_reduce': func_reduce,
+    '__index': index_reduce,
+    '__store_item': store_item,
+    '__assign_item': assign_item,
+    '__range': range_reduce,
+    '__slice': slice_reduce,
+    '__view': slice_view,
+    '__all': all_reduce,
+    '__snapshot': snapshot,
+    '__call_tree': call_tree,
+    '__TailCall': TailCall,
+    '__tail': tail_call,
+    '__trampoline': trampoline,
+    '__partial': partial,
+    '__raise': raise_error,
+} | {OP_NAMES[op]: f for op, f in BINOPS.items()}
+
+
+def name(id, ctx=ast.Load):
+    return ast.Name(id=id, ctx=ctx())
+
+
+def const(value):
+    return ast.Constant(value=value)
+
+
+def call(func, *args):
+    if isinstance(func, str):
+        func = name(func)
+    return ast.Call(func=func, args=list(args), keywords=[])
+
+
+def subscript(value, key, ctx=ast.Load):
+    return ast.Subscript(value=value, slice=const(key), ctx=ctx())
+
+
+def raise_error_stmt(message):
+    return ast.Expr(call('__raise', const(message)))
+
+
+def all_of(tests, op=ast.And):
+    if len(tests) == 1:
+        return tests[0]
+    return ast.BoolOp(op=op(), values=tests)
+
+
+def assign(target, value):
+    if isinstance(target, str):
+        target = name(target, ast.Store)
+    return ast.Assign(targets=[target], value=value)
+
+
+def is_(left, right, negate=False):
+    op = ast.IsNot() if negate else ast.Is()
+    return ast.Compare(left=left, ops=[op], comparators=[right])
+
+
+def is_scalar(value):
+    return ast.Compare(
+        left=call('type', value), ops=[ast.In()], comparators=[name('__S')]
+    )
+
+
+def binop(op, a, b, reduce='__binop'):
+    # Apply op directly when both operands are scalars, otherwise go through
+    # the broadcasting reduce function.
+    if op in COMPARISONS:
+        fast = ast.Compare(left=a, ops=[AST_BINOPS[op]()], comparators=[b])
+    else:
+        fast = ast.BinOp(left=a, op=AST_BINOPS[op](), right=b)
+
+    slow = call(reduce, name(OP_NAMES[op]), const(None), a, b)
+
+    constants = [v.value for v in (a, b) if isinstance(v, ast.Constant)]
+    if any(type(v) not in SCALARS for v in constants):
+        return slow
+
+    checks = [is_scalar(v) for v in (a, b) if not isinstance(v, ast.Constant)]
+    if not checks:
+        return fast
+
+    return ast.IfExp(test=all_of(checks), body=fast, orelse=slow)
+
+
+def arguments(params, defaults=(), vararg=None, kwonly=()):
+    return ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg(arg=p) for p in params],
+        vararg=vararg and ast.arg(arg=vararg),
+        kwonlyargs=[ast.arg(arg=k) for k, _ in kwonly],
+        kw_defaults=[const(v) for _, v in kwonly],
+        kwarg=None,
+        defaults=list(defaults),
+    )
+
+
+def function_def(fname, args, body):
+    func = ast.FunctionDef(
+        name=fname, args=args, body=body, decorator_list=[], returns=None
+    )
+    if 'type_params' in ast.FunctionDef._fields:
+        func.type_params = []
+    return func
+
+
+def assigns(e):
+    return any(n.type in ('=', 'for') for n in walk(e))
+
+
+class Scope:
+    def __init__(self, parent, id, params):
+        self.parent = parent
+        self.id = id
+        self.params = set(params)
+        self.names = {}
+        for p in params:
+            self.declare(p)
+
+    def declare(self, vname):
+        if vname not in self.names:
+            safe = vname.replace("'", '_').replace('.', '_')
+            self.names[vname] = f'_v{self.id}_{len(self.names)}_{safe}'
+        return self.names[vname]
+
+
+class Lowerer:
+    def __init__(self):
+        self.nodes = []
+        self.ntmp = 0
+        self.nscopes = 0
+        self.out = []
+        self.scope = None
+        self.definite = set()
+
+    def tmp(self):
+        self.ntmp += 1
+        return f'_t{self.ntmp}'
+
+    def emit(self, stmt):
+        self.out.append(stmt)
+
+    def node(self, obj):
+        self.nodes.append(obj)
+        return subscript(name('__nodes'), len(self.nodes) - 1)
+
+    def into_tmp(self, value):
+        t = self.tmp()
+        self.emit(assign(t, value))
+        return name(t)
+
+    def region(self, f, *args):
+        # Lower a conditionally executed part into its own statement list.
+        # Assignments made there do not count as definite afterwards.
+        out, definite = self.out, set(self.definite)
+        self.out = []
+        try:
+            f(*args)
+            return self.out or [ast.Pass()]
+        finally:
+            self.out, self.definite = out, definite
+
+    def is_tmp(self, value):
+        return isinstance(value, ast.Constant) or (
+            isinstance(value, ast.Name) and value.id.startswith('_t')
+        )
+
+    def operands(self, nodes):
+        values = []
+        for i, n in enumerate(nodes):
+            v = self.value(n)
+            if not self.is_tmp(v) and any(assigns(m) for m in nodes[i + 1 :]):
+                v = self.into_tmp(v)
+            values.append(v)
+        return values
+
+    def snapshot(self, scope):
+        if scope is None:
+            return name('__ctx')
+
+        keys = [const(k) for k in scope.names]
+        values = [name(v) for v in scope.names.values()]
+        parent = self.snapshot(scope.parent)
+        return call('__snapshot', ast.Dict(keys=keys, values=values), parent)
+
+    def read(self, vname, scope=None, local=True):
+        if local:
+            scope = self.scope
+
+        if scope is None:
+            return self.into_tmp(subscript(name('__ctx'), vname))
+
+        if vname not in scope.names:
+            return self.read(vname, scope.parent, local=False)
+
+        pyname = scope.names[vname]
+        if vname in scope.params or (local and pyname in self.definite):
+            return name(pyname)
+
+        t = self.tmp()
+        self.emit(assign(t, name(pyname)))
+        outer = self.region(
+            lambda: self.emit(assign(t, self.read(vname, scope.parent, local=False)))
+        )
+        self.emit(ast.If(test=is_(name(t), name('__UNSET')), body=outer, orelse=[]))
+        return name(t)
+
+    def write(self, vname, value):
+        if self.scope is None:
+            self.emit(assign(subscript(name('__ctx'), vname, ast.Store), value))
+            return
+
+        pyname = self.scope.names[vname]
+        self.emit(assign(pyname, value))
+        self.definite.add(pyname)
+
+    def value(self, e):
+        lower = getattr(self, LOWERERS.get(e.type, 'lower_unknown'))
+        return lower(e)
+
+    def lower_unknown(self, e):
+        self.emit(raise_error_stmt(f"unknown expression type: {e.type}"))
+        return const(None)
+
+    def body(self, e, tail):
+        # In the body of a function, a call in tail position gives a TailCall
+        # instead of calling, see Expr._tail.
+        if tail and e.type in TAIL_TYPES:
+            lower = getattr(self, LOWERERS[e.type])
+            return lower(e, tail=True)
+        return self.value(e)
+
+    def lower_passthrough(self, e, tail=False):
+        return self.body(e.left, tail)
+
+    def lower_stmnts(self, e, tail=False):
+        result = const(None)
+        for s in e.left[:-1]:
+            self.value(s)
+        if e.left:
+            result = self.body(e.left[-1], tail)
+        return result
+
+    def lower_literal(self, e):
+        return const(e.left)
+
+    def lower_binop(self, e):
+        if e.type == '-' and e.right is None:
+            return self.lower_neg(e)
+
+        a, b = self.operands([e.left, e.right])
+        return self.into_tmp(binop(e.type, a, b))
+
+    def lower_neg(self, e):
+        a = self.value(e.left)
+        fast = ast.UnaryOp(op=ast.USub(), operand=a)
+        slow = call('__unop', name('__neg'), const(None), a)
+        return self.into_tmp(ast.IfExp(test=is_scalar(a), body=fast, orelse=slow))
+
+    def lower_len(self, e):
+        return self.into_tmp(call('len', call('__reduce', self.value(e.left))))
+
+    def lower_not(self, e):
+        test = call('__truth', self.value(e.left))
+        return self.into_tmp(ast.UnaryOp(op=ast.Not(), operand=test))
+
+    def lower_and_or(self, e):
+        t = self.tmp()
+        self.emit(assign(t, self.value(e.left)))
+        body = self.region(lambda: self.emit(assign(t, self.value(e.right))))
+        test = call('__truth', name(t))
+        if e.type == 'or':
+            test = ast.UnaryOp(op=ast.Not(), operand=test)
+        self.emit(ast.If(test=test, body=body, orelse=[]))
+        return name(t)
+
+    def lower_list(self, e):
+        # generators from ranges and elementwise operators become lists, as
+        # every element of a list is read more than once
+        values = [
+            v if x.type == 'literal' else call('__reduce', v)
+            for x, v in zip(e.left, self.operands(e.left))
+        ]
+        return self.into_tmp(ast.List(elts=values, ctx=ast.Load()))
+
+    def lower_var(self, e):
+        return self.read(e.left)
+
+    def lower_assign(self, e):
+        v = self.value(e.right)
+        value = ast.IfExp(
+            test=is_(call('type', v), name('__Gen')), body=call('list', v), orelse=v
+        )
+        if e.right.type == 'literal':
+            value = v
+
+        t = self.into_tmp(value)
+        self.write(e.left.left, t)
+        return t
+
+    def lower_fcall(self, e, tail=False):
+        f = self.read(e.left)
+        if not self.is_tmp(f) and e.right and any(assigns(a) for a in e.right):
+            f = self.into_tmp(f)
+
+        args = []
+        for a in self.operands(e.right):
+            if isinstance(a, ast.Constant):
+                args.append(a)
+                continue
+            if not self.is_tmp(a):
+                a = self.into_tmp(a)
+            args.append(a)
+
+        fast = call(f, *args)
+        if tail:
+            fast = call('__tail', f, ast.List(elts=args, ctx=ast.Load()))
+        lists = [
+            call('isinstance', a, name('__SEQ'))
+            for a in args
+            if isinstance(a, ast.Name)
+        ]
+        if not lists:
+            return self.into_tmp(fast)
+
+        slow = call('__func_reduce', f, const(None), *args)
+        test = all_of(lists, ast.Or)
+        return self.into_tmp(ast.IfExp(test=test, body=slow, orelse=fast))
+
+    def lower_cmd(self, e):
+        if self.scope is not None:
+            for arg in e.right:
+                if any(n.type in ('=', 'for', 'fdef') for n in walk(arg)):
+                    raise Unlowerable('assignment in command arguments')
+
+        context = self.into_tmp(self.snapshot(self.scope))
+        cmd = call('__command', context, const(e.left))
+        args = ast.Starred(value=self.node(tuple(e.right)), ctx=ast.Load())
+        return self.into_tmp(call(cmd, context, args))
+
+    def lower_range(self, e):
+        if isinstance(e.left, list):
+            left, right = e.left
+            step, type = e.right
+            nodes = [step, left]
+        else:
+            left, right = e.left, e.right
+            type = 'count'
+            nodes = [left]
+
+        infinite = right.type == 'Inf'
+        if not infinite:
+            nodes.append(right)
+
+        values = self.operands(nodes)
+        if len(nodes) == 1 or (len(nodes) == 2 and not infinite):
+            values.insert(0, const('auto'))
+        if infinite:
+            values.append(const(None))
+
+        step, left, right = values
+        return self.into_tmp(
+            call('__range', left, right, step, const(type), const(infinite))
+        )
+
+    def lower_if(self, e, tail=False):
+        t = self.tmp()
+        cond = e.right
+        values = None
+        if cond.type in COMPARISONS:
+            values = literal_list(cond.right)
+
+        if values is not None:
+            # a slice compared with a literal is read in place, see View
+            if cond.left.type == 'idx':
+                a = self.lower_idx(cond.left, '__view')
+            else:
+                a = self.value(cond.left)
+            op = name(OP_NAMES[cond.type])
+            test = call('__all', op, const(None), a, const(values))
+        elif cond.type in COMPARISONS:
+            a, b = self.operands([cond.left, cond.right])
+            test = binop(cond.type, a, b, reduce='__all')
+        else:
+            c = self.value(cond)
+            lists = call('isinstance', c, name('__SEQ'))
+            test = ast.IfExp(test=lists, body=call('all', c), orelse=c)
+        body = self.region(lambda: self.emit(assign(t, self.body(e.left, tail))))
+        self.emit(ast.If(test=test, body=body, orelse=[assign(t, const(None))]))
+        return name(t)
+
+    def lower_cases(self, e, tail=False):
+        t = self.tmp()
+        k = tail_case(e.left) if tail and e.left else None
+
+        def keep_nil(nils):
+            # a tail call is made here after all if nil has been assigned
+            tests = [is_(self.value(x), const(None), negate=True) for x in nils]
+            call_now = [assign(t, call('__trampoline', name(t)))]
+            self.emit(ast.If(test=all_of(tests, ast.Or), body=call_now, orelse=[]))
+
+        def lower_case(cases, i):
+            if i == k:
+                self.emit(assign(t, self.body(cases[0], tail)))
+                if len(cases) > 1:
+                    pending = is_(call('type', name(t)), name('__TailCall'))
+                    check = self.region(keep_nil, cases[1:])
+                    self.emit(ast.If(test=pending, body=check, orelse=[]))
+            else:
+                self.emit(assign(t, self.value(cases[0])))
+            if len(cases) > 1:
+                rest = self.region(lower_case, cases[1:], i + 1)
+                self.emit(ast.If(test=is_(name(t), const(None)), body=rest, orelse=[]))
+
+        if e.left:
+            lower_case(e.left, 0)
+        else:
+            self.emit(assign(t, const(None)))
+        return name(t)
+
+    def lower_idx(self, e, slice='__slice'):
+        idx = e.right
+        bounds = slice_operands(idx) if idx.type == 'range' else None
+        if bounds is not None:
+            lo, hi, step = bounds
+            if step is None:
+                a, b = self.operands([lo, hi])
+                args = [a, b]
+            else:
+                s, a, b = self.operands([step, lo, hi])
+                args = [a, b, s]
+            var = self.read(e.left)
+            return self.into_tmp(call(slice, var, *args))
+
+        i = self.value(idx)
+        var = self.read(e.left)
+        return self.into_tmp(call('__index', var, i))
+
+    def lower_assign_item(self, e):
+        vname = e.left.left
+        i, v = self.operands([e.left.right, e.right])
+        var = self.read(vname)
+
+        scope = self.scope
+        while scope is not None and vname not in scope.names:
+            scope = scope.parent
+        if scope is None:
+            args = [name('__ctx'), const(vname), var, i, v]
+            self.emit(ast.Expr(call('__assign_item', *args)))
+            return v
+
+        # the list an array backend may store in instead of var is assigned
+        # to the local; a name that is unset here or belongs to an enclosing
+        # function is left to the tree walker
+        pyname = scope.names[vname]
+        definite = vname in scope.params or pyname in self.definite
+        if scope is not self.scope or not definite:
+            raise Unlowerable('item assignment to an outer or unset local')
+
+        self.emit(assign(pyname, call('__store_item', var, i, v)))
+        return v
+
+    def lower_lchain(self, e):
+        t = self.tmp()
+        self.emit(assign(t, const(True)))
+
+        left = self.value(e.left)
+        if not self.is_tmp(left):
+            left = self.into_tmp(left)
+
+        for rhs in e.right:
+            right = self.into_tmp(call('__reduce', self.value(rhs.left)))
+            cmp = binop(rhs.type, left, right)
+            test = call('__truth', name(t))
+            self.emit(assign(t, ast.IfExp(test=test, body=cmp, orelse=name(t))))
+            left = right
+
+        return name(t)
+
+    def lower_for(self, e):
+        var, expr = e.left
+        values = self.value(expr)
+
+        def lower_body():
+            if self.scope is None:
+                self.write(var.left, name(target.id))
+            else:
+                self.definite.add(target.id)
+            self.value(e.right)
+
+        if self.scope is None:
+            target = name(self.tmp(), ast.Store)
+        else:
+            target = name(self.scope.names[var.left], ast.Store)
+
+        body = self.region(lower_body)
+        values = call('__items', values)
+        self.emit(ast.For(target=target, iter=values, body=body, orelse=[]))
+        return const(None)
+
+    def lower_inf(self, e):
+        self.emit(raise_error_stmt('cannot evaluate Inf in this context'))
+        return const(None)
+
+    def lower_fdef(self, e):
+        fname = e.left.left
+        plist = e.left.right
+
+        if not all(map(lambda p: p.type == 'var', plist)):
+            self.emit(raise_error_stmt("expected parameter names"))
+            return const(None)
+
+        try:
+            func = self.lower_function(e, [p.left for p in plist])
+        except Unlowerable:
+            if self.scope is not None:
+                raise
+            fallback = ast.Attribute(value=self.node(e), attr='_eval', ctx=ast.Load())
+            self.emit(ast.Expr(call(fallback, name('__ctx'))))
+            return const(None)
+
+        self.emit(func)
+        fdef = ast.Attribute(value=name(func.name), attr='fdef', ctx=ast.Store())
+        self.emit(ast.Assign(targets=[fdef], value=self.node(e)))
+        enter = ast.Attribute(value=name(func.name), attr='enter', ctx=ast.Store())
+        keyword = ast.keyword(arg='_enter', value=const(True))
+        value = ast.Call(
+            func=name('__partial'), args=[name(func.name)], keywords=[keyword]
+        )
+        self.emit(ast.Assign(targets=[enter], value=value))
+        globals = ast.Attribute(value=name('__ctx'), attr='_globals', ctx=ast.Load())
+        key = subscript(globals, fname, ast.Store)
+        self.emit(assign(key, name(func.name)))
+        return const(None)
+
+    def lower_function(self, e, pnames):
+        state = self.out, self.scope, self.definite
+
+        self.nscopes += 1
+        scope = Scope(self.scope, self.nscopes, pnames)
+        for n in local_assignments(e.right):
+            scope.declare(n)
+
+        self.out = []
+        self.scope = scope
+        self.definite = set()
+        try:
+            params = [scope.names[p] for p in pnames]
+            if params:
+                # called with too few arguments: missing parameters are looked
+                # up in the enclosing scope, which only the tree walker does
+                fallback = call(
+                    '__call_tree',
+                    self.node(e),
+                    self.snapshot(scope.parent),
+                    *[name(p) for p in params],
+                )
+                missing = is_(name(params[-1]), name('__UNSET'))
+                body = [ast.Return(value=fallback)]
+                self.emit(ast.If(test=missing, body=body, orelse=[]))
+
+            for vname, pyname in scope.names.items():
+                if vname not in scope.params:
+                    self.emit(assign(pyname, name('__UNSET')))
+
+            # called as enter, the function returns the call it ends in
+            result = self.body(e.right, True)
+            if not isinstance(result, ast.Constant):
+                pending = is_(call('type', result), name('__TailCall'))
+                called = ast.UnaryOp(op=ast.Not(), operand=name('_enter'))
+                result = ast.IfExp(
+                    test=all_of([pending, called]),
+                    body=call('__trampoline', result),
+                    orelse=result,
+                )
+            self.emit(ast.Return(value=result))
+
+            defaults = [name('__UNSET') for _ in params]
+            args = arguments(params, defaults, '_extra', [('_enter', False)])
+            safe = e.left.left.replace("'", '_')
+            return function_def(f'_f{scope.id}_{safe}', args, self.out)
+        finally:
+            self.out, self.scope, self.definite = state
+
+    def lower_program(self, program):
+        self.out = []
+        result = self.value(program)
+        self.emit(ast.Return(value=result))
+
+        func = function_def('__program', arguments(['__ctx']), self.out)
+        module = ast.Module(body=[func], type_ignores=[])
+        return ast.fix_missing_locations(module)
+
+
+LOWERERS = {
+    None: 'lower_passthrough',
+    'stmnts': 'lower_stmnts',
+    'block': 'lower_stmnts',
+    'literal': 'lower_literal',
+    '#': 'lower_len',
+    'not': 'lower_not',
+    'and': 'lower_and_or',
+    'or': 'lower_and_or',
+    'list': 'lower_list',
+    'var': 'lower_var',
+    '=': 'lower_assign',
+    'fcall': 'lower_fcall',
+    'fdef': 'lower_fdef',
+    'cmd': 'lower_cmd',
+    'range': 'lower_range',
+    'if': 'lower_if',
+    'cases': 'lower_cases',
+    'idx': 'lower_idx',
+    'assign_item': 'lower_assign_item',
+    'lchain': 'lower_lchain',
+    'for': 'lower_for',
+    'Inf': 'lower_inf',
+} | {op: 'lower_binop' for op in BINOPS}
+
+
+@lru_cache(maxsize=128)
+def compile_source(source):
+    return builtins.compile(source, '<nanocalc>', 'exec')
+
+
+def lower(program):
+    lowerer = Lowerer()
+    module = lowerer.lower_program(program)
+    return module, lowerer.nodes
+
+
+def compile_python(program):
+    module, nodes = lower(program)
+    try:
+        code = compile_source(ast.unparse(module))
+    except (SyntaxError, RecursionError):
+        # too deeply nested for CPython's compiler, keep walking the tree
+        return program.eval
+
+    namespace = dict(RUNTIME, __nodes=nodes)
+    exec(code, namespace)
+    func = namespace['__program']
+
+    def run(context=GLOBALS):
+        return func(context)
+
+    return run
@@ -40,3 +40,7 @@ class ParseError(ExprError):
 
 class EvalError(ExprError):
     pass
+
+
+class FormatError(ExprError):
+    pass
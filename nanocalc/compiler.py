@@ -0,0 +1,741 @@
+from .backend import items, truth
+from .common import EvalError
+from .expr import (
+    BINOPS,
+    COMPARISONS,
+    FLAT_TYPES,
+    GLOBALS,
+    SCALARS,
+    SEQUENCE_TYPES,
+    TAIL_TYPES,
+    UNSET,
+    TailCall,
+    all_reduce,
+    assign_item,
+    binop_reduce,
+    command,
+    func_reduce,
+    index_reduce,
+    local_assignments,
+    literal_list,
+    range_reduce,
+    reduce,
+    slice_operands,
+    slice_reduce,
+    slice_view,
+    tail_call,
+    tail_case,
+    trampoline,
+    unop_reduce,
+)
+import operator
+import types
+
+
+class Thunk:
+    # Commands receive their arguments unevaluated and call arg.eval(context),
+    # so compiled arguments are wrapped to look like an Expr.
+    __slots__ = ('eval', 'expr')
+
+    def __init__(self, code, expr):
+        self.eval = code
+        self.expr = expr
+
+
+class Scope:
+    # Frame layout of a function: parameters first, then the other names the
+    # body assigns to. Everything else belongs to an enclosing scope.
+    def __init__(self, names, parent=None):
+        self.slots = {}
+        for name in names:
+            self.slots.setdefault(name, len(self.slots))
+        self.parent = parent
+        self.depth = 1 if parent is None else parent.depth + 1
+
+    def resolve(self, name):
+        # (number of frames to go up, slot index); the index is None for
+        # names that are only found in the top-level context
+        scope = self
+        up = 0
+        while scope is not None:
+            if name in scope.slots:
+                return up, scope.slots[name]
+            scope = scope.parent
+            up += 1
+
+        return up, None
+
+
+class Frame:
+    # The context of a function call: a fixed size list of locals instead of
+    # a dict. _d and _parent mimic Context, so commands like dump still work,
+    # and _root is the top-level context that globals are read from.
+    __slots__ = ('_slots', '_scope', '_parent', '_root')
+
+    _ro = False
+
+    def __init__(self, slots, scope, parent, root):
+        self._slots = slots
+        self._scope = scope
+        self._parent = parent
+        self._root = root
+
+    @property
+    def _d(self):
+        items = self._scope.slots.items()
+        return {k: self._slots[i] for k, i in items if self._slots[i] is not UNSET}
+
+    @property
+    def _globals(self):
+        return self._root._globals
+
+    @property
+    def _commands(self):
+        return self._root._commands
+
+    @property
+    def _output(self):
+        return self._root._output
+
+    def __getitem__(self, key):
+        i = self._scope.slots.get(key)
+        if i is not None and self._slots[i] is not UNSET:
+            return self._slots[i]
+
+        return self._parent[key]
+
+    def __setitem__(self, key, value):
+        i = self._scope.slots.get(key)
+        if i is None:
+            raise EvalError(f"{key} is not a local variable")
+
+        self._slots[i] = value
+
+    def _rebind(self, key, value):
+        i = self._scope.slots.get(key)
+        if i is not None and self._slots[i] is not UNSET:
+            self._slots[i] = value
+        else:
+            self._parent._rebind(key, value)
+
+    def __str__(self):
+        return str(self._d)
+
+
+def compile_read(scope, vname):
+    if scope is None:
+
+        def f(context):
+            return context[vname]
+
+        return f
+
+    up, i = scope.resolve(vname)
+
+    if i is None:
+        # a global or builtin: skip the frames and ask the top-level context
+
+        def f(context):
+            return context._root[vname]
+
+        return f
+
+    if up == 0:
+
+        def f(context):
+            value = context._slots[i]
+            if value is UNSET:
+                return context._parent[vname]
+            return value
+
+        return f
+
+    if up == 1:
+
+        def f(context):
+            context = context._parent
+            value = context._slots[i]
+            if value is UNSET:
+                return context._parent[vname]
+            return value
+
+        return f
+
+    def f(context):
+        for _ in range(up):
+            context = context._parent
+        value = context._slots[i]
+        if value is UNSET:
+            return context._parent[vname]
+        return value
+
+    return f
+
+
+def compile_write(scope, vname):
+    if scope is None:
+
+        def f(context, value):
+            context[vname] = value
+
+        return f
+
+    # every name a function assigns to is one of its own slots
+    i = scope.slots[vname]
+
+    def f(context, value):
+        context._slots[i] = value
+
+    return f
+
+
+def compile_error(message):
+    def f(context):
+        raise EvalError(message)
+
+    return f
+
+
+def compile_passthrough(e, scope, tail=False):
+    return compile_body(e.left, scope, tail)
+
+
+def compile_stmnts(e, scope, tail=False):
+    stmnts = [compile_expr(s, scope) for s in e.left[:-1]]
+    if e.left:
+        stmnts.append(compile_body(e.left[-1], scope, tail))
+
+    if len(stmnts) == 1:
+        return stmnts[0]
+
+    def f(context):
+        result = None
+        for s in stmnts:
+            result = s(context)
+        return result
+
+    return f
+
+
+def compile_literal(e, scope):
+    value = e.left
+
+    def f(context):
+        return value
+
+    return f
+
+
+def compile_minus(e, scope):
+    if e.right is not None:
+        return compile_binop(e, scope)
+
+    right = compile_expr(e.left, scope)
+
+    def f(context):
+        x = right(context)
+        if type(x) in SCALARS:
+            return -x
+        return unop_reduce(operator.neg, context, x)
+
+    return f
+
+
+def compile_binop(e, scope):
+    op = BINOPS[e.type]
+    left = compile_expr(e.left, scope)
+
+    if e.right.type == 'literal' and type(e.right.left) in SCALARS:
+        y = e.right.left
+
+        def f(context):
+            x = left(context)
+            if type(x) in SCALARS:
+                return op(x, y)
+            return binop_reduce(op, context, x, y)
+
+        return f
+
+    right = compile_expr(e.right, scope)
+
+    def f(context):
+        x = left(context)
+        y = right(context)
+        if type(x) in SCALARS and type(y) in SCALARS:
+            return op(x, y)
+        return binop_reduce(op, context, x, y)
+
+    return f
+
+
+def compile_len(e, scope):
+    left = compile_expr(e.left, scope)
+
+    def f(context):
+        return len(reduce(left(context)))
+
+    return f
+
+
+def compile_fcall(e, scope, tail=False):
+    read = compile_read(scope, e.left)
+    params = [compile_expr(p, scope) for p in e.right]
+
+    if tail:
+
+        def f(context):
+            func = read(context)
+            args = [p(context) for p in params]
+            for x in args:
+                if isinstance(x, SEQUENCE_TYPES):
+                    return func_reduce(func, context, *args)
+            return tail_call(func, args)
+
+        return f
+
+    if len(params) == 1:
+        (param,) = params
+
+        def f(context):
+            func = read(context)
+            x = param(context)
+            if isinstance(x, SEQUENCE_TYPES):
+                return func_reduce(func, context, x)
+            return func(x)
+
+        return f
+
+    def f(context):
+        func = read(context)
+        args = [p(context) for p in params]
+        for x in args:
+            if isinstance(x, SEQUENCE_TYPES):
+                return func_reduce(func, context, *args)
+        return func(*args)
+
+    return f
+
+
+def compile_var(e, scope):
+    return compile_read(scope, e.left)
+
+
+def compile_assign(e, scope):
+    write = compile_write(scope, e.left.left)
+    right = compile_expr(e.right, scope)
+
+    def f(context):
+        value = right(context)
+
+        if isinstance(value, types.GeneratorType):
+            value = list(value)
+
+        write(context, value)
+        return value
+
+    return f
+
+
+def compile_fdef(e, scope):
+    fname = e.left.left
+    plist = e.left.right
+
+    if not all(map(lambda p: p.type == 'var', plist)):
+        return compile_error("expected parameter names")
+
+    nparams = len(plist)
+    inner = Scope([p.left for p in plist] + local_assignments(e.right), scope)
+    body = compile_body(e.right, inner, tail=True)
+
+    # missing arguments stay UNSET and are looked up outside, like a miss in
+    # the Context the tree walker builds
+    unset = [UNSET] * len(inner.slots)
+    rest = unset[1:]
+
+    def f(context):
+        root = context._root if scope is not None else context
+
+        # enter runs the body and returns the call it ends in, if any, while
+        # func makes that call too
+        if nparams == 1:
+
+            def enter(x=UNSET, *args):
+                return body(Frame([x, *rest], inner, context, root))
+
+            def func(x=UNSET, *args):
+                result = body(Frame([x, *rest], inner, context, root))
+                if type(result) is TailCall:
+                    result = trampoline(result)
+                return result
+
+        else:
+
+            def enter(*args):
+                slots = list(args[:nparams])
+                slots += unset[len(slots) :]
+                return body(Frame(slots, inner, context, root))
+
+            def func(*args):
+                slots = list(args[:nparams])
+                slots += unset[len(slots) :]
+                result = body(Frame(slots, inner, context, root))
+                if type(result) is TailCall:
+                    result = trampoline(result)
+                return result
+
+        func.fdef = e
+        func.enter = enter
+        root._globals[fname] = func
+
+        return None
+
+    return f
+
+
+def compile_cmd(e, scope):
+    cname = e.left
+    params = [Thunk(compile_expr(p, scope), p) for p in e.right]
+
+    def f(context):
+        return command(context, cname)(context, *params)
+
+    return f
+
+
+def compile_range(e, scope):
+    if isinstance(e.left, list):
+        left = compile_expr(e.left[0], scope)
+        right = e.left[1]
+        step = compile_expr(e.right[0], scope)
+        type = e.right[1]
+    else:
+        left = compile_expr(e.left, scope)
+        right = e.right
+        step = None
+        type = 'count'
+
+    if right.type == 'Inf':
+
+        def f(context):
+            s = 'auto' if step is None else step(context)
+            return range_reduce(left(context), None, s, type, infinite=True)
+
+        return f
+
+    right = compile_expr(right, scope)
+
+    def f(context):
+        s = 'auto' if step is None else step(context)
+        return range_reduce(left(context), right(context), s, type)
+
+    return f
+
+
+def compile_list(e, scope):
+    if all(x.type == 'literal' for x in e.left):
+        values = tuple(x.left for x in e.left)
+
+        def f(context):
+            return list(values)
+
+        return f
+
+    items = [compile_expr(x, scope) for x in e.left]
+
+    def f(context):
+        return [reduce(x(context)) for x in items]
+
+    return f
+
+
+def compile_if(e, scope, tail=False):
+    left = compile_body(e.left, scope, tail)
+
+    if e.right.type in COMPARISONS:
+        return compile_if_compare(e, scope, left)
+
+    right = compile_expr(e.right, scope)
+
+    def f(context):
+        cond = right(context)
+
+        if isinstance(cond, SEQUENCE_TYPES):
+            if all(cond):
+                return left(context)
+            return None
+
+        if cond:
+            return left(context)
+
+        return None
+
+    return f
+
+
+def compile_if_compare(e, scope, left):
+    op = BINOPS[e.right.type]
+    rhs = e.right.right
+    values = literal_list(rhs)
+
+    if values is not None:
+        # a slice compared with a literal is read in place, see View
+        x = None
+        if e.right.left.type == 'idx':
+            x = compile_idx(e.right.left, scope, slice_view)
+        if x is None:
+            x = compile_expr(e.right.left, scope)
+
+        def f(context):
+            a = x(context)
+
+            if type(a) in FLAT_TYPES and len(a) == len(values):
+                cond = all(map(op, a, values))
+            else:
+                cond = all_reduce(op, context, a, values)
+
+            if cond:
+                return left(context)
+
+            return None
+
+        return f
+
+    x = compile_expr(e.right.left, scope)
+    y = compile_expr(rhs, scope)
+
+    def f(context):
+        a = x(context)
+        b = y(context)
+
+        if all_reduce(op, context, a, b):
+            return left(context)
+
+        return None
+
+    return f
+
+
+def compile_cases(e, scope, tail=False):
+    cases = [compile_expr(x, scope) for x in e.left]
+
+    if tail and cases:
+        k = tail_case(e.left)
+        cases[k] = compile_body(e.left[k], scope, tail)
+        first, last, nils = cases[:k], cases[k], cases[k + 1 :]
+
+        def f(context):
+            for x in first:
+                result = x(context)
+                if result is not None:
+                    return result
+
+            result = last(context)
+            if type(result) is TailCall:
+                if all(x(context) is None for x in nils):
+                    return result
+                result = trampoline(result)
+            if result is not None:
+                return result
+
+            for x in nils:
+                result = x(context)
+                if result is not None:
+                    return result
+
+            return None
+
+        return f
+
+    def f(context):
+        for x in cases:
+            result = x(context)
+            if result is not None:
+                return result
+
+        return None
+
+    return f
+
+
+def compile_or(e, scope):
+    left = compile_expr(e.left, scope)
+    right = compile_expr(e.right, scope)
+
+    def f(context):
+        value = left(context)
+        return value if truth(value) else right(context)
+
+    return f
+
+
+def compile_and(e, scope):
+    left = compile_expr(e.left, scope)
+    right = compile_expr(e.right, scope)
+
+    def f(context):
+        value = left(context)
+        return right(context) if truth(value) else value
+
+    return f
+
+
+def compile_not(e, scope):
+    left = compile_expr(e.left, scope)
+
+    def f(context):
+        return not truth(left(context))
+
+    return f
+
+
+def compile_idx(e, scope, slice=None):
+    read = compile_read(scope, e.left)
+    idx = e.right
+
+    # var[a..b] is by far the most common slice; index it directly instead of
+    # going through a range generator. With slice given, only slices are
+    # compiled, and None is returned for anything else.
+    bounds = slice_operands(idx) if idx.type == 'range' else None
+    if bounds is not None:
+        lo, hi, step = bounds
+        lo = compile_expr(lo, scope)
+        hi = compile_expr(hi, scope)
+        slice = slice or slice_reduce
+
+        if step is None:
+
+            def f(context):
+                a = lo(context)
+                b = hi(context)
+                return slice(read(context), a, b)
+
+        else:
+            step = compile_expr(step, scope)
+
+            def f(context):
+                s = step(context)
+                a = lo(context)
+                b = hi(context)
+                return slice(read(context), a, b, s)
+
+        return f
+
+    if slice is not None:
+        return None
+
+    idx = compile_expr(idx, scope)
+
+    def f(context):
+        i = idx(context)
+        return index_reduce(read(context), i)
+
+    return f
+
+
+def compile_assign_item(e, scope):
+    vname = e.left.left
+    read = compile_read(scope, vname)
+    idx = compile_expr(e.left.right, scope)
+    right = compile_expr(e.right, scope)
+
+    def f(context):
+        i = idx(context)
+        value = right(context)
+
+        assign_item(context, vname, read(context), i, value)
+
+        return value
+
+    return f
+
+
+def compile_lchain(e, scope):
+    lhs = compile_expr(e.left, scope)
+    rhs = [(BINOPS[r.type], compile_expr(r.left, scope)) for r in e.right]
+
+    def f(context):
+        result = True
+
+        left = lhs(context)
+        for op, r in rhs:
+            right = reduce(r(context))
+            if truth(result):
+                result = binop_reduce(op, context, left, right)
+            left = right
+
+        return result
+
+    return f
+
+
+def compile_for(e, scope):
+    var, expr = e.left
+    write = compile_write(scope, var.left)
+    values = compile_expr(expr, scope)
+    body = compile_expr(e.right, scope)
+
+    def f(context):
+        for value in items(values(context)):
+            write(context, value)
+            body(context)
+
+        return None
+
+    return f
+
+
+def compile_inf(e, scope):
+    return compile_error('cannot evaluate Inf in this context')
+
+
+COMPILERS = {
+    None: compile_passthrough,
+    'stmnts': compile_stmnts,
+    'block': compile_stmnts,
+    'literal': compile_literal,
+    '-': compile_minus,
+    '#': compile_len,
+    'fcall': compile_fcall,
+    'var': compile_var,
+    '=': compile_assign,
+    'fdef': compile_fdef,
+    'cmd': compile_cmd,
+    'range': compile_range,
+    'list': compile_list,
+    'if': compile_if,
+    'cases': compile_cases,
+    'or': compile_or,
+    'and': compile_and,
+    'not': compile_not,
+    'idx': compile_idx,
+    'assign_item': compile_assign_item,
+    'lchain': compile_lchain,
+    'for': compile_for,
+    'Inf': compile_inf,
+} | {op: compile_binop for op in BINOPS if op != '-'}
+
+
+def compile_expr(e, scope):
+    compiler = COMPILERS.get(e.type)
+    if compiler is None:
+        return compile_error(f"unknown expression type: {e.type}")
+
+    return compiler(e, scope)
+
+
+def compile_body(e, scope, tail):
+    # In the body of a function, a call in tail position returns a TailCall
+    # instead of calling, see Expr._tail.
+    if tail and e.type in TAIL_TYPES:
+        return COMPILERS[e.type](e, scope, tail=True)
+
+    return compile_expr(e, scope)
+
+
+def compile(program):
+    code = compile_expr(program, None)
+
+    def run(context=GLOBALS):
+        return code(context)
+
+    return run
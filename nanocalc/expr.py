@@ -1,5 +1,12 @@
 from .common import EvalError, trace
+from .backend import LIST_TYPES, truth
+from .output import Output
+from . import backend
+from array import array
+import copy
+import functools
 import subprocess
+import operator
 import math
 import types
 
@@ -31,7 +38,7 @@ def _table(context, *args):
     cols = []
     rows = 0
     for a in args:
-        y = reduce(a.eval(context))
+        y = backend.tolist(reduce(a.eval(context)))
         if isinstance(y, list):
             cols.append(y)
         else:
@@ -47,8 +54,9 @@ def _table(context, *args):
         if len(c) < rows:
             cols[i] = [c[0]] * rows
 
-    for row in zip(*cols):
-        print(*row)
+    lines = [' '.join(map(str, row)) for row in zip(*cols)]
+    if lines:
+        context._output.write('\n'.join(lines) + '\n')
 
 
 def reduce(v):
@@ -59,17 +67,30 @@ def reduce(v):
 
 
 def _print(context, *args):
-    p = [reduce(a.eval(context)) for a in args]
-    print(*p)
+    p = [backend.tolist(reduce(a.eval(context))) for a in args]
+    context._output.write(' '.join(map(str, p)) + '\n')
+
+
+@functools.lru_cache(maxsize=1024)
+def _unescape(s):
+    return s.encode().decode('unicode_escape')
+
+
+def unescape(s):
+    # most pieces have nothing to decode; the rest repeat, like a "\n"
+    if '\\' in s or not s.isascii():
+        return _unescape(s)
+    return s
 
 
 def _write(context, *args):
-    p = [reduce(a.eval(context)) for a in args]
+    p = [backend.tolist(reduce(a.eval(context))) for a in args]
     nargs = normalize_args(*p)
-    for arg in zip(*nargs):
-        b = ''.join(map(str, arg)).encode()
-        s = b.decode('unicode_escape')
-        print(s, end='')
+    if len(nargs) == 1:
+        pieces = map(str, nargs[0])
+    else:
+        pieces = map(''.join, zip(*[map(str, a) for a in nargs]))
+    context._output.write(''.join(map(unescape, pieces)))
 
 
 def _sum(context, *args):
@@ -84,11 +105,10 @@ def _sum(context, *args):
 
     v = expr.eval(context)
 
-    if isinstance(v, types.GeneratorType):
-        v = list(v)
-
-    if isinstance(v, list):
+    if isinstance(v, (list, array, types.GeneratorType)):
         return sum(v)
+    elif isinstance(v, LIST_TYPES):
+        return backend.total(v)
 
     return v
 
@@ -105,30 +125,252 @@ def _prod(context, *args):
 
     v = expr.eval(context)
 
-    if isinstance(v, list):
+    if isinstance(v, (list, array, types.GeneratorType)):
         return math.prod(v)
+    elif isinstance(v, LIST_TYPES):
+        return backend.product(v)
     return v
 
 
 def _dump(context, *args):
+    output = context._output
     d = {}
     while context is not None:
         d = context._d | d
         context = context._parent
 
     for k, v in d.items():
-        print(f"{k} = {v}")
+        # names with a dot are optimizer temporaries, not user variables
+        if '.' not in k:
+            output.write(f"{k} = {backend.tolist(v)}\n")
+
+
+MEMO_SIZE = 1024
+
+# Commands that have no effect besides their result.
+PURE_COMMANDS = {'sum', 'prod'}
+
+
+def lookup(context, name):
+    try:
+        return context[name]
+    except EvalError:
+        return None
+
+
+def outer_reads(e, defined, reads):
+    # Add the var, idx and fcall nodes of e that may find their name outside
+    # of the function to reads, given the names that are certainly assigned
+    # when e is evaluated, and return the names certainly assigned after it.
+    # A local that is read before it is assigned still reads the outer name.
+    t = e.type
+    if t in ('var', 'idx', 'fcall') and isinstance(e.left, str):
+        if e.left not in defined:
+            reads.add(e)
+    elif t == '=':
+        defined = outer_reads(e.right, defined, reads)
+        return defined | {e.left.left}
+    elif t == 'if':
+        defined = outer_reads(e.right, defined, reads)
+        outer_reads(e.left, defined, reads)
+        return defined
+    elif t in ('and', 'or'):
+        defined = outer_reads(e.left, defined, reads)
+        outer_reads(e.right, defined, reads)
+        return defined
+    elif t == 'for':
+        var, expr = e.left
+        defined = outer_reads(expr, defined, reads)
+        outer_reads(e.right, defined | {var.left}, reads)
+        return defined
+    elif t == 'cases':
+        # later cases only run when the ones before them give nil
+        after = defined
+        for i, x in enumerate(e.left):
+            defined = outer_reads(x, defined, reads)
+            if i == 0:
+                after = defined
+        return after
+    elif t == 'fdef':
+        return defined
+
+    for c in children(e):
+        defined = outer_reads(c, defined, reads)
+    return defined
+
+
+def impurity(f, context, seen, calls=None):
+    # Why the result of f can not be cached, or None if it can. Only builtins
+    # and user functions that read nothing but their own parameters and
+    # locals, and call nothing but such functions, are pure. The functions
+    # called by name are added to calls, if given.
+    if f in PURE_FUNCTIONS:
+        return None
+
+    if f is None:
+        return 'is not defined'
+
+    fdef = getattr(f, 'fdef', None)
+    if fdef is None:
+        return 'is not a function'
+
+    if fdef in seen:
+        return None
+    seen.add(fdef)
+
+    reads = set()
+    outer_reads(fdef.right, {p.left for p in fdef.left.right}, reads)
+
+    for e in walk(fdef.right):
+        if e.type == 'fdef':
+            return f'defines {e.left.left}'
+        elif e.type == 'assign_item':
+            return f'assigns to {e.left.left}[]'
+        elif e.type == 'cmd' and e.left not in PURE_COMMANDS:
+            return f'uses {e.left}'
+        elif e.type in ('var', 'idx') and e in reads:
+            # a builtin is only a constant while the program leaves it be
+            builtin = BUILTINS._d.get(e.left, UNSET)
+            if lookup(context, e.left) is not builtin:
+                return f'reads {e.left}'
+            if calls is not None:
+                calls[e.left] = builtin
+        elif e.type == 'fcall' and e in reads:
+            g = lookup(context, e.left)
+            if calls is not None:
+                calls[e.left] = getattr(g, '__wrapped__', g)
+            reason = impurity(g, context, seen, calls)
+            if reason is not None:
+                return f'calls {e.left}, which {reason}'
+
+    return None
+
+
+def fresh(v):
+    # a copy of a list value, nested lists included; other values are
+    # immutable and returned as they are
+    if isinstance(v, list):
+        return [fresh(x) for x in v]
+    if isinstance(v, LIST_TYPES):
+        return copy.copy(v)
+
+    return v
+
+
+def memoize(f, size, context, calls):
+    # calls are the functions and builtins f depends on, by name; should one
+    # of them be redefined, the cache is dropped, and f is no longer cached at
+    # all if that made it impure
+    cached = functools.lru_cache(maxsize=size, typed=True)(lambda *a: reduce(f(*a)))
+    pure = [True]
+
+    def changed():
+        for name, g in calls.items():
+            h = lookup(context, name)
+            if getattr(h, '__wrapped__', h) is not g:
+                return True
+        return False
+
+    def g(*args):
+        if pure[0] and changed():
+            cached.cache_clear()
+            calls.clear()
+            pure[0] = impurity(f, context, set(), calls) is None
+        if not pure[0]:
+            return f(*args)
+
+        try:
+            hash(args)
+        except TypeError:
+            return f(*args)
+
+        # every caller gets its own list, to change as it pleases
+        return fresh(cached(*args))
+
+    g.fdef = f.fdef
+    g.cache = cached
+    g.__wrapped__ = f
+
+    return g
+
+
+def _memo(context, *args):
+    if not args:
+        output = context._output
+        d = {}
+        while context is not None:
+            d = context._d | d
+            context = context._parent
+
+        for k, v in d.items():
+            if hasattr(v, 'cache'):
+                info = v.cache.cache_info()
+                hits, misses, maxsize, size = info
+                output.write(
+                    f"{k}: {hits} hits, {misses} misses, {size}/{maxsize} cached\n"
+                )
+
+        return None
+
+    # compiled engines wrap arguments; the function name is in the node
+    e = getattr(args[0], 'expr', args[0])
+    if e.type != 'var':
+        raise EvalError('memo: expected a function name')
+
+    fname = e.left
+    size = args[1].eval(context) if len(args) > 1 else MEMO_SIZE
+    if not isinstance(size, int) or size < 1:
+        raise EvalError('memo: expected a positive cache size')
+
+    f = lookup(context, fname)
+    f = getattr(f, '__wrapped__', f)
+
+    calls = {}
+    reason = impurity(f, context, set(), calls)
+    if reason is not None:
+        raise EvalError(f"memo: {fname} {reason}")
+
+    if f in PURE_FUNCTIONS:
+        raise EvalError(f"memo: {fname} is a builtin")
+
+    context._globals[fname] = memoize(f, size, context, calls)
+
+    return None
+
+
+class Unset:
+    def __repr__(self):
+        return 'UNSET'
+
+
+# Value of a function local that has not been assigned yet. Reading it falls
+# back to the enclosing scope, like a miss in a Context does.
+UNSET = Unset()
 
 
 class Context:
-    def __init__(self, d, parent=None, ro=False):
+    def __init__(self, d, parent=None, ro=False, commands=None, output=None):
         self._d = d
         self._parent = parent
         self._ro = ro
+        # functions are defined in the outermost writable context, and every
+        # context uses the commands and output of the one it was created in
+        if parent is None or parent._ro:
+            self._globals = self
+        else:
+            self._globals = parent._globals
+        if commands is None:
+            commands = COMMANDS if parent is None else parent._commands
+        self._commands = commands
+        if output is None:
+            output = OUTPUT if parent is None else parent._output
+        self._output = output
 
     def __getitem__(self, key):
         if key in self._d:
             return self._d[key]
+        elif self._parent is None:
+            raise EvalError(f"{key} is not defined")
         else:
             return self._parent[key]
 
@@ -138,10 +380,20 @@ class Context:
 
         self._d[key] = value
 
+    def _rebind(self, key, value):
+        # assign to key where self[key] finds it
+        if key in self._d:
+            self[key] = value
+        else:
+            self._parent._rebind(key, value)
+
     def __str__(self):
         return str(self._d)
 
 
+# Unbuffered, so output shows up as it is printed. A Session collects it.
+OUTPUT = Output()
+
 COMMANDS = {
     'print': _print,
     'write': _write,
@@ -149,6 +401,7 @@ COMMANDS = {
     'sum': _sum,
     'prod': _prod,
     'dump': _dump,
+    'memo': _memo,
 }
 
 BUILTINS = Context(
@@ -171,6 +424,46 @@ BUILTINS = Context(
 GLOBALS = Context({}, parent=BUILTINS)
 
 
+def command(context, name):
+    try:
+        return context._commands[name]
+    except KeyError:
+        raise EvalError(f"unknown command: {name}") from None
+
+
+# Functions without side effects, which can be mapped over a range lazily.
+PURE_FUNCTIONS = {f for f in BUILTINS._d.values() if callable(f)}
+
+# Values that binop_reduce and friends broadcast over. Generators are ranges
+# that have not been materialized yet.
+SEQUENCE_TYPES = LIST_TYPES + (types.GeneratorType,)
+
+
+BINOPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '^': operator.pow,
+    '%': operator.mod,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+COMPARISONS = {'<', '>', '<=', '>=', '==', '!='}
+
+# Values for which the binary operators can be applied directly, without the
+# list broadcasting done by binop_reduce.
+SCALARS = {int, float, bool}
+
+# Nodes with a part in tail position, see Expr._tail.
+TAIL_TYPES = {None, 'stmnts', 'block', 'fcall', 'if', 'cases'}
+
+
 def binop_reduce(op, context, left, right):
     if isinstance(left, Expr):
         return binop_reduce(op, context, left.eval(context), right)
@@ -178,13 +471,23 @@ def binop_reduce(op, context, left, right):
     if isinstance(right, Expr):
         return binop_reduce(op, context, left, right.eval(context))
 
-    if isinstance(left, list) and isinstance(right, list):
+    if isinstance(left, types.GeneratorType) or isinstance(right, types.GeneratorType):
+        return lazy_binop(op, left, right)
+
+    if backend.enabled and (
+        isinstance(left, LIST_TYPES) or isinstance(right, LIST_TYPES)
+    ):
+        result = backend.binop(op, left, right)
+        if result is not NotImplemented:
+            return result
+
+    if isinstance(left, LIST_TYPES) and isinstance(right, LIST_TYPES):
         if len(left) != len(right):
             raise EvalError('expected lists to have the same length')
         return [op(x, y) for (x, y) in zip(left, right)]
-    elif isinstance(left, list):
+    elif isinstance(left, LIST_TYPES):
         return [op(x, right) for x in left]
-    elif isinstance(right, list):
+    elif isinstance(right, LIST_TYPES):
         return [op(left, x) for x in right]
 
     return op(left, right)
@@ -194,29 +497,69 @@ def unop_reduce(op, context, right):
     if isinstance(right, Expr):
         return unop_reduce(op, context, right.eval(context))
 
-    if isinstance(right, list):
+    if isinstance(right, types.GeneratorType):
+        return (op(x) for x in right)
+
+    if backend.enabled and isinstance(right, LIST_TYPES):
+        result = backend.unop(op, right)
+        if result is not NotImplemented:
+            return result
+
+    if isinstance(right, LIST_TYPES):
         return [op(x) for x in right]
 
     return op(right)
 
 
+def lazy_zip(*args):
+    try:
+        yield from zip(*args, strict=True)
+    except ValueError:
+        raise EvalError('expected lists to have the same length') from None
+
+
+def lazy_binop(op, left, right):
+    # Elementwise ops on a range stay generators, so a pipeline such as
+    # sum (1..N)^2 streams instead of building a list per operator.
+    if isinstance(left, SEQUENCE_TYPES) and isinstance(right, SEQUENCE_TYPES):
+        return (op(x, y) for (x, y) in lazy_zip(left, right))
+    elif isinstance(left, SEQUENCE_TYPES):
+        return (op(x, right) for x in left)
+
+    return (op(left, x) for x in right)
+
+
 def func_reduce(f, context, *args):
     for i, arg in enumerate(args):
         if isinstance(arg, Expr):
-            return func_reduce(
-                f, context, *args[:i], reduce(arg.eval(context)), *args[i + 1 :]
-            )
+            return func_reduce(f, context, *args[:i], arg.eval(context), *args[i + 1 :])
 
     k = 0
     count = 0
+    lazy = False
     for i, arg in enumerate(args):
-        if isinstance(arg, list):
+        if isinstance(arg, SEQUENCE_TYPES):
             k = i
             count += 1
+            lazy = lazy or isinstance(arg, types.GeneratorType)
 
     if count == 0:
         return f(*args)
 
+    if lazy:
+        # user functions may print, so only builtins are mapped lazily
+        if f not in PURE_FUNCTIONS:
+            return func_reduce(f, context, *map(reduce, args))
+        if count == 1:
+            return (f(*args[:k], x, *args[k + 1 :]) for x in args[k])
+        if count == len(args):
+            return (f(*a) for a in lazy_zip(*args))
+
+    if backend.enabled:
+        result = backend.func(f, *args)
+        if result is not NotImplemented:
+            return result
+
     if count == 1:
         return [f(*args[:k], x, *args[k + 1 :]) for x in args[k]]
 
@@ -226,15 +569,327 @@ def func_reduce(f, context, *args):
     raise EvalError('expected 0, 1, or all arguments to be list')
 
 
+class TailCall:
+    # A call to a user function in tail position. It is returned instead of
+    # made, and the function that returns it makes the call once its own
+    # frame is gone, so recursion in tail position runs in constant stack.
+    __slots__ = ('enter', 'args')
+
+    def __init__(self, enter, args):
+        self.enter = enter
+        self.args = args
+
+
+def trampoline(result):
+    while type(result) is TailCall:
+        result = result.enter(*result.args)
+    return result
+
+
+def tail_call(f, args):
+    # User functions have an enter, which runs the body without making the
+    # tail call it ends in. Builtins and memoized functions are called.
+    enter = getattr(f, 'enter', None)
+    if enter is None:
+        return f(*args)
+    return TailCall(enter, args)
+
+
+def nil_case(e):
+    return (e.type == 'var' and e.left == 'nil') or (
+        e.type == 'literal' and e.left is None
+    )
+
+
+def tail_case(cases):
+    # The case whose value is the value of the cases: the last one, or the
+    # one before a trailing nil as in { f(x + 1) if x < 3; nil }. Only nil
+    # cases may follow it, and the tail call it makes is kept only while nil
+    # is None.
+    k = len(cases) - 1
+    while k > 0 and nil_case(cases[k]):
+        k -= 1
+    return k
+
+
+def index_reduce(var, idx):
+    idx = reduce(idx)
+
+    N = len(var)
+    if isinstance(idx, int):
+        value = var[(idx - 1) % N]
+        return backend.item(value) if backend.enabled else value
+    elif isinstance(idx, list):
+        values = [var[(i - 1) % N] for i in idx]
+        return backend.tolist(values) if backend.enabled else values
+
+    if backend.enabled:
+        result = backend.index(var, idx)
+        if result is not NotImplemented:
+            return result
+
+    raise EvalError('expected int or list')
+
+
+def store_item(var, idx, value):
+    # var[idx] = value; returns var, or the list an array backend stored
+    # value in instead, should var not hold values of its type
+    if backend.enabled:
+        return backend.setitem(var, idx - 1, value)
+
+    var[idx - 1] = value
+    return var
+
+
+def assign_item(context, vname, var, idx, value):
+    # store_item for var read as vname in context; a list made in its place
+    # is assigned to vname
+    new = store_item(var, idx, value)
+    if new is not var:
+        context._rebind(vname, new)
+
+
+class View:
+    # var[left..right], or every step-th element of it, read in place instead
+    # of copied. A view shows later changes to var, so it is only made for a
+    # slice that is used up right away, like one compared in a condition.
+    __slots__ = ('var', 'positions')
+
+    def __init__(self, var, positions):
+        self.var = var
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return map(self.var.__getitem__, self.positions)
+
+    def __getitem__(self, i):
+        return self.var[self.positions[i]]
+
+
+# Sequences all_reduce compares element by element; tuples are list literals
+# prepared by the compilers.
+FLAT_TYPES = (list, array, tuple, View)
+
+
+def positions(N, left, right, step):
+    # The indices of var[left..right..+step] as a range within -N..N-1, so
+    # that Python's negative indices do the wrapping around, or None when the
+    # slice goes round var more than once.
+    r = range(left - 1, right, step)
+    if not r:
+        return r
+
+    span = r[-1] - r[0]
+    if span >= N:
+        return None
+
+    start = r[0] % N
+    if start + span >= N:
+        start -= N
+    return range(start, start + span + 1, step)
+
+
+def slice_args(left, right, step):
+    return type(left) is int and type(right) is int and type(step) is int and step > 0
+
+
+def slice_reduce(var, left, right, step=None):
+    # var[left..right], or var[left..right..+step], without going through a
+    # range generator
+    s = 1 if step is None else step
+    if slice_args(left, right, s):
+        N = len(var)
+        if (type(var) is list or type(var) is array) and 0 < left <= right <= N:
+            return var[left - 1 : right : s]
+
+        r = positions(N, left, right, s)
+        if r is None:
+            values = [var[i % N] for i in range(left - 1, right, s)]
+        else:
+            values = list(map(var.__getitem__, r))
+        return backend.tolist(values) if backend.enabled else values
+
+    if step is None:
+        return index_reduce(var, range_reduce(left, right, 'auto', 'count'))
+    return index_reduce(var, range_reduce(left, right, step, 'incr'))
+
+
+def slice_view(var, left, right, step=None):
+    # slice_reduce for a slice that is read once and dropped. Copying a slice
+    # that does not wrap is a single C call and faster than any view of it.
+    s = 1 if step is None else step
+    if slice_args(left, right, s):
+        N = len(var)
+        if (type(var) is list or type(var) is array) and 0 < left <= right <= N:
+            return var[left - 1 : right : s]
+
+        r = positions(N, left, right, s)
+        if r is not None:
+            return View(var, r)
+
+    return slice_reduce(var, left, right, step)
+
+
+def slice_operands(idx):
+    # The bounds and step of an index that is a finite a..b or a..b..+s
+    # range, or None for any other index.
+    if idx.type != 'range':
+        return None
+
+    if isinstance(idx.left, list):
+        lo, hi = idx.left
+        step, type = idx.right
+        if type != 'incr':
+            return None
+    else:
+        lo, hi = idx.left, idx.right
+        step = None
+
+    if hi.type == 'Inf':
+        return None
+    return lo, hi, step
+
+
+def slice_value(e, context, slice):
+    # evaluate var[idx] for an idx node, through slice when idx is a slice
+    bounds = slice_operands(e.right)
+    if bounds is None:
+        idx = e.right._eval(context)
+        return index_reduce(context[e.left], idx)
+
+    lo, hi, step = bounds
+    if step is not None:
+        step = step._eval(context)
+    left = lo._eval(context)
+    right = hi._eval(context)
+    return slice(context[e.left], left, right, step)
+
+
+def literal_list(e):
+    # the values of a list literal like [1, 0, 1], or None
+    if e.type == 'list' and all(x.type == 'literal' for x in e.left):
+        return tuple(x.left for x in e.left)
+    return None
+
+
+def all_reduce(op, context, left, right):
+    # Truth value of a comparison used as a condition. A list condition only
+    # matters through all(), so stop at the first mismatch.
+    if type(left) in FLAT_TYPES and type(right) in FLAT_TYPES:
+        if len(left) != len(right):
+            raise EvalError('expected lists to have the same length')
+        return all(map(op, left, right))
+
+    if type(left) is View or type(left) is tuple:
+        left = list(left)
+    if type(right) is View or type(right) is tuple:
+        right = list(right)
+
+    cond = binop_reduce(op, context, left, right)
+    if isinstance(cond, SEQUENCE_TYPES):
+        return all(cond)
+
+    return cond
+
+
+def range_reduce(left, right, step, type, infinite=False):
+    if infinite:
+        if type == 'incr':
+            if step == 'auto':
+                step = 1
+
+            def g():
+                x = left
+                while True:
+                    yield x
+                    x += step
+
+            return g()
+        elif type == 'count':
+            count = step
+            if count == 'auto':
+
+                def g():
+                    x = left
+                    while True:
+                        yield x
+                        x += 1
+
+                return g()
+            else:
+
+                def g():
+                    x = left
+                    for _ in range(count):
+                        yield x
+                        x += 1
+
+                return g()
+
+    if backend.enabled:
+        left, right, step = map(backend.item, (left, right, step))
+        values = finite_range(left, right, step, type)
+        return backend.range_array(left, right, step, type, values)
+
+    return finite_range(left, right, step, type)
+
+
+def finite_range(left, right, step, type):
+    if isinstance(left, int) and isinstance(right, int):
+        if type == 'count' and step == 'auto':
+            return (n for n in range(left, right + 1, 1))
+        elif type == 'incr' and isinstance(step, int):
+            return (n for n in range(left, right + 1, step))
+        elif type == 'count' and isinstance(step, int):
+            count = step
+            if right == left:
+                return (left for _ in range(count))
+            elif (right - left) % (count - 1) == 0:
+                step = (right - left) // (count - 1)
+                return (n for n in range(left, right + 1, step))
+
+    if type == 'count':
+        if step == 'auto':
+            count = 50
+        else:
+            count = step
+        step = (right - left) / (count - 1)
+        return (left + i * step for i in range(count))
+    elif type == 'incr':
+        if step == 'auto':
+            count = 50
+            step = (right - left) / (count - 1)
+            return (left + i * step for i in range(count))
+        else:
+
+            def g():
+                x = left
+                while x <= right:
+                    yield x
+                    x += step
+
+            return g()
+
+    raise EvalError(f"Error: unknown range type: {type}")
+
+
 class Expr:
-    ID = 0
+    # Nodes are created by the million for long programs, so keep them
+    # without a __dict__; draw_tree numbers them itself.
+    __slots__ = ('type', 'left', 'right')
 
     def __init__(self, type, left, right=None):
         self.type = type
         self.left = left
         self.right = right
-        self.id = Expr.ID
-        Expr.ID += 1
+
+    def __reduce__(self):
+        # pickles at half the size and loads faster than the generic state of
+        # a slotted object
+        return Expr, (self.type, self.left, self.right)
 
     def eval(self, context=GLOBALS):
         return self._eval(context)
@@ -253,48 +908,15 @@ class Expr:
         elif self.type == 'literal':
             return self.left
 
-        elif self.type == '+':
-            return binop_reduce(lambda x, y: x + y, context, self.left, self.right)
+        elif self.type == '-' and self.right is None:
+            return unop_reduce(operator.neg, context, self.left)
 
-        elif self.type == '-':
-            if self.right is None:
-                return unop_reduce(lambda x: -x, context, self.left)
-
-            return binop_reduce(lambda x, y: x - y, context, self.left, self.right)
-
-        elif self.type == '*':
-            return binop_reduce(lambda x, y: x * y, context, self.left, self.right)
-
-        elif self.type == '/':
-            return binop_reduce(lambda x, y: x / y, context, self.left, self.right)
-
-        elif self.type == '^':
-            return binop_reduce(lambda x, y: x**y, context, self.left, self.right)
-
-        elif self.type == '%':
-            return binop_reduce(lambda x, y: x % y, context, self.left, self.right)
-
-        elif self.type == '<':
-            return binop_reduce(lambda x, y: x < y, context, self.left, self.right)
-
-        elif self.type == '>':
-            return binop_reduce(lambda x, y: x > y, context, self.left, self.right)
-
-        elif self.type == '<=':
-            return binop_reduce(lambda x, y: x <= y, context, self.left, self.right)
-
-        elif self.type == '>=':
-            return binop_reduce(lambda x, y: x >= y, context, self.left, self.right)
-
-        elif self.type == '==':
-            return binop_reduce(lambda x, y: x == y, context, self.left, self.right)
-
-        elif self.type == '!=':
-            return binop_reduce(lambda x, y: x != y, context, self.left, self.right)
+        elif self.type in BINOPS:
+            return binop_reduce(BINOPS[self.type], context, self.left, self.right)
 
         elif self.type == '#':
             value = self.left._eval(context)
-            return len(value)
+            return len(reduce(value))
 
         elif self.type == 'fcall':
             fname = self.left
@@ -325,18 +947,27 @@ class Expr:
             if not all(map(lambda p: p.type == 'var', plist)):
                 raise EvalError("expected parameter names")
 
+            def enter(*args):
+                ctx = Context({p.left: a for p, a in zip(plist, args)}, parent=context)
+                return body._tail(ctx)
+
             def f(*args):
                 ctx = Context({p.left: a for p, a in zip(plist, args)}, parent=context)
-                return body._eval(ctx)
+                result = body._tail(ctx)
+                if isinstance(result, TailCall):
+                    result = trampoline(result)
+                return result
 
-            GLOBALS[fname] = f
+            f.fdef = self
+            f.enter = enter
+            context._globals[fname] = f
 
             return None
 
         elif self.type == 'cmd':
             cname = self.left
             params = self.right
-            cmd = COMMANDS[cname]
+            cmd = command(context, cname)
             return cmd(context, *params)
 
         elif self.type == 'range':
@@ -354,89 +985,17 @@ class Expr:
             left = left._eval(context)
 
             if right.type == 'Inf':
-                if type == 'incr':
-                    if step == 'auto':
-                        step = 1
-
-                    def g():
-                        x = left
-                        while True:
-                            yield x
-                            x += step
-
-                    return g()
-                elif type == 'count':
-                    count = step
-                    if count == 'auto':
-
-                        def g():
-                            x = left
-                            while True:
-                                yield x
-                                x += 1
-
-                        return g()
-                    else:
-
-                        def g():
-                            x = left
-                            for _ in range(count):
-                                yield x
-                                x += 1
-
-                        return g()
+                return range_reduce(left, None, step, type, infinite=True)
 
             right = right._eval(context)
 
-            if isinstance(left, int) and isinstance(right, int):
-                if type == 'count' and step == 'auto':
-                    return (n for n in range(left, right + 1, 1))
-                elif type == 'incr' and isinstance(step, int):
-                    return (n for n in range(left, right + 1, step))
-                elif type == 'count' and isinstance(step, int):
-                    count = step
-                    if right == left:
-                        return (left for _ in range(count))
-                    elif (right - left) % (count - 1) == 0:
-                        step = (right - left) // (count - 1)
-                        return (n for n in range(left, right + 1, step))
-
-            if type == 'count':
-                if step == 'auto':
-                    count = 50
-                else:
-                    count = step
-                step = (right - left) / (count - 1)
-                return (left + i * step for i in range(count))
-            elif type == 'incr':
-                if step == 'auto':
-                    count = 50
-                    step = (right - left) / (count - 1)
-                    return (left + i * step for i in range(count))
-                else:
-
-                    def g():
-                        x = left
-                        while x <= right:
-                            yield x
-                            x += step
-
-                    return g()
-
-            raise EvalError(f"Error: unknown range type: {type}")
+            return range_reduce(left, right, step, type)
 
         elif self.type == 'list':
-            return [x._eval(context) for x in self.left]
+            return [reduce(x._eval(context)) for x in self.left]
 
         elif self.type == 'if':
-            cond = self.right._eval(context)
-
-            if isinstance(cond, list):
-                if all(cond):
-                    return self.left._eval(context)
-                return None
-
-            if cond:
+            if self._holds(context):
                 return self.left._eval(context)
 
             return None
@@ -451,36 +1010,33 @@ class Expr:
             return None
 
         elif self.type == 'or':
-            return self.left._eval(context) or self.right._eval(context)
+            left = self.left._eval(context)
+            return left if truth(left) else self.right._eval(context)
 
         elif self.type == 'and':
-            return self.left._eval(context) and self.right._eval(context)
+            left = self.left._eval(context)
+            return self.right._eval(context) if truth(left) else left
 
         elif self.type == 'not':
-            return not self.left._eval(context)
+            return not truth(self.left._eval(context))
 
         elif self.type == 'idx':
+            if self.right.type == 'range':
+                return slice_value(self, context, slice_reduce)
+
             vname = self.left
             idx = self.right._eval(context)
 
             var = context[vname]
 
-            N = len(var)
-            if isinstance(idx, int):
-                value = var[(idx - 1) % N]
-            elif isinstance(idx, list):
-                value = [var[(i - 1) % N] for i in idx]
-            else:
-                raise EvalError('expected int or list')
-
-            return value
+            return index_reduce(var, idx)
 
         elif self.type == 'assign_item':
             vname = self.left.left
             idx = self.left.right._eval(context)
             value = self.right._eval(context)
 
-            context[vname][idx - 1] = value
+            assign_item(context, vname, context[vname], idx, value)
 
             return value
 
@@ -491,9 +1047,9 @@ class Expr:
 
             left = lhs._eval(context)
             for rhs in self.right:
-                right = rhs.left._eval(context)
-                expr = Expr(rhs.type, left, right)
-                result = result and expr._eval(context)
+                right = reduce(rhs.left._eval(context))
+                if truth(result):
+                    result = binop_reduce(BINOPS[rhs.type], context, left, right)
                 left = right
 
             return result
@@ -503,7 +1059,7 @@ class Expr:
             vname = var.left
             body = self.right
 
-            values = expr._eval(context)
+            values = backend.items(expr._eval(context))
             for value in values:
                 context[vname] = value
                 body._eval(context)
@@ -516,12 +1072,137 @@ class Expr:
         else:
             raise EvalError(f"unknown expression type: {self.type}")
 
+    def _holds(self, context):
+        # the condition of an if node; a list condition must hold throughout
+        c = self.right
+        if c.type in COMPARISONS and c.left.type == 'idx':
+            values = literal_list(c.right)
+            if values is not None:
+                # var[a..b] == [1, 0, 1] without building either list
+                a = slice_value(c.left, context, slice_view)
+                return all_reduce(BINOPS[c.type], context, a, values)
+
+        cond = c._eval(context)
+
+        if isinstance(cond, SEQUENCE_TYPES):
+            return all(cond)
+
+        return cond
+
+    @trace
+    def _tail(self, context):
+        # Evaluate the body of a user function like _eval, except that a call
+        # to a user function in tail position is returned as a TailCall.
+        if self.type is None:
+            return self.left._tail(context)
+
+        elif self.type == 'fcall':
+            func = context[self.left]
+            args = [p._eval(context) for p in self.right]
+            for x in args:
+                if isinstance(x, SEQUENCE_TYPES):
+                    return func_reduce(func, context, *args)
+            return tail_call(func, args)
+
+        elif self.type == 'stmnts' or self.type == 'block':
+            if not self.left:
+                return None
+            for s in self.left[:-1]:
+                s._eval(context)
+            return self.left[-1]._tail(context)
+
+        elif self.type == 'if':
+            if self._holds(context):
+                return self.left._tail(context)
+
+            return None
+
+        elif self.type == 'cases':
+            cases = self.left
+            if not cases:
+                return None
+
+            k = tail_case(cases)
+            for x in cases[:k]:
+                result = x._eval(context)
+                if result is not None:
+                    return result
+
+            result = cases[k]._tail(context)
+            if type(result) is TailCall:
+                if all(x._eval(context) is None for x in cases[k + 1 :]):
+                    return result
+                result = trampoline(result)
+            if result is not None:
+                return result
+
+            for x in cases[k + 1 :]:
+                result = x._eval(context)
+                if result is not None:
+                    return result
+
+            return None
+
+        return self._eval(context)
+
     def __repr__(self):
         return f"Expr({self.type}, {self.left}, {self.right})"
 
 
+def children(e):
+    if e.type in ('stmnts', 'block', 'cases', 'list'):
+        return list(e.left)
+    elif e.type in ('fcall', 'cmd'):
+        return list(e.right)
+    elif e.type == 'var':
+        return list(e.right) if isinstance(e.right, list) else []
+    elif e.type == 'range':
+        if isinstance(e.left, list):
+            return e.left + [e.right[0]]
+        return [e.left, e.right]
+    elif e.type == 'lchain':
+        return [e.left] + e.right
+    elif e.type == 'for':
+        return e.left + [e.right]
+    elif e.type == 'idx':
+        return [e.right]
+    elif e.type == 'literal':
+        return []
+
+    return [x for x in (e.left, e.right) if isinstance(x, Expr)]
+
+
+def walk(e):
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        yield e
+        stack.extend(reversed(children(e)))
+
+
+def local_assignments(body):
+    # names a function body assigns to, not counting nested function bodies
+    names = []
+    stack = [body]
+    while stack:
+        e = stack.pop()
+        if e.type == 'fdef':
+            continue
+        if e.type == '=':
+            names.append(e.left.left)
+        elif e.type == 'for':
+            names.append(e.left[0].left)
+        stack.extend(reversed(children(e)))
+    return names
+
+
 def draw_tree(root, fname="tree"):
-    ids = set()
+    # nodes carry no ids of their own, so number them as they are reached
+    ids = {}
+    seen = set()
+
+    def node_id(n):
+        return ids.setdefault(id(n), len(ids))
 
     with open(f"{fname}.dot", 'w') as f:
         f.write("graph {\n")
@@ -529,40 +1210,42 @@ def draw_tree(root, fname="tree"):
         queue = [root]
         while queue:
             n = queue.pop()
-            if n.id not in ids:
+            nid = node_id(n)
+            if nid not in seen:
+                seen.add(nid)
                 if n.type == 'literal':
-                    f.write(f'v{n.id}[label="{n.left}"];\n')
+                    f.write(f'v{nid}[label="{n.left}"];\n')
 
                 elif n.type == 'fcall':
-                    f.write(f'v{n.id}[label="{n.left}()"];\n')
+                    f.write(f'v{nid}[label="{n.left}()"];\n')
 
                 elif n.type == 'var':
                     if isinstance(n.right, list):
                         plist = ",".join([p.left for p in n.right])
-                        f.write(f'v{n.id}[label="{n.left}({plist})"];\n')
+                        f.write(f'v{nid}[label="{n.left}({plist})"];\n')
                     else:
-                        f.write(f'v{n.id}[label="{n.left}"];\n')
+                        f.write(f'v{nid}[label="{n.left}"];\n')
 
                 elif n.type == 'cmd':
-                    f.write(f'v{n.id}[label="{n.left}"];\n')
+                    f.write(f'v{nid}[label="{n.left}"];\n')
 
                 elif n.type == 'range':
                     if isinstance(n.right, list) and n.right[1] == 'incr':
-                        f.write(f'v{n.id}[label="{n.type}+"];\n')
+                        f.write(f'v{nid}[label="{n.type}+"];\n')
                     else:
-                        f.write(f'v{n.id}[label="{n.type}"];\n')
+                        f.write(f'v{nid}[label="{n.type}"];\n')
 
                 elif n.type == 'idx':
-                    f.write(f'v{n.id}[label="{n.left}[]"];\n')
+                    f.write(f'v{nid}[label="{n.left}[]"];\n')
 
                 elif n.type == 'assign_item':
-                    f.write(f'v{n.id}[label="="];\n')
+                    f.write(f'v{nid}[label="="];\n')
 
                 elif n.type == 'fdef':
-                    f.write(f'v{n.id}[label="="];\n')
+                    f.write(f'v{nid}[label="="];\n')
 
                 else:
-                    f.write(f'v{n.id}[label="{n.type}"];\n')
+                    f.write(f'v{nid}[label="{n.type}"];\n')
 
             if n.type == 'fcall':
                 children = n.right
@@ -594,7 +1277,7 @@ def draw_tree(root, fname="tree"):
                 if not isinstance(m, Expr):
                     continue
 
-                f.write(f'v{n.id} -- v{m.id};\n')
+                f.write(f'v{nid} -- v{node_id(m)};\n')
                 queue.append(m)
 
         f.write("}\n")
@@ -24,88 +24,50 @@ class Token:
         return f"Token('{self.type}', {self.value})"
 
 
-def tok_number(s):
-    token = ""
-    type = int
-    while len(s) > 0 and re.match('[0-9]', s[0]):
-        token += s[0]
-        s = s[1:]
-
-    if len(s) > 0 and s[0] == '.':
-        if len(s) > 1 and s[1] != '.' or len(s) > 2 and s[1] == '.' and s[2] == '.':
-            token += s[0]
-            s = s[1:]
-            type = float
-
-    while len(s) > 0 and re.match('[0-9]', s[0]):
-        token += s[0]
-        s = s[1:]
-
-    if len(s) > 0 and re.match('[eE]', s[0]):
-        token += s[0]
-        s = s[1:]
-        type = float
-        if len(s) > 0 and s[0] == '-':
-            token += s[0]
-            s = s[1:]
-
-    while len(s) > 0 and re.match('[0-9]', s[0]):
-        token += s[0]
-        s = s[1:]
-
-    return Token('number', type(token)), s
-
-
-def tok_ident_or_keyword(s):
-    t, s = s[0], s[1:]
-
-    if not re.match('[_a-zA-Z]', t):
-        raise TokenError(f"unexpected token: {t}")
-
-    token = t
-    while len(s) > 0 and re.match("[_a-zA-Z0-9']", s[0]):
-        token += s[0]
-        s = s[1:]
-
+# A '.' after the integer part belongs to the number unless it starts a '..'
+# range; '1...2' is read as '1.' followed by '..'.
+TOKEN_RE = re.compile(
+    r"""
+    (?P<eol>\n)
+    | (?P<space>[^\S\n]+)
+    | (?P<comment>\#\ [^\n]*)
+    | (?P<op>[<>=!]=?|[-+*/^%,():;\[\]{}\#])
+    | (?P<number>[0-9]+(?P<frac>\.(?=[^.]|\.\.))?[0-9]*(?P<exp>[eE]-?)?[0-9]*)
+    | (?P<ident>[_a-zA-Z][_a-zA-Z0-9']*)
+    | (?P<range>\.\.)
+    | (?P<dotnumber>\.(?=[^.])[0-9]*(?:[eE]-?)?[0-9]*)
+    | (?P<string>"[^"]*")
+    """,
+    re.VERBOSE,
+)
+
+
+def tok_number(m):
+    text = m.group()
+    try:
+        if m.lastgroup == 'dotnumber':
+            return Token('number', float('0' + text))
+
+        if m.group('frac') is not None or m.group('exp') is not None:
+            return Token('number', float(text))
+
+        return Token('number', int(text))
+    except ValueError:
+        raise TokenError(f"invalid number: {text}") from None
+
+
+def tok_ident_or_keyword(token, commands=COMMANDS):
     if token in KEYWORDS:
-        return Token(token, None), s
-
-    if token in COMMANDS:
-        return Token('command', token), s
-
-    return Token('identifier', token), s
-
-
-def tok_range(s):
-    for _ in range(2):
-        t, s = s[0], s[1:]
-        if t != '.':
-            raise TokenError(f"unexpected token: {t}")
-
-    return Token('..'), s
-
-
-def tok_string(s):
-    token = ''
-
-    t, s = s[0], s[1:]
-    if t != '"':
-        raise TokenError(f"unexpected token: {t}")
-
-    while len(s) > 0 and s[0] != '"':
-        t, s = s[0], s[1:]
-        token += t
+        return Token(token, None)
 
-    t, s = s[0], s[1:]
+    if token in commands:
+        return Token('command', token)
 
-    if t != '"':
-        raise TokenError(f"unexpected token: {t}")
-
-    return Token('string', token), s
+    return Token('identifier', token)
 
 
 @trace
-def tokenize(s):
+def tokenize(s, commands=COMMANDS, offsets=None):
     # 'space': \s -> skip
     # 'eol': \n
     # 'comment': # .*$
@@ -118,58 +80,39 @@ def tokenize(s):
     # 'string': (?<=").*(?=")
 
     tokens = []
-
-    while len(s) > 0:
-        if s[0] == '\n':
-            s = s[1:]
-            tokens.append(Token('eol', None))
-            continue
-
-        if re.match(r'\s', s[0]):
-            s = s[1:]
-            continue
-
-        if s[0] == '#' and len(s) > 1 and s[1] == ' ':
-            while len(s) > 0 and s[0] != '\n':
-                s = s[1:]
-            continue
-
-        if re.match(r'[-+*/^%,\(\):;\[\]\{\}#]', s[0]):
-            t, s = s[0], s[1:]
-            tokens.append(Token(t, None))
-            continue
-
-        if re.match('[<>=!]', s[0]):
-            t, s = s[0], s[1:]
-            if len(s) > 0 and s[0] == '=':
-                t += s[0]
-                s = s[1:]
-            tokens.append(Token(t, None))
-            continue
-
-        if re.match('[0-9]', s[0]):
-            token, s = tok_number(s)
-            tokens.append(token)
-            continue
-
-        if re.match('[_a-zA-Z]', s[0]):
-            token, s = tok_ident_or_keyword(s)
-            tokens.append(token)
-            continue
-
-        if s[0] == '.':
-            if len(s) > 1 and s[1] == '.':
-                token, s = tok_range(s)
-            else:
-                token, s = tok_number("0" + s)
-            tokens.append(token)
-            continue
-
-        if s[0] == '"':
-            token, s = tok_string(s)
-            tokens.append(token)
+    append = tokens.append
+    match = TOKEN_RE.match
+
+    pos = 0
+    end = len(s)
+    while pos < end:
+        m = match(s, pos)
+        if m is None:
+            if s[pos] == '"':
+                raise TokenError("unterminated string")
+            raise TokenError(f"unexpected token: {s[pos]}")
+
+        kind = m.lastgroup
+        pos = m.end()
+
+        if kind == 'space' or kind == 'comment':
             continue
 
-        raise TokenError(f"unexpected token: {s[0]}")
+        if offsets is not None:
+            # where each token starts in s, see profiler.locate
+            offsets.append(m.start())
+
+        if kind == 'ident':
+            append(tok_ident_or_keyword(m.group(), commands))
+        elif kind == 'op':
+            append(Token(m.group(), None))
+        elif kind == 'eol':
+            append(Token('eol', None))
+        elif kind == 'number' or kind == 'dotnumber':
+            append(tok_number(m))
+        elif kind == 'range':
+            append(Token('..'))
+        else:
+            append(Token('string', m.group()[1:-1]))
 
     return tokens
@@ -0,0 +1,287 @@
+from .expr import (
+    BINOPS,
+    BUILTINS,
+    GLOBALS,
+    PURE_FUNCTIONS,
+    Expr,
+    local_assignments,
+    lookup,
+    walk,
+)
+import operator
+
+# Literal values that are safe to compute ahead of time. Lists are left
+# alone: a folded list would be shared by every evaluation of the node.
+NUMBERS = {int, float}
+
+ARITHMETIC = {'+', '-', '*', '/', '^', '%'}
+
+# x op identity is x for any number x. Not x + 0, which turns -0.0 into 0.0,
+# and not x / 1, which turns an int into a float.
+RIGHT_IDENTITIES = {'-': 0, '*': 1, '^': 1}
+LEFT_IDENTITIES = {'*': 1}
+
+MAX_EXPONENT = 1024
+
+# Node types a hoisted loop invariant may be built from: none of them have
+# side effects, and none read a list element another name could change.
+INVARIANT = ARITHMETIC | {'literal', 'var', 'Inf', '#', 'range', 'list', 'fcall'}
+LEAVES = {'literal', 'var', 'Inf'}
+
+
+def map_children(e, f):
+    # a copy of e with f applied to each child node
+    t = e.type
+
+    if t in ('stmnts', 'block', 'cases', 'list'):
+        return Expr(t, [f(x) for x in e.left])
+    elif t in ('fcall', 'cmd'):
+        return Expr(t, e.left, [f(x) for x in e.right])
+    elif t in ('literal', 'var', 'Inf'):
+        return e
+    elif t == 'range':
+        if isinstance(e.left, list):
+            left = [f(x) for x in e.left]
+            return Expr(t, left, [f(e.right[0]), e.right[1]])
+        return Expr(t, f(e.left), f(e.right))
+    elif t == 'idx':
+        return Expr(t, e.left, f(e.right))
+    elif t in ('=', 'fdef'):
+        return Expr(t, e.left, f(e.right))
+    elif t == 'assign_item':
+        return Expr(t, f(e.left), f(e.right))
+    elif t == 'lchain':
+        return Expr(t, f(e.left), [Expr(r.type, f(r.left)) for r in e.right])
+    elif t == 'for':
+        var, values = e.left
+        return Expr(t, [var, f(values)], f(e.right))
+
+    left = f(e.left) if isinstance(e.left, Expr) else e.left
+    right = f(e.right) if isinstance(e.right, Expr) else e.right
+    return Expr(t, left, right)
+
+
+class Folder:
+    def __init__(self, program, context, partial=False):
+        self.bound = bound_names(program)
+        self.context = context
+        self.partial = partial
+        self.numeric = set()
+        self.numeric = self.numeric_names(program)
+
+    def builtin(self, name):
+        # a builtin the program can not rebind
+        if name in self.bound or name not in BUILTINS._d:
+            return False
+        return lookup(self.context, name) is BUILTINS._d[name]
+
+    def is_numeric(self, e):
+        t = e.type
+        if t == 'literal':
+            return type(e.left) in NUMBERS
+        elif t == '#':
+            return True
+        elif t == 'var':
+            return e.left in self.numeric
+        elif t == 'fcall':
+            return self.builtin(e.left) and all(map(self.is_numeric, e.right))
+        elif t == '-' and e.right is None:
+            return self.is_numeric(e.left)
+        elif t in ARITHMETIC:
+            return self.is_numeric(e.left) and self.is_numeric(e.right)
+
+        return False
+
+    def numeric_names(self, program):
+        # Names that only ever hold numbers: every assignment is numeric, every
+        # loop is over a range, and the name is never a parameter or a list.
+        assigned = {}
+        excluded = set()
+
+        for e in walk(program):
+            if e.type == '=':
+                assigned.setdefault(e.left.left, []).append(e.right)
+            elif e.type == 'for':
+                var, values = e.left
+                assigned.setdefault(var.left, [])
+                if values.type != 'range':
+                    excluded.add(var.left)
+            elif e.type == 'fdef':
+                excluded.update(p.left for p in e.left.right)
+                excluded.add(e.left.left)
+            elif e.type == 'assign_item':
+                excluded.add(e.left.left)
+
+        # names that already hold something, e.g. from earlier repl lines
+        for name in assigned:
+            value = lookup(self.context, name)
+            if value is not None and type(value) not in NUMBERS:
+                excluded.add(name)
+
+        # drop names until every remaining one is only assigned numbers
+        numeric = set(assigned) - excluded
+        changed = True
+        while changed:
+            self.numeric = set(numeric)
+            changed = False
+            for name in self.numeric:
+                if not all(map(self.is_numeric, assigned[name])):
+                    numeric.discard(name)
+                    changed = True
+
+        return numeric
+
+    def fold(self, e):
+        if self.partial and e.type == 'fdef':
+            # the body runs after statements that are not part of program,
+            # which may rebind any name it reads
+            return e
+
+        e = map_children(e, self.fold)
+        t = e.type
+
+        if t == 'var' and e.right is None and self.builtin(e.left):
+            value = BUILTINS._d[e.left]
+            if type(value) in NUMBERS:
+                return Expr('literal', value)
+
+        elif t == '-' and e.right is None:
+            if constant(e.left):
+                return literal(operator.neg, e.left.left) or e
+
+        elif t in ARITHMETIC:
+            if constant(e.left) and constant(e.right):
+                return literal(BINOPS[t], e.left.left, e.right.left) or e
+            if self.is_numeric(e.left) and is_value(e.right, RIGHT_IDENTITIES.get(t)):
+                return e.left
+            if self.is_numeric(e.right) and is_value(e.left, LEFT_IDENTITIES.get(t)):
+                return e.right
+
+        elif t == 'fcall' and self.builtin(e.left):
+            f = BUILTINS._d[e.left]
+            if f in PURE_FUNCTIONS and all(map(constant, e.right)):
+                return literal(f, *[x.left for x in e.right]) or e
+
+        return e
+
+
+class Hoister:
+    # Loop-invariant code motion. An invariant numeric expression in a for body
+    # becomes `t or (t = expr)`, with t = 0 before the loop, so it is computed
+    # where it used to be on the first iteration that reaches it and read back
+    # after that. A loop that never runs, or never takes the branch, computes
+    # nothing, and errors are raised where they always were.
+    def __init__(self, folder):
+        self.folder = folder
+        self.temps = 0
+
+    def hoist(self, e):
+        if self.folder.partial and e.type == 'fdef':
+            return e
+
+        e = map_children(e, self.hoist)
+        if e.type != 'for':
+            return e
+
+        var, values = e.left
+        assigned = {var.left} | assigned_names(e.right)
+        temps = {}
+
+        def replace(e):
+            if e.type == 'fdef':
+                return e
+            if not self.invariant(e, assigned):
+                return map_children(e, replace)
+
+            key = repr(e)
+            if key not in temps:
+                temps[key] = f'licm.{self.temps}'
+                self.temps += 1
+            t = temps[key]
+            return Expr('or', Expr('var', t), Expr('=', Expr('var', t), e))
+
+        body = replace(e.right)
+        if not temps:
+            return e
+
+        init = [Expr('=', Expr('var', t), Expr('literal', 0)) for t in temps.values()]
+        return Expr('block', init + [Expr('for', [var, values], body)])
+
+    def invariant(self, e, assigned):
+        if e.type in LEAVES or not self.folder.is_numeric(e):
+            return False
+
+        nodes = list(walk(e))
+        for n in nodes:
+            if n.type not in INVARIANT:
+                return False
+            if n.type == 'var' and (n.left in assigned or n.right is not None):
+                return False
+            if n.type == 'fcall' and not self.pure(n.left):
+                return False
+
+        # cheaper to compute again than to guard
+        ops = [n for n in nodes if n.type not in LEAVES]
+        return len(ops) > 1 or any(n.type == 'fcall' for n in ops)
+
+    def pure(self, name):
+        return self.folder.builtin(name) and BUILTINS._d[name] in PURE_FUNCTIONS
+
+
+def constant(e):
+    return e.type == 'literal' and type(e.left) in NUMBERS
+
+
+def is_value(e, value):
+    return value is not None and constant(e) and e.left == value
+
+
+def literal(f, *args):
+    # None leaves the expression to be evaluated at run time, where it fails
+    # with the usual error or is too big to be worth computing up front
+    if f is operator.pow and all(type(x) is int for x in args):
+        if abs(args[1]) > MAX_EXPONENT:
+            return None
+
+    try:
+        value = f(*args)
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+
+    if type(value) not in NUMBERS:
+        return None
+
+    return Expr('literal', value)
+
+
+def bound_names(program):
+    # every name the program assigns, loops over or takes as a parameter
+    names = set(local_assignments(program))
+    for e in walk(program):
+        if e.type == 'fdef':
+            names.add(e.left.left)
+            names.update(p.left for p in e.left.right)
+            names.update(local_assignments(e.right))
+
+    return names
+
+
+def assigned_names(body):
+    # every name a loop body may rebind, including in nested function bodies
+    names = set()
+    for e in walk(body):
+        if e.type == '=':
+            names.add(e.left.left)
+        elif e.type == 'for':
+            names.add(e.left[0].left)
+        elif e.type == 'assign_item':
+            names.add(e.left.left)
+
+    return names
+
+
+def optimize(program, context=GLOBALS, partial=False):
+    # With partial, program is one of several statements run in turn, and
+    # function bodies are left as they are.
+    folder = Folder(program, context, partial)
+    return Hoister(folder).hoist(folder.fold(program))
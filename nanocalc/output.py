@@ -0,0 +1,39 @@
+import sys
+
+# Characters a Session collects before writing them out.
+OUTPUT_SIZE = 1 << 16
+
+
+class Output:
+    # Where print, write, table and friends send their text. With a size, the
+    # text is collected and written to the file in pieces of about that many
+    # characters, and whatever is left when flush is called. Without one,
+    # every piece goes to the file as it comes, like print does. A file of
+    # None means sys.stdout at the time of writing, so redirecting stdout
+    # still works.
+    def __init__(self, file=None, size=0):
+        self.file = file
+        self.size = size
+        self.parts = []
+        self.length = 0
+
+    def write(self, s):
+        if not self.size:
+            (self.file or sys.stdout).write(s)
+            return
+
+        self.parts.append(s)
+        self.length += len(s)
+        if self.length >= self.size:
+            self.drain()
+
+    def drain(self):
+        if self.parts:
+            text = ''.join(self.parts)
+            self.parts = []
+            self.length = 0
+            (self.file or sys.stdout).write(text)
+
+    def flush(self):
+        self.drain()
+        (self.file or sys.stdout).flush()
@@ -0,0 +1,382 @@
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
+import os
+import pickle
+
+from .batch import Batch
+from .common import ExprError
+from .expr import (
+    BUILTINS,
+    COMMANDS,
+    LIST_TYPES,
+    Expr,
+    children,
+    lookup,
+    reduce,
+    walk,
+)
+from .serialize import deserialize, serialize
+from .session import Session
+from . import backend
+
+# Commands that read or change state shared by all iterations of a loop.
+SHARED_COMMANDS = {'memo', 'dump'}
+
+# Work is split in more chunks than workers, so that uneven iterations even
+# out, while each chunk is still big enough to be worth sending.
+CHUNKS_PER_JOB = 4
+
+# State of a worker process, set up once by the pool initializer.
+worker = None
+
+
+def jobs_or_default(jobs):
+    return jobs or os.cpu_count() or 1
+
+
+def split(values, n):
+    size = max(1, -(-len(values) // n))
+    return [values[i : i + size] for i in range(0, len(values), size)]
+
+
+def temporary(name):
+    # loop invariants cached by the optimizer, see optimize.Hoister
+    return '.' in name
+
+
+def extras(session):
+    # builtins and commands the session has on top of the defaults
+    builtins = {
+        k: v for k, v in session.builtins._d.items() if BUILTINS._d.get(k) is not v
+    }
+    commands = {k: v for k, v in session.commands.items() if COMMANDS.get(k) is not v}
+    return builtins, commands
+
+
+class Loop:
+    # A top-level for loop whose iterations do not depend on each other:
+    # every name the body assigns is written before it is read, in the body
+    # and in the functions it calls, and nothing changes shared lists,
+    # functions or caches. Such a loop can run in chunks, one chunk per task,
+    # with the output of each chunk printed in order.
+    def __init__(self, session, program, loop):
+        self.session = session
+        self.program = program
+        self.loop = loop
+        self.var = loop.left[0].left
+        self.functions = {}
+
+    def user_function(self, name):
+        f = lookup(self.session.globals, name)
+        return getattr(f, 'fdef', None)
+
+    def independent(self):
+        values = self.loop.left[1]
+        if any(e.type == 'Inf' for e in walk(values)):
+            return False
+
+        if not self.isolated(self.loop.right, set()):
+            return False
+
+        assigned = self.assigned()
+        reads = set()
+        self.exposed(self.loop.right, {self.var}, reads)
+        return not (reads & assigned)
+
+    def isolated(self, body, seen):
+        for e in walk(body):
+            if e.type in ('fdef', 'assign_item'):
+                return False
+            if e.type == 'cmd' and e.left in SHARED_COMMANDS:
+                return False
+            if e.type == 'fcall':
+                fdef = self.user_function(e.left)
+                if fdef is not None and fdef not in seen:
+                    seen.add(fdef)
+                    if not self.isolated(fdef.right, seen):
+                        return False
+
+        return True
+
+    def assigned(self):
+        names = {self.var}
+        for e in walk(self.loop.right):
+            if e.type == '=':
+                names.add(e.left.left)
+            elif e.type == 'for':
+                names.add(e.left[0].left)
+
+        return {name for name in names if not temporary(name)}
+
+    def global_reads(self, fdef):
+        # names a function reads from the globals, including the functions
+        # it calls and their reads
+        if fdef in self.functions:
+            return self.functions[fdef]
+
+        self.functions[fdef] = set()
+        local = {p.left for p in fdef.left.right}
+        local |= {e.left.left for e in walk(fdef.right) if e.type == '='}
+        local |= {e.left[0].left for e in walk(fdef.right) if e.type == 'for'}
+
+        reads = set()
+        for e in walk(fdef.right):
+            if e.type in ('var', 'idx', 'fcall') and e.left not in local:
+                reads.add(e.left)
+            if e.type == 'fcall':
+                callee = self.user_function(e.left)
+                if callee is not None:
+                    reads |= self.global_reads(callee)
+
+        self.functions[fdef] = reads
+        return reads
+
+    def exposed(self, e, written, reads):
+        # names e reads before it has certainly assigned them; assignments in
+        # parts that may not run do not count
+        t = e.type
+        if t == 'var' and e.right is None:
+            if e.left not in written:
+                reads.add(e.left)
+        elif t == 'idx':
+            if e.left not in written:
+                reads.add(e.left)
+            self.exposed(e.right, written, reads)
+        elif t == 'fcall':
+            for a in e.right:
+                self.exposed(a, written, reads)
+            fdef = self.user_function(e.left)
+            names = {e.left} | (self.global_reads(fdef) if fdef is not None else set())
+            reads |= names - written
+        elif t == '=':
+            self.exposed(e.right, written, reads)
+            written.add(e.left.left)
+        elif t == 'for':
+            var, values = e.left
+            self.exposed(values, written, reads)
+            self.exposed(e.right, written | {var.left}, reads)
+        elif t == 'if':
+            self.exposed(e.right, written, reads)
+            self.exposed(e.left, set(written), reads)
+        elif t in ('and', 'or'):
+            self.exposed(e.left, written, reads)
+            self.exposed(e.right, set(written), reads)
+        elif t == 'cases':
+            for i, x in enumerate(e.left):
+                self.exposed(x, written if i == 0 else set(written), reads)
+        else:
+            for x in children(e):
+                self.exposed(x, written, reads)
+
+    def state(self):
+        # what a worker needs: the functions the loop calls, defined again
+        # from their nodes, and the other globals it reads
+        assigned = self.assigned()
+        reads = set()
+        self.exposed(self.loop.right, {self.var}, reads)
+
+        statements = self.program.left if self.program.type == 'stmnts' else []
+        top = {id(s) for s in statements}
+
+        fdefs = []
+        values = {}
+        for name in reads - assigned:
+            try:
+                value = self.session.globals._d[name]
+            except KeyError:
+                continue
+
+            fdef = getattr(value, 'fdef', None)
+            if fdef is not None:
+                if id(fdef) not in top:
+                    return None
+                fdefs.append(fdef)
+            elif callable(value):
+                return None
+            else:
+                values[name] = value
+
+        # functions called from functions
+        for fdef in list(fdefs):
+            for name in self.global_reads(fdef) - set(values):
+                f = self.session.globals._d.get(name)
+                if getattr(f, 'fdef', None) is not None:
+                    if id(f.fdef) not in top:
+                        return None
+                    if f.fdef not in fdefs:
+                        fdefs.append(f.fdef)
+                elif name in self.session.globals._d and not callable(f):
+                    values[name] = f
+
+        # the optimizer's cached invariants start out as they are now
+        for name, value in self.session.globals._d.items():
+            if temporary(name):
+                values[name] = value
+
+        builtins, commands = extras(self.session)
+        try:
+            return pickle.dumps(
+                (
+                    self.session.engine,
+                    backend.get_backend(),
+                    builtins,
+                    commands,
+                    values,
+                    serialize(Expr('stmnts', fdefs)),
+                    self.var,
+                    sorted(assigned),
+                    serialize(self.loop.right),
+                )
+            )
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # e.g. a lambda among the builtins, run the loop serially
+            return None
+
+
+def init_loop(data):
+    global worker
+    engine, name, builtins, commands, values, fdefs, var, assigned, body = pickle.loads(
+        data
+    )
+
+    backend.set_backend(name)
+    session = Session(engine, builtins=builtins, commands=commands)
+    session.globals._d.update(values)
+    session.run(deserialize(fdefs))
+    worker = session, var, assigned, session.compile(deserialize(body))
+
+
+def run_chunk(values):
+    session, var, assigned, body = worker
+    d = session.globals._d
+    for name in assigned:
+        d.pop(name, None)
+
+    error = None
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            for v in values:
+                d[var] = v
+                body(session.globals)
+        except (ExprError, ArithmeticError) as e:
+            # the errors a serial run reports, raised by run_loop after the
+            # output of this chunk; anything else is a bug and propagates
+            error = e
+        session.flush()
+
+    final = {k: v for k, v in d.items() if k in assigned or temporary(k)}
+    return out.getvalue(), final, error
+
+
+def run_loop(session, program, loop, jobs):
+    plan = Loop(session, program, loop)
+    data = plan.state() if plan.independent() else None
+    if data is None:
+        return session.run(loop)
+
+    values = backend.items(reduce(session.compile(loop.left[1])(session.globals)))
+    if not isinstance(values, LIST_TYPES) or len(values) < 2 * jobs:
+        # not worth starting processes for
+        body = session.compile(loop.right)
+        try:
+            for value in values:
+                session[plan.var] = value
+                body(session.globals)
+        finally:
+            session.flush()
+        return None
+
+    chunks = split(values, jobs * CHUNKS_PER_JOB)
+    pool = ProcessPoolExecutor(jobs, initializer=init_loop, initargs=(data,))
+    try:
+        for out, final, error in pool.map(run_chunk, chunks):
+            session.output.write(out)
+            session.globals._d.update(final)
+            if error is not None:
+                raise error
+    finally:
+        pool.shutdown(cancel_futures=True)
+        session.flush()
+
+    return None
+
+
+def run(session, program, jobs=None):
+    # Evaluate a program like session.run, with independent top-level for
+    # loops spread over jobs processes.
+    jobs = jobs_or_default(jobs)
+    if jobs == 1:
+        return session.run(program)
+
+    statements = program.left if program.type == 'stmnts' else [program]
+
+    result = None
+    for s in statements:
+        if s.type == 'for':
+            result = run_loop(session, program, s, jobs)
+        elif s.type == 'block' and s.left and s.left[-1].type == 'for':
+            # a loop with optimizer temporaries assigned in front of it
+            for x in s.left[:-1]:
+                session.run(x)
+            result = run_loop(session, program, s.left[-1], jobs)
+        else:
+            result = session.run(s)
+
+    return result
+
+
+def init_batch(data):
+    global worker
+    engine, name, builtins, commands, setup, expr = pickle.loads(data)
+
+    backend.set_backend(name)
+    session = Session(engine, builtins=builtins, commands=commands)
+    session.run(deserialize(setup))
+    worker = Batch(session, deserialize(expr))
+
+
+def run_batch(columns):
+    return backend.tolist(worker(columns))
+
+
+def parallel_batch(source, columns, setup='', engine='tree', jobs=None):
+    # Session(engine).batch(source)(columns) after evaluating setup, with the
+    # rows split over jobs processes
+    session = Session(engine)
+    jobs = jobs_or_default(jobs)
+    columns = {k: list(v) if isinstance(v, tuple) else v for k, v in columns.items()}
+    sizes = {len(v) for v in columns.values() if isinstance(v, LIST_TYPES)}
+    if len(sizes) != 1 or jobs == 1:
+        session.eval(setup)
+        return session.batch(source)(columns)
+
+    nchunks = len(split(range(sizes.pop()), jobs * CHUNKS_PER_JOB))
+    chunks = [{} for _ in range(nchunks)]
+    for k, v in columns.items():
+        parts = split(v, nchunks) if isinstance(v, LIST_TYPES) else [v] * nchunks
+        for chunk, part in zip(chunks, parts):
+            chunk[k] = part
+
+    builtins, commands = extras(session)
+    data = pickle.dumps(
+        (
+            engine,
+            backend.get_backend(),
+            builtins,
+            commands,
+            serialize(session.parse(setup)),
+            serialize(session.parse(source)),
+        )
+    )
+
+    result = []
+    with ProcessPoolExecutor(jobs, initializer=init_batch, initargs=(data,)) as pool:
+        for part in pool.map(run_batch, chunks):
+            result.extend(part)
+
+    if backend.enabled:
+        array = backend.as_array(result)
+        return result if array is None else array
+    return result
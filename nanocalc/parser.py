@@ -58,11 +58,32 @@ FIRST_items = FIRST_expr
 END = {';', 'eol'}
 
 
-def peek(tokens, offset=0):
-    if len(tokens) > offset:
-        return tokens[offset]
+EOF = Token(None, None)
 
-    return Token(None, None)
+
+class TokenStream:
+    def __init__(self, tokens):
+        self._tokens = tokens
+        self._pos = 0
+
+    def peek(self, offset=0):
+        i = self._pos + offset
+        if i < len(self._tokens):
+            return self._tokens[i]
+
+        return EOF
+
+    def next(self):
+        token = self.peek()
+        if token is not EOF:
+            self._pos += 1
+        return token
+
+    def __bool__(self):
+        return self._pos < len(self._tokens)
+
+    def __repr__(self):
+        return f"TokenStream({self._tokens[self._pos:self._pos + 5]}...)"
 
 
 @trace
@@ -70,14 +91,13 @@ def parse_items(tokens):
     items = []
 
     while True:
-        e, tokens = parse_expr(tokens)
-        items.append(e)
-        if peek(tokens).type == ',':
-            tokens.pop(0)
+        items.append(parse_expr(tokens))
+        if tokens.peek().type == ',':
+            tokens.next()
         else:
             break
 
-    return items, tokens
+    return items
 
 
 @trace
@@ -85,105 +105,105 @@ def parse_param_list(tokens):
     param_list = []
 
     while True:
-        p = tokens.pop(0)
+        p = tokens.next()
         if p.type != 'identifier':
             raise ParseError(f"unexpected token {p.type}")
         param_list.append(p.value)
-        if peek(tokens).type == ',':
-            tokens.pop(0)
+        if tokens.peek().type == ',':
+            tokens.next()
         else:
             break
 
-    return param_list, tokens
+    return param_list
 
 
 def parse_atom_identifier(tokens):
-    ident = tokens.pop(0)
-    if peek(tokens).type == '=':
-        tokens.pop(0)
-        expr, tokens = parse_expr(tokens)
+    ident = tokens.next()
+    if tokens.peek().type == '=':
+        tokens.next()
+        expr = parse_expr(tokens)
         var = Expr('var', ident.value)
 
-        return Expr('=', var, expr), tokens
+        return Expr('=', var, expr)
 
-    elif peek(tokens).type == '(':
-        tokens.pop(0)
-        if peek(tokens).type == ')':
+    elif tokens.peek().type == '(':
+        tokens.next()
+        if tokens.peek().type == ')':
             items = []
         else:
-            items, tokens = parse_items(tokens)
+            items = parse_items(tokens)
 
-        if peek(tokens).type != ')':
+        if tokens.peek().type != ')':
             raise ParseError("expected )")
-        tokens.pop(0)
+        tokens.next()
 
         root = Expr('fcall', ident.value, items)
 
-        if peek(tokens).type == '=':
-            tokens.pop(0)
+        if tokens.peek().type == '=':
+            tokens.next()
             root.type = 'var'
-            expr, tokens = parse_expr(tokens)
+            expr = parse_expr(tokens)
             root = Expr('fdef', root, expr)
 
-        return root, tokens
+        return root
 
-    elif peek(tokens).type == '[':
-        tokens.pop(0)
-        expr, tokens = parse_expr(tokens)
+    elif tokens.peek().type == '[':
+        tokens.next()
+        expr = parse_expr(tokens)
 
-        if peek(tokens).type != ']':
+        if tokens.peek().type != ']':
             raise ParseError("expected closing ]")
-        tokens.pop(0)
+        tokens.next()
 
         root = Expr('idx', ident.value, expr)
 
-        if peek(tokens).type == '=':
-            tokens.pop(0)
-            expr, tokens = parse_expr(tokens)
+        if tokens.peek().type == '=':
+            tokens.next()
+            expr = parse_expr(tokens)
             root = Expr('assign_item', root, expr)
 
-        return root, tokens
+        return root
 
-    return Expr('var', ident.value), tokens
+    return Expr('var', ident.value)
 
 
 @trace
 def parse_atom(tokens):
-    next = peek(tokens)
+    next = tokens.peek()
 
     if next.type == 'identifier':
         return parse_atom_identifier(tokens)
 
     if next.type == '(':
-        tokens.pop(0)
-        expr, tokens = parse_expr(tokens)
+        tokens.next()
+        expr = parse_expr(tokens)
 
-        if peek(tokens).type == ')':
-            tokens = tokens[1:]
+        if tokens.peek().type == ')':
+            tokens.next()
         else:
             raise ParseError("expected closing )")
 
-        return expr, tokens
+        return expr
 
     if next.type == '[':
-        tokens.pop(0)
-        exprs, tokens = parse_items(tokens)
-        if peek(tokens).type != ']':
+        tokens.next()
+        exprs = parse_items(tokens)
+        if tokens.peek().type != ']':
             raise ParseError('expected closing ]')
-        tokens.pop(0)
-        return Expr('list', exprs), tokens
+        tokens.next()
+        return Expr('list', exprs)
 
     if next.type == 'number':
-        next = tokens.pop(0)
-        return Expr('literal', next.value), tokens
+        next = tokens.next()
+        return Expr('literal', next.value)
 
     if next.type == 'string':
-        next = tokens.pop(0)
-        return Expr('literal', next.value), tokens
+        next = tokens.next()
+        return Expr('literal', next.value)
 
     if next.type == 'Inf':
-        next == tokens.pop(0)
-        return Expr('Inf', None), tokens
+        tokens.next()
+        return Expr('Inf', None)
 
     if next.type in FIRST_block:
         return parse_block(tokens)
@@ -193,233 +213,229 @@ def parse_atom(tokens):
 
 @trace
 def parse_factor(tokens):
-    if peek(tokens).type in ['-', '#']:
-        op = tokens.pop(0).type
-        left, tokens = parse_factor(tokens)
-        return Expr(op, left), tokens
+    if tokens.peek().type in ['-', '#']:
+        op = tokens.next().type
+        left = parse_factor(tokens)
+        return Expr(op, left)
 
-    left, tokens = parse_atom(tokens)
+    left = parse_atom(tokens)
 
-    if peek(tokens).type == '^':
-        type, tokens = tokens[0].type, tokens[1:]
-        right, tokens = parse_factor(tokens)
+    if tokens.peek().type == '^':
+        type = tokens.next().type
+        right = parse_factor(tokens)
         left = Expr(type, left, right)
 
-    return left, tokens
+    return left
 
 
 @trace
 def parse_term(tokens):
-    left, tokens = parse_factor(tokens)
+    left = parse_factor(tokens)
 
-    while tokens and tokens[0].type in ['*', '/', '%']:
-        type, tokens = tokens[0].type, tokens[1:]
-        right, tokens = parse_factor(tokens)
+    while tokens.peek().type in ['*', '/', '%']:
+        type = tokens.next().type
+        right = parse_factor(tokens)
         left = Expr(type, left, right)
 
-    return left, tokens
+    return left
 
 
 @trace
 def parse_expr(tokens):
-    left, tokens = parse_disj(tokens)
+    left = parse_disj(tokens)
 
-    if peek(tokens).type == '..':
-        tokens.pop(0)
-        right, tokens = parse_disj(tokens)
+    if tokens.peek().type == '..':
+        tokens.next()
+        right = parse_disj(tokens)
 
-        if peek(tokens).type == '..':
-            tokens.pop(0)
-            if peek(tokens).type == '+':
-                tokens.pop(0)
+        if tokens.peek().type == '..':
+            tokens.next()
+            if tokens.peek().type == '+':
+                tokens.next()
                 type = 'incr'
             else:
                 type = 'count'
-            step, tokens = parse_disj(tokens)
+            step = parse_disj(tokens)
             left = [left, right]
             right = [step, type]
 
         left = Expr('range', left, right)
 
-    return left, tokens
+    return left
 
 
 @trace
 def parse_disj(tokens):
-    left, tokens = parse_conj(tokens)
+    left = parse_conj(tokens)
 
-    while tokens and peek(tokens).type == 'or':
-        type = tokens.pop(0).type
-        right, tokens = parse_conj(tokens)
+    while tokens.peek().type == 'or':
+        type = tokens.next().type
+        right = parse_conj(tokens)
         left = Expr(type, left, right)
 
-    return left, tokens
+    return left
 
 
 @trace
 def parse_conj(tokens):
-    left, tokens = parse_neg(tokens)
+    left = parse_neg(tokens)
 
-    while tokens and peek(tokens).type == 'and':
-        type = tokens.pop(0).type
-        right, tokens = parse_neg(tokens)
+    while tokens.peek().type == 'and':
+        type = tokens.next().type
+        right = parse_neg(tokens)
         left = Expr(type, left, right)
 
-    return left, tokens
+    return left
 
 
 @trace
 def parse_neg(tokens):
-    if peek(tokens).type == 'not':
-        tokens.pop(0)
-        left, tokens = parse_neg(tokens)
-        return Expr('not', left), tokens
+    if tokens.peek().type == 'not':
+        tokens.next()
+        left = parse_neg(tokens)
+        return Expr('not', left)
 
     return parse_comp(tokens)
 
 
 @trace
 def parse_comp(tokens):
-    left, tokens = parse_sum(tokens)
+    left = parse_sum(tokens)
     exprs = []
-    while peek(tokens).type in ['<', '>', '<=', '>=', '==', '!=']:
-        op = tokens.pop(0)
-        right, tokens = parse_sum(tokens)
+    while tokens.peek().type in ['<', '>', '<=', '>=', '==', '!=']:
+        op = tokens.next()
+        right = parse_sum(tokens)
         expr = Expr(op.type, right)
         exprs.append(expr)
 
     if len(exprs) < 1:
-        return left, tokens
+        return left
     elif len(exprs) == 1:
         (expr,) = exprs
-        return Expr(expr.type, left, expr.left), tokens
+        return Expr(expr.type, left, expr.left)
 
-    root = Expr('lchain', left, exprs)
-
-    return root, tokens
+    return Expr('lchain', left, exprs)
 
 
 @trace
 def parse_sum(tokens):
-    left, tokens = parse_term(tokens)
+    left = parse_term(tokens)
 
-    while tokens and tokens[0].type in ['+', '-']:
-        type, tokens = tokens[0].type, tokens[1:]
-        right, tokens = parse_term(tokens)
+    while tokens.peek().type in ['+', '-']:
+        type = tokens.next().type
+        right = parse_term(tokens)
         left = Expr(type, left, right)
 
-    return left, tokens
+    return left
 
 
 @trace
 def parse_block(tokens):
-    if peek(tokens).type != '{':
+    if tokens.peek().type != '{':
         raise ParseError("expected {")
-    tokens.pop(0)
+    tokens.next()
 
-    while peek(tokens).type == 'eol':
-        tokens.pop(0)
+    while tokens.peek().type == 'eol':
+        tokens.next()
 
-    if peek(tokens).type == '}':
-        tokens.pop(0)
-        return Expr('block', []), tokens
+    if tokens.peek().type == '}':
+        tokens.next()
+        return Expr('block', [])
 
-    block, tokens = parse_stmnts(tokens)
+    block = parse_stmnts(tokens)
 
     if block.left[0].type == 'if':
         block.type = 'cases'
     else:
         block.type = 'block'
 
-    while peek(tokens).type == 'eol':
-        tokens.pop(0)
+    while tokens.peek().type == 'eol':
+        tokens.next()
 
-    if peek(tokens).type != '}':
+    if tokens.peek().type != '}':
         raise ParseError('expected }')
-    tokens.pop(0)
+    tokens.next()
 
-    return block, tokens
+    return block
 
 
 @trace
 def parse_stmnt(tokens):
-    if peek(tokens).type == 'for':
-        tokens.pop(0)
+    if tokens.peek().type == 'for':
+        tokens.next()
 
-        if peek(tokens).type != 'identifier':
+        if tokens.peek().type != 'identifier':
             raise ParseError("expected identifier")
-        ident = Expr('var', tokens.pop(0).value)
+        ident = Expr('var', tokens.next().value)
 
-        if peek(tokens).type != 'in':
+        if tokens.peek().type != 'in':
             raise ParseError("expected 'in'")
-        tokens.pop(0)
+        tokens.next()
 
-        expr, tokens = parse_expr(tokens)
+        expr = parse_expr(tokens)
 
-        if peek(tokens).type == 'eol':
-            tokens.pop(0)
+        if tokens.peek().type == 'eol':
+            tokens.next()
 
-        body, tokens = parse_stmnt(tokens)
+        body = parse_stmnt(tokens)
 
-        return Expr('for', [ident, expr], body), tokens
+        return Expr('for', [ident, expr], body)
 
-    elif peek(tokens).type == 'command':
-        left = tokens.pop(0)
+    elif tokens.peek().type == 'command':
+        left = tokens.next()
         args = []
-        while peek(tokens).type in FIRST_expr:
-            arg, tokens = parse_expr(tokens)
-            args.append(arg)
+        while tokens.peek().type in FIRST_expr:
+            args.append(parse_expr(tokens))
 
-        return Expr('cmd', left.value, args), tokens
+        return Expr('cmd', left.value, args)
 
-    stmnt, tokens = parse_expr(tokens)
+    stmnt = parse_expr(tokens)
 
-    if peek(tokens).type == 'if':
-        tokens.pop(0)
-        expr, tokens = parse_expr(tokens)
+    if tokens.peek().type == 'if':
+        tokens.next()
+        expr = parse_expr(tokens)
         stmnt = Expr('if', stmnt, expr)
 
-    return stmnt, tokens
+    return stmnt
 
 
 @trace
 def parse_stmnts(tokens):
-    stmnt, tokens = parse_stmnt(tokens)
-
-    stmnts = [stmnt]
-    while peek(tokens).type in END:
-        tokens.pop(0)
-        if peek(tokens).type in FIRST_stmnt:
-            stmnt, tokens = parse_stmnt(tokens)
-            stmnts.append(stmnt)
-        elif peek(tokens).type in END:
+    stmnts = [parse_stmnt(tokens)]
+
+    while tokens.peek().type in END:
+        tokens.next()
+        if tokens.peek().type in FIRST_stmnt:
+            stmnts.append(parse_stmnt(tokens))
+        elif tokens.peek().type in END:
             continue
         else:
             break
 
-    return Expr('stmnts', stmnts), tokens
+    return Expr('stmnts', stmnts)
 
 
 @trace
 def parse_program(tokens):
-    while peek(tokens).type == 'eol':
-        tokens.pop(0)
+    while tokens.peek().type == 'eol':
+        tokens.next()
 
-    if peek(tokens).type in FIRST_stmnts:
-        stmnts, tokens = parse_stmnts(tokens)
+    if tokens.peek().type in FIRST_stmnts:
+        stmnts = parse_stmnts(tokens)
     else:
         stmnts = Expr('stmnts', [])
 
-    while peek(tokens).type == 'eol':
-        tokens.pop(0)
+    while tokens.peek().type == 'eol':
+        tokens.next()
 
-    return stmnts, tokens
+    return stmnts
 
 
 def parse(tokens):
-    root, tokens = parse_program(tokens)
+    tokens = TokenStream(tokens)
+    root = parse_program(tokens)
 
     if tokens:
-        raise ParseError(f"unexpected tokens: {tokens[0]}")
+        raise ParseError(f"unexpected tokens: {tokens.peek()}")
 
     return root
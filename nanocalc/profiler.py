@@ -0,0 +1,204 @@
+import bisect
+import time
+from collections import defaultdict
+
+from .expr import Expr, children, walk
+
+# Tokens that become exactly one node each, in the order walk visits them.
+ANCHOR_TOKENS = {'identifier', 'number', 'string', 'command', 'Inf'}
+
+
+def anchor(e):
+    if e.type in ('var', 'fcall', 'idx', 'cmd'):
+        return isinstance(e.left, str)
+    return e.type in ('literal', 'Inf')
+
+
+def locate(program, tokens, offsets, source):
+    # Map the nodes of a freshly parsed program to (line, column), both
+    # counting from 1. Nodes keep no positions, so line up the anchor tokens
+    # with the anchor nodes instead; any other node starts where its first
+    # anchor does. A tree that does not line up, e.g. an optimized one, gets
+    # no positions at all.
+    starts = [o for t, o in zip(tokens, offsets) if t.type in ANCHOR_TOKENS]
+    nodes = list(walk(program))
+    anchors = [e for e in nodes if anchor(e)]
+    if len(anchors) != len(starts):
+        return {}
+
+    offset = dict(zip(anchors, starts))
+    for e in reversed(nodes):
+        if e not in offset:
+            for c in children(e):
+                if c in offset:
+                    offset[e] = offset[c]
+                    break
+
+    lines = [0] + [i + 1 for i, c in enumerate(source) if c == '\n']
+    positions = {}
+    for e, o in offset.items():
+        line = bisect.bisect_right(lines, o)
+        positions[e] = (line, o - lines[line - 1] + 1)
+    return positions
+
+
+def label(e):
+    if anchor(e) and e.type != 'literal':
+        return f'{e.type} {e.left}'
+    elif e.type == 'literal':
+        return f'literal {e.left!r}'
+    elif e.type in ('=', 'fdef'):
+        return f'{e.type} {e.left.left}'
+    return str(e.type)
+
+
+class Profiler:
+    # Counts and times every node the tree engine evaluates, while in a with
+    # block. Expr._eval and Expr._tail are replaced by timed versions for the
+    # duration, so nothing is slower outside of it; as that is a change to
+    # the class, profile one program at a time.
+    #
+    # For each node it keeps [calls, total, self], where total is the time
+    # from entering the node to leaving it, counted once for a node that
+    # recurses into itself, and self is total less the time spent in the
+    # nodes it evaluated. Function bodies and commands are also frames of
+    # the stacks in folded, which maps 'a;b;c' to the self time spent there.
+    def __init__(self, program, positions=None):
+        self.positions = positions or {}
+        self.stats = {}
+        self.folded = defaultdict(float)
+        self.functions = {}
+        self.frames = {}
+        for e in walk(program):
+            if e.type == 'fdef':
+                self.functions[e.right] = e.left.left
+                self.frames[e.right] = e.left.left
+            elif e.type == 'cmd':
+                self.frames[e] = e.left
+
+    def __enter__(self):
+        self.saved = Expr._eval, Expr._tail
+        Expr._eval, Expr._tail = self.instrument(*self.saved)
+        return self
+
+    def __exit__(self, *exc):
+        Expr._eval, Expr._tail = self.saved
+
+    def instrument(self, _eval, _tail):
+        stats = self.stats
+        folded = self.folded
+        frames = self.frames
+        clock = time.perf_counter
+        active = defaultdict(int)
+        # the node being evaluated, how it was entered and the time spent in
+        # its children so far
+        nodes = [None]
+        tails = [False]
+        inner = [0.0]
+        path = ['<program>']
+
+        def timed(method, tail, node, context):
+            frame = frames.get(node)
+            if frame is not None:
+                path.append(f'{path[-1]};{frame}')
+            active[node] += 1
+            nodes.append(node)
+            tails.append(tail)
+            inner.append(0.0)
+            t0 = clock()
+            try:
+                return method(node, context)
+            finally:
+                elapsed = clock() - t0
+                own = elapsed - inner.pop()
+                inner[-1] += elapsed
+                nodes.pop()
+                tails.pop()
+                active[node] -= 1
+
+                s = stats.get(node)
+                if s is None:
+                    s = stats[node] = [0, 0.0, 0.0]
+                s[0] += 1
+                if not active[node]:
+                    s[1] += elapsed
+                s[2] += own
+
+                folded[path[-1]] += own
+                if frame is not None:
+                    path.pop()
+
+        def eval(node, context):
+            if nodes[-1] is node and tails[-1]:
+                # _tail handing a node over to _eval, already counted
+                return _eval(node, context)
+            return timed(_eval, False, node, context)
+
+        def tail(node, context):
+            return timed(_tail, True, node, context)
+
+        return eval, tail
+
+    def where(self, e):
+        if e not in self.positions:
+            return '-'
+        line, col = self.positions[e]
+        return f'{line}:{col}'
+
+    def hot(self, n=20):
+        # the n nodes with the most self time
+        stats = sorted(self.stats.items(), key=lambda x: x[1][2], reverse=True)
+        return stats[:n]
+
+    def grouped(self, names):
+        groups = {}
+        for e, name in names.items():
+            s = self.stats.get(e)
+            if s is None:
+                continue
+            g = groups.setdefault(name, [0, 0.0, 0.0])
+            g[0] += s[0]
+            g[1] += s[1]
+        for stack, t in self.folded.items():
+            name = stack.rsplit(';', 1)[-1]
+            if name in groups:
+                groups[name][2] += t
+        return sorted(groups.items(), key=lambda x: x[1][1], reverse=True)
+
+    def function_stats(self):
+        return self.grouped(self.functions)
+
+    def command_stats(self):
+        commands = {e: n for e, n in self.frames.items() if e not in self.functions}
+        return self.grouped(commands)
+
+    def report(self, file, n=20):
+        total = sum(self.folded.values())
+        calls = sum(s[0] for s in self.stats.values())
+        print(f'{calls} node evaluations in {total:.6f}s', file=file)
+
+        header = f"{'calls':>9} {'total':>10} {'self':>10}"
+        print(f"\n{header}  {'line:col':<9} node", file=file)
+        for e, (count, cumulative, own) in self.hot(n):
+            print(
+                f'{count:>9} {cumulative:>10.6f} {own:>10.6f}  '
+                f'{self.where(e):<9} {label(e)}',
+                file=file,
+            )
+
+        for title, groups in (
+            ('function', self.function_stats()),
+            ('command', self.command_stats()),
+        ):
+            if groups:
+                print(f'\n{header}  {title}', file=file)
+            for name, (count, cumulative, own) in groups:
+                print(f'{count:>9} {cumulative:>10.6f} {own:>10.6f}  {name}', file=file)
+
+    def write_folded(self, file):
+        # one 'frame;frame;frame microseconds' line per stack, as read by
+        # flamegraph.pl and speedscope
+        for stack, t in sorted(self.folded.items()):
+            us = round(t * 1e6)
+            if us > 0:
+                print(f'{stack} {us}', file=file)
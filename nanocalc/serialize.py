@@ -0,0 +1,248 @@
+import array
+import gc
+import struct
+import sys
+import zlib
+
+from .common import FormatError
+from .expr import Expr
+
+# Layout, all integers little endian:
+#
+#   magic, version
+#   strings: count, byte length of each, utf-8 text
+#   constants: count, then a tag and a value each
+#   table: count, then the type, left and right columns
+#   items: the members of every list in the table
+#
+# Everything after the version is zlib compressed. The table holds the nodes
+# and lists of the program children first, so it loads in one pass and the
+# program is the last entry. Values are referred to by index << 2 | kind,
+# where the index of another entry is negative and counts back from the
+# referring one: nearby children give small numbers that compress well. An
+# entry with the type OBJECT is a list, whose left and right are the offset
+# and length of its items.
+MAGIC = b'NCAST'
+VERSION = 1
+
+NONE, OBJECT, STRING, CONSTANT = range(4)
+
+HEADER = struct.Struct('<5sB')
+COUNT = struct.Struct('<Q')
+INT = struct.Struct('<q')
+FLOAT = struct.Struct('<d')
+
+# item sizes of the array type codes on the platforms CPython supports
+WIDTHS = {'b': 1, 'h': 2, 'i': 4, 'q': 8}
+
+
+class Writer:
+    def __init__(self):
+        self.refs = {}
+        self.strings = {}
+        self.constants = {}
+        self.types = []
+        self.lefts = []
+        self.rights = []
+        self.items = []
+
+    def ref(self, value):
+        if value is None:
+            return NONE
+        elif type(value) is str:
+            index = self.strings.setdefault(value, len(self.strings))
+            return index << 2 | STRING
+        elif type(value) in (Expr, list):
+            return (self.refs[id(value)] - len(self.types)) << 2 | OBJECT
+        elif type(value) in (int, float, bool):
+            # repr tells 1, 1.0, True and -0.0, 0.0 apart
+            key = (type(value), repr(value))
+            index = self.constants.setdefault(key, (len(self.constants), value))[0]
+            return index << 2 | CONSTANT
+
+        raise FormatError(f"can not serialize a {type(value).__name__}")
+
+    def add(self, obj):
+        if type(obj) is list:
+            refs = [OBJECT, len(self.items), len(obj)]
+            self.items.extend(map(self.ref, obj))
+        else:
+            refs = [self.ref(obj.type), self.ref(obj.left), self.ref(obj.right)]
+
+        self.refs[id(obj)] = len(self.types)
+        self.types.append(refs[0])
+        self.lefts.append(refs[1])
+        self.rights.append(refs[2])
+
+    def write(self, root):
+        # children before parents, without recursing on deep trees
+        stack = [(root, False)]
+        while stack:
+            obj, ready = stack.pop()
+            if id(obj) in self.refs:
+                continue
+            if ready:
+                self.add(obj)
+                continue
+
+            stack.append((obj, True))
+            members = reversed(obj) if type(obj) is list else (obj.right, obj.left)
+            for x in members:
+                if type(x) in (Expr, list) and id(x) not in self.refs:
+                    stack.append((x, False))
+
+
+def pack(values):
+    top = max(max(values, default=0), ~min(values, default=0))
+    for code, width in WIDTHS.items():
+        if top < 1 << 8 * width - 1:
+            break
+
+    a = array.array(code, values)
+    if sys.byteorder == 'big':
+        a.byteswap()
+
+    return code.encode() + COUNT.pack(len(a)) + a.tobytes()
+
+
+def unpack(data, offset):
+    code = chr(data[offset])
+    if code not in WIDTHS:
+        raise FormatError(f"bad column type {code!r}")
+
+    (n,) = COUNT.unpack_from(data, offset + 1)
+    start = offset + 1 + COUNT.size
+    end = start + n * WIDTHS[code]
+
+    a = array.array(code)
+    a.frombytes(data[start:end])
+    if len(a) != n:
+        raise FormatError("truncated column")
+    if sys.byteorder == 'big':
+        a.byteswap()
+
+    return a, end
+
+
+def pack_constant(value):
+    if type(value) is bool:
+        return b'T' if value else b'F'
+    elif type(value) is float:
+        return b'f' + FLOAT.pack(value)
+    elif -(1 << 63) <= value < 1 << 63:
+        return b'i' + INT.pack(value)
+
+    n = (value.bit_length() + 8) // 8
+    return b'n' + COUNT.pack(n) + value.to_bytes(n, 'little', signed=True)
+
+
+def unpack_constant(data, offset):
+    tag = data[offset : offset + 1]
+    offset += 1
+    if tag == b'T':
+        return True, offset
+    elif tag == b'F':
+        return False, offset
+    elif tag == b'f':
+        return FLOAT.unpack_from(data, offset)[0], offset + FLOAT.size
+    elif tag == b'i':
+        return INT.unpack_from(data, offset)[0], offset + INT.size
+    elif tag == b'n':
+        (n,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        value = int.from_bytes(data[offset : offset + n], 'little', signed=True)
+        return value, offset + n
+
+    raise FormatError(f"bad constant tag {tag!r}")
+
+
+def serialize(program, level=6):
+    w = Writer()
+    w.write(program)
+
+    strings = [s.encode() for s in w.strings]
+    constants = sorted(w.constants.values())
+
+    body = b''.join(
+        [
+            pack([len(s) for s in strings]),
+            b''.join(strings),
+            COUNT.pack(len(constants)),
+            *(pack_constant(value) for _, value in constants),
+            pack(w.types),
+            pack(w.lefts),
+            pack(w.rights),
+            pack(w.items),
+        ]
+    )
+
+    return HEADER.pack(MAGIC, VERSION) + zlib.compress(body, level)
+
+
+def deserialize(data):
+    try:
+        magic, version = HEADER.unpack_from(data)
+    except struct.error:
+        raise FormatError("truncated header")
+    if magic != MAGIC:
+        raise FormatError("not a serialized program")
+    if version != VERSION:
+        raise FormatError(f"unsupported format version {version}")
+
+    try:
+        body = zlib.decompress(data[HEADER.size :])
+    except zlib.error as e:
+        raise FormatError(f"corrupt data: {e}")
+
+    try:
+        return load(body)
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise FormatError(f"corrupt data: {e}")
+
+
+def load(body):
+    lengths, offset = unpack(body, 0)
+    strings = []
+    for n in lengths:
+        strings.append(body[offset : offset + n].decode())
+        offset += n
+
+    (n,) = COUNT.unpack_from(body, offset)
+    offset += COUNT.size
+    constants = []
+    for _ in range(n):
+        value, offset = unpack_constant(body, offset)
+        constants.append(value)
+
+    types, offset = unpack(body, offset)
+    lefts, offset = unpack(body, offset)
+    rights, offset = unpack(body, offset)
+    items, offset = unpack(body, offset)
+
+    objects = []
+    tables = ([None], objects, strings, constants)
+    append = objects.append
+
+    # as in pickle, collections while the tree is built find nothing
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for t, left, right in zip(types, lefts, rights):
+            if t == OBJECT:
+                append([tables[x & 3][x >> 2] for x in items[left : left + right]])
+            else:
+                append(
+                    Expr(
+                        tables[t & 3][t >> 2],
+                        tables[left & 3][left >> 2],
+                        tables[right & 3][right >> 2],
+                    )
+                )
+    finally:
+        if enabled:
+            gc.enable()
+
+    if not objects or type(objects[-1]) is not Expr:
+        raise FormatError("no program")
+
+    return objects[-1]
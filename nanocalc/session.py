@@ -0,0 +1,97 @@
+from .batch import Batch
+from .codegen import compile_python
+from .common import EvalError
+from .compiler import compile
+from .expr import BUILTINS, COMMANDS, Context, reduce
+from .lexer import tokenize
+from .optimize import optimize
+from .output import OUTPUT_SIZE, Output
+from .parser import parse
+from .stack import compile_stack
+from .stream import statements
+from .vm import compile_vm
+
+ENGINES = {
+    'tree': lambda program: program.eval,
+    'closure': compile,
+    'python': compile_python,
+    'stack': compile_stack,
+    'vm': compile_vm,
+}
+
+
+class Session:
+    # An interpreter with its own globals, builtins and commands. Nothing it
+    # evaluates touches GLOBALS or another session, so separate sessions can
+    # be used from separate threads. One session is not meant to be shared by
+    # threads running at the same time.
+    #
+    # What it prints is collected in output, up to output_size characters,
+    # and written to file (sys.stdout by default) in one go when it is full,
+    # when a run ends and on flush.
+    def __init__(
+        self,
+        engine='tree',
+        optimize=False,
+        builtins=None,
+        commands=None,
+        file=None,
+        output_size=OUTPUT_SIZE,
+    ):
+        if engine not in ENGINES:
+            raise EvalError(f"unknown engine: {engine}")
+
+        self.engine = engine
+        self.optimize = optimize
+        self.commands = COMMANDS | (commands or {})
+        self.output = Output(file, output_size)
+        self.builtins = Context(BUILTINS._d | (builtins or {}), ro=True)
+        self.globals = Context(
+            {}, parent=self.builtins, commands=self.commands, output=self.output
+        )
+
+    def parse(self, source):
+        # a later eval may rebind what a function defined here reads
+        program = parse(tokenize(source, self.commands))
+        if self.optimize:
+            program = optimize(program, self.globals, partial=True)
+        return program
+
+    def statements(self, lines):
+        # parse lines one statement at a time, as they are read, see stream
+        for program in statements(lines, self.commands):
+            if self.optimize:
+                program = optimize(program, self.globals, partial=True)
+            yield program
+
+    def compile(self, program):
+        return ENGINES[self.engine](program)
+
+    def run(self, program):
+        try:
+            return reduce(self.compile(program)(self.globals))
+        finally:
+            self.output.flush()
+
+    def flush(self):
+        self.output.flush()
+
+    def eval(self, source):
+        return self.run(self.parse(source))
+
+    def batch(self, source):
+        # evaluate source for many bindings at once, see Batch
+        return Batch(self, self.parse(source))
+
+    def __getitem__(self, name):
+        return self.globals[name]
+
+    def __setitem__(self, name, value):
+        self.globals[name] = value
+
+    def __contains__(self, name):
+        try:
+            self.globals[name]
+        except EvalError:
+            return False
+        return True
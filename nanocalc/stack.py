@@ -0,0 +1,465 @@
+from functools import partial
+import operator
+import types
+
+from .backend import items, truth
+from .common import EvalError
+from .compiler import Thunk
+from .expr import (
+    BINOPS,
+    COMPARISONS,
+    GLOBALS,
+    SEQUENCE_TYPES,
+    Context,
+    all_reduce,
+    assign_item,
+    binop_reduce,
+    command,
+    func_reduce,
+    index_reduce,
+    literal_list,
+    range_reduce,
+    reduce,
+    slice_operands,
+    slice_reduce,
+    slice_view,
+    tail_case,
+    unop_reduce,
+)
+
+# An evaluator that walks the tree with a stack of work instead of recursing,
+# so that the depth of a program, like a+b+c+... thousands of terms long, or
+# of the recursion of its functions, is only limited by memory.
+#
+# Work items are (step, arg) pairs. A step either visits a node, pushing the
+# work that evaluates it, or finishes one, popping the values of its operands
+# from the value stack and pushing its own. Calls to functions defined by
+# this evaluator run on the same stacks, with the caller's context restored
+# by a step pushed under the body. A call in tail position finds that step on
+# top already and does not push another one, so that tail recursion runs in
+# constant space as well.
+
+
+class Machine:
+    __slots__ = ('work', 'values', 'context')
+
+    def __init__(self, context):
+        self.work = []
+        self.values = []
+        self.context = context
+
+    def run(self, e):
+        work = self.work
+        work.append((visit, e))
+        while work:
+            step, arg = work.pop()
+            step(self, arg)
+        return self.values.pop()
+
+
+def evaluate(e, context=GLOBALS):
+    return Machine(context).run(e)
+
+
+def define(e, context):
+    plist = e.left.right
+    body = e.right
+
+    def f(*args):
+        ctx = Context({p.left: a for p, a in zip(plist, args)}, parent=context)
+        return evaluate(body, ctx)
+
+    f.fdef = e
+    # calls from this evaluator run the body in place, see call
+    f.context = context
+    return f
+
+
+def pop(m, n):
+    if not n:
+        return []
+    values = m.values[-n:]
+    del m.values[-n:]
+    return values
+
+
+def visit(m, e):
+    VISITORS.get(e.type, visit_unknown)(m, e)
+
+
+def visit_unknown(m, e):
+    raise EvalError(f"unknown expression type: {e.type}")
+
+
+def visit_passthrough(m, e):
+    m.work.append((visit, e.left))
+
+
+def visit_stmnts(m, e):
+    if not e.left:
+        m.values.append(None)
+        return
+
+    work = m.work
+    work.append((visit, e.left[-1]))
+    for s in reversed(e.left[:-1]):
+        work.append((drop, None))
+        work.append((visit, s))
+
+
+def drop(m, arg):
+    m.values.pop()
+
+
+def visit_literal(m, e):
+    m.values.append(e.left)
+
+
+def visit_binop(m, e):
+    if e.type == '-' and e.right is None:
+        m.work.append((finish_neg, e))
+        m.work.append((visit, e.left))
+        return
+
+    m.work.append((finish_binop, e))
+    m.work.append((visit, e.right))
+    m.work.append((visit, e.left))
+
+
+def finish_neg(m, e):
+    m.values.append(unop_reduce(operator.neg, m.context, m.values.pop()))
+
+
+def finish_binop(m, e):
+    right = m.values.pop()
+    left = m.values.pop()
+    m.values.append(binop_reduce(BINOPS[e.type], m.context, left, right))
+
+
+def visit_len(m, e):
+    m.work.append((finish_len, e))
+    m.work.append((visit, e.left))
+
+
+def finish_len(m, e):
+    m.values.append(len(reduce(m.values.pop())))
+
+
+def visit_fcall(m, e):
+    m.values.append(m.context[e.left])
+    m.work.append((finish_fcall, e))
+    for p in reversed(e.right):
+        m.work.append((visit, p))
+
+
+def finish_fcall(m, e):
+    args = pop(m, len(e.right))
+    f = m.values.pop()
+
+    context = getattr(f, 'context', None)
+    if context is None or any(isinstance(x, SEQUENCE_TYPES) for x in args):
+        m.values.append(func_reduce(f, m.context, *args))
+        return
+
+    work = m.work
+    if not work or work[-1][0] is not restore:
+        work.append((restore, m.context))
+    plist = f.fdef.left.right
+    m.context = Context({p.left: a for p, a in zip(plist, args)}, parent=context)
+    work.append((visit, f.fdef.right))
+
+
+def restore(m, context):
+    m.context = context
+
+
+def visit_var(m, e):
+    m.values.append(m.context[e.left])
+
+
+def visit_assign(m, e):
+    m.work.append((finish_assign, e))
+    m.work.append((visit, e.right))
+
+
+def finish_assign(m, e):
+    value = m.values[-1]
+    if isinstance(value, types.GeneratorType):
+        value = m.values[-1] = list(value)
+    m.context[e.left.left] = value
+
+
+def visit_fdef(m, e):
+    if not all(map(lambda p: p.type == 'var', e.left.right)):
+        raise EvalError("expected parameter names")
+
+    m.context._globals[e.left.left] = define(e, m.context)
+    m.values.append(None)
+
+
+def visit_cmd(m, e):
+    # commands evaluate their arguments themselves, with this evaluator
+    params = [Thunk(partial(evaluate, p), p) for p in e.right]
+    m.values.append(command(m.context, e.left)(m.context, *params))
+
+
+def visit_range(m, e):
+    if isinstance(e.left, list):
+        operands = [e.right[0], e.left[0], e.left[1]]
+    else:
+        operands = [e.left, e.right]
+
+    if operands[-1].type == 'Inf':
+        operands.pop()
+
+    m.work.append((finish_range, e))
+    for x in reversed(operands):
+        m.work.append((visit, x))
+
+
+def finish_range(m, e):
+    if isinstance(e.left, list):
+        right, type = e.left[1], e.right[1]
+        values = pop(m, 3 if right.type != 'Inf' else 2)
+    else:
+        right, type = e.right, 'count'
+        values = ['auto'] + pop(m, 2 if right.type != 'Inf' else 1)
+
+    if right.type == 'Inf':
+        step, left = values
+        m.values.append(range_reduce(left, None, step, type, infinite=True))
+    else:
+        step, left, right = values
+        m.values.append(range_reduce(left, right, step, type))
+
+
+def visit_list(m, e):
+    m.work.append((finish_list, e))
+    for x in reversed(e.left):
+        m.work.append((visit, x))
+
+
+def finish_list(m, e):
+    m.values.append([reduce(v) for v in pop(m, len(e.left))])
+
+
+def visit_if(m, e):
+    c = e.right
+    if c.type in COMPARISONS and c.left.type == 'idx':
+        if literal_list(c.right) is not None:
+            # var[a..b] == [1, 0, 1] without building either list
+            m.work.append((finish_if_view, e))
+            visit_idx(m, c.left, slice_view)
+            return
+
+    m.work.append((finish_if, e))
+    m.work.append((visit, c))
+
+
+def finish_if_view(m, e):
+    c = e.right
+    a = m.values.pop()
+    branch(m, e, all_reduce(BINOPS[c.type], m.context, a, literal_list(c.right)))
+
+
+def finish_if(m, e):
+    cond = m.values.pop()
+    if isinstance(cond, SEQUENCE_TYPES):
+        cond = all(cond)
+    branch(m, e, cond)
+
+
+def branch(m, e, cond):
+    if cond:
+        m.work.append((visit, e.left))
+    else:
+        m.values.append(None)
+
+
+def visit_cases(m, e):
+    if not e.left:
+        m.values.append(None)
+        return
+
+    visit_case(m, e, 0)
+
+
+def visit_case(m, e, i):
+    # The value of the last case, or of one followed by nothing but nil, is
+    # the value of the cases, so nothing needs to look at it afterwards.
+    cases = e.left
+    last = i == len(cases) - 1
+    if not last and i == tail_case(cases):
+        last = all(
+            x.type == 'literal' or m.context[x.left] is None for x in cases[i + 1 :]
+        )
+
+    if not last:
+        m.work.append((finish_case, (e, i)))
+    m.work.append((visit, cases[i]))
+
+
+def finish_case(m, arg):
+    if m.values[-1] is None:
+        e, i = arg
+        m.values.pop()
+        visit_case(m, e, i + 1)
+
+
+def visit_or(m, e):
+    m.work.append((finish_or, e))
+    m.work.append((visit, e.left))
+
+
+def finish_or(m, e):
+    if not truth(m.values[-1]):
+        m.values.pop()
+        m.work.append((visit, e.right))
+
+
+def visit_and(m, e):
+    m.work.append((finish_and, e))
+    m.work.append((visit, e.left))
+
+
+def finish_and(m, e):
+    if truth(m.values[-1]):
+        m.values.pop()
+        m.work.append((visit, e.right))
+
+
+def visit_not(m, e):
+    m.work.append((finish_not, e))
+    m.work.append((visit, e.left))
+
+
+def finish_not(m, e):
+    m.values[-1] = not truth(m.values[-1])
+
+
+def visit_idx(m, e, slice=slice_reduce):
+    bounds = slice_operands(e.right) if e.right.type == 'range' else None
+    if bounds is None:
+        m.work.append((finish_idx, e))
+        m.work.append((visit, e.right))
+        return
+
+    lo, hi, step = bounds
+    operands = [lo, hi] if step is None else [step, lo, hi]
+    m.work.append((finish_slice, (e, slice, step is not None)))
+    for x in reversed(operands):
+        m.work.append((visit, x))
+
+
+def finish_idx(m, e):
+    idx = m.values.pop()
+    m.values.append(index_reduce(m.context[e.left], idx))
+
+
+def finish_slice(m, arg):
+    e, slice, stepped = arg
+    if stepped:
+        step, left, right = pop(m, 3)
+    else:
+        step = None
+        left, right = pop(m, 2)
+    m.values.append(slice(m.context[e.left], left, right, step))
+
+
+def visit_assign_item(m, e):
+    m.work.append((finish_assign_item, e))
+    m.work.append((visit, e.right))
+    m.work.append((visit, e.left.right))
+
+
+def finish_assign_item(m, e):
+    idx, value = pop(m, 2)
+    vname = e.left.left
+    assign_item(m.context, vname, m.context[vname], idx, value)
+    m.values.append(value)
+
+
+def visit_lchain(m, e):
+    m.work.append((start_lchain, e))
+    m.work.append((visit, e.left))
+
+
+def start_lchain(m, e):
+    left = m.values.pop()
+    m.work.append((finish_link, (e, 0, True, left)))
+    m.work.append((visit, e.right[0].left))
+
+
+def finish_link(m, arg):
+    e, i, result, left = arg
+    rhs = e.right[i]
+    right = reduce(m.values.pop())
+    if truth(result):
+        result = binop_reduce(BINOPS[rhs.type], m.context, left, right)
+
+    if i + 1 == len(e.right):
+        m.values.append(result)
+        return
+
+    m.work.append((finish_link, (e, i + 1, result, right)))
+    m.work.append((visit, e.right[i + 1].left))
+
+
+def visit_for(m, e):
+    m.work.append((start_for, e))
+    m.work.append((visit, e.left[1]))
+
+
+def start_for(m, e):
+    next_iteration(m, (e, iter(items(m.values.pop()))))
+
+
+def next_iteration(m, arg):
+    e, values = arg
+    try:
+        value = next(values)
+    except StopIteration:
+        m.values.append(None)
+        return
+
+    m.context[e.left[0].left] = value
+    m.work.append((next_iteration, arg))
+    m.work.append((drop, None))
+    m.work.append((visit, e.right))
+
+
+def visit_inf(m, e):
+    raise EvalError('cannot evaluate Inf in this context')
+
+
+VISITORS = {
+    None: visit_passthrough,
+    'stmnts': visit_stmnts,
+    'block': visit_stmnts,
+    'literal': visit_literal,
+    '#': visit_len,
+    'fcall': visit_fcall,
+    'var': visit_var,
+    '=': visit_assign,
+    'fdef': visit_fdef,
+    'cmd': visit_cmd,
+    'range': visit_range,
+    'list': visit_list,
+    'if': visit_if,
+    'cases': visit_cases,
+    'or': visit_or,
+    'and': visit_and,
+    'not': visit_not,
+    'idx': visit_idx,
+    'assign_item': visit_assign_item,
+    'lchain': visit_lchain,
+    'for': visit_for,
+    'Inf': visit_inf,
+} | {op: visit_binop for op in BINOPS}
+
+
+def compile_stack(program):
+    def run(context=GLOBALS):
+        return evaluate(program, context)
+
+    return run
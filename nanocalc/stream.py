@@ -0,0 +1,58 @@
+from .common import ParseError, TokenError
+from .expr import COMMANDS
+from .lexer import tokenize
+from .parser import TokenStream, parse, parse_program
+
+NESTING = {'(': 1, '[': 1, '{': 1, ')': -1, ']': -1, '}': -1}
+
+
+def statements(lines, commands=COMMANDS):
+    # Parse lines as they are read and yield a program as soon as the lines so
+    # far hold complete statements, so that only the statement being read is
+    # kept in memory. A statement goes on to the next line while a bracket or
+    # a string is open, or while a for loop is waiting for its body.
+    text = ''
+    tokens = []
+    depth = 0
+
+    for line in lines:
+        if text:
+            line = text + line
+        try:
+            new = tokenize(line, commands)
+        except TokenError as e:
+            if str(e) != 'unterminated string':
+                raise
+            text = line
+            continue
+        text = ''
+
+        tokens += new
+        for t in new:
+            depth += NESTING.get(t.type, 0)
+        if depth > 0:
+            continue
+
+        stream = TokenStream(tokens)
+        try:
+            program = parse_program(stream)
+        except ParseError:
+            if stream:
+                raise
+            # ran out of tokens, e.g. a for loop with its body on the next line
+            continue
+        if stream:
+            raise ParseError(f"unexpected tokens: {stream.peek()}")
+
+        tokens = []
+        depth = 0
+        if program.left:
+            yield program
+
+    if text:
+        tokenize(text, commands)
+
+    if tokens:
+        program = parse(tokens)
+        if program.left:
+            yield program
@@ -0,0 +1,594 @@
+from functools import partial
+import operator
+import types
+
+from .backend import items, truth
+from .common import EvalError
+from .compiler import Thunk
+from .expr import (
+    BINOPS,
+    COMPARISONS,
+    GLOBALS,
+    SCALARS,
+    SEQUENCE_TYPES,
+    TAIL_TYPES,
+    Context,
+    TailCall,
+    all_reduce,
+    assign_item,
+    binop_reduce,
+    command,
+    func_reduce,
+    index_reduce,
+    literal_list,
+    range_reduce,
+    reduce,
+    slice_operands,
+    slice_reduce,
+    slice_view,
+    tail_call,
+    tail_case,
+    trampoline,
+    unop_reduce,
+)
+
+# A program lowered to a flat list of instructions for a register machine.
+# Every instruction is a tuple (op, a, b, c, d); registers hold the values of
+# nodes, variables stay in the Context like for the tree walker. Control flow
+# (if, cases, and, or, for and chained comparisons) becomes jumps.
+
+OPNAMES = (
+    'LOAD',
+    'CONST',
+    'STORE',
+    'MOVE',
+    'BINOP',
+    'NEG',
+    'NOT',
+    'LEN',
+    'REDUCE',
+    'TEST',
+    'ALL',
+    'JUMP',
+    'JUMPIF',
+    'JUMPIFNOT',
+    'JUMPIFSOME',
+    'CALL',
+    'TAILCALL',
+    'SETTLE',
+    'CMD',
+    'LIST',
+    'RANGE',
+    'INDEX',
+    'SLICE',
+    'SETITEM',
+    'ITER',
+    'NEXT',
+    'DEF',
+    'RAISE',
+    'RETURN',
+)
+
+(
+    LOAD,
+    CONST,
+    STORE,
+    MOVE,
+    BINOP,
+    NEG,
+    NOT,
+    LEN,
+    REDUCE,
+    TEST,
+    ALL,
+    JUMP,
+    JUMPIF,
+    JUMPIFNOT,
+    JUMPIFSOME,
+    CALL,
+    TAILCALL,
+    SETTLE,
+    CMD,
+    LIST,
+    RANGE,
+    INDEX,
+    SLICE,
+    SETITEM,
+    ITER,
+    NEXT,
+    DEF,
+    RAISE,
+    RETURN,
+) = range(len(OPNAMES))
+
+# What the operands a, b, c and d of each instruction are, for disassemble:
+# r a register, R a tuple of registers, j a jump target, f a function, n a
+# name or constant, C a Code, T the Codes of command arguments and _ an operand
+# that is not shown.
+OPERANDS = {
+    LOAD: 'rn',
+    CONST: 'rn',
+    STORE: 'nr',
+    MOVE: 'rr',
+    BINOP: 'rfrr',
+    NEG: 'rr',
+    NOT: 'rr',
+    LEN: 'rr',
+    REDUCE: 'rr',
+    TEST: 'rr',
+    ALL: 'rfrn',
+    JUMP: 'j',
+    JUMPIF: 'rj',
+    JUMPIFNOT: 'rj',
+    JUMPIFSOME: 'rj',
+    CALL: 'rrR',
+    TAILCALL: 'rrR',
+    SETTLE: 'rn',
+    CMD: 'rnT',
+    LIST: 'rR',
+    RANGE: 'rRnn',
+    INDEX: 'rnr',
+    SLICE: 'rnRf',
+    SETITEM: 'nrr',
+    ITER: 'rr',
+    NEXT: 'rrj',
+    DEF: 'n_C',
+    RAISE: 'n',
+    RETURN: 'r',
+}
+
+
+class Code:
+    __slots__ = ('name', 'instructions', 'nregs')
+
+    def __init__(self, name, instructions, nregs):
+        self.name = name
+        self.instructions = instructions
+        self.nregs = nregs
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+
+def define(e, code, context):
+    plist = e.left.right
+
+    def enter(*args):
+        ctx = Context({p.left: a for p, a in zip(plist, args)}, parent=context)
+        return execute(code, ctx)
+
+    def f(*args):
+        ctx = Context({p.left: a for p, a in zip(plist, args)}, parent=context)
+        result = execute(code, ctx)
+        if type(result) is TailCall:
+            result = trampoline(result)
+        return result
+
+    f.fdef = e
+    f.enter = enter
+    return f
+
+
+def execute(code, context):
+    r = [None] * code.nregs
+    instructions = code.instructions
+    pc = 0
+
+    while True:
+        op, a, b, c, d = instructions[pc]
+        pc += 1
+
+        if op == LOAD:
+            r[a] = context[b]
+        elif op == CONST:
+            r[a] = b
+        elif op == BINOP:
+            x = r[c]
+            y = r[d]
+            if type(x) in SCALARS and type(y) in SCALARS:
+                r[a] = b(x, y)
+            else:
+                r[a] = binop_reduce(b, context, x, y)
+        elif op == JUMPIFNOT:
+            if not truth(r[a]):
+                pc = b
+        elif op == STORE:
+            value = r[b]
+            if isinstance(value, types.GeneratorType):
+                value = r[b] = list(value)
+            context[a] = value
+        elif op == MOVE:
+            r[a] = r[b]
+        elif op == JUMP:
+            pc = a
+        elif op == TEST:
+            value = r[b]
+            r[a] = all(value) if isinstance(value, SEQUENCE_TYPES) else value
+        elif op == CALL or op == TAILCALL:
+            f = r[b]
+            args = [r[i] for i in c]
+            for x in args:
+                if isinstance(x, SEQUENCE_TYPES):
+                    r[a] = func_reduce(f, context, *args)
+                    break
+            else:
+                r[a] = f(*args) if op == CALL else tail_call(f, args)
+        elif op == NEXT:
+            try:
+                r[a] = next(r[b])
+            except StopIteration:
+                pc = c
+        elif op == JUMPIFSOME:
+            if r[a] is not None:
+                pc = b
+        elif op == JUMPIF:
+            if truth(r[a]):
+                pc = b
+        elif op == INDEX:
+            r[a] = index_reduce(context[b], r[c])
+        elif op == SLICE:
+            lo, hi, step = c
+            step = None if step is None else r[step]
+            r[a] = d(context[b], r[lo], r[hi], step)
+        elif op == ALL:
+            r[a] = all_reduce(b, context, r[c], d)
+        elif op == NEG:
+            x = r[b]
+            r[a] = -x if type(x) in SCALARS else unop_reduce(operator.neg, context, x)
+        elif op == NOT:
+            r[a] = not truth(r[b])
+        elif op == LEN:
+            r[a] = len(reduce(r[b]))
+        elif op == REDUCE:
+            r[a] = reduce(r[b])
+        elif op == SETTLE:
+            # a tail call followed by nil is made here if nil has a value
+            if type(r[a]) is TailCall and any(context[n] is not None for n in b):
+                r[a] = trampoline(r[a])
+        elif op == CMD:
+            r[a] = command(context, b)(context, *c)
+        elif op == LIST:
+            r[a] = [reduce(r[i]) for i in b]
+        elif op == RANGE:
+            step, left, right = b
+            step = 'auto' if step is None else r[step]
+            right = None if right is None else r[right]
+            r[a] = range_reduce(r[left], right, step, c, infinite=d)
+        elif op == SETITEM:
+            assign_item(context, a, context[a], r[b], r[c])
+        elif op == ITER:
+            r[a] = iter(items(r[b]))
+        elif op == DEF:
+            context._globals[a] = define(b, c, context)
+        elif op == RAISE:
+            raise EvalError(a)
+        elif op == RETURN:
+            return r[a]
+
+
+class Lowerer:
+    def __init__(self, name):
+        self.name = name
+        self.instructions = []
+        self.nregs = 0
+
+    def reg(self):
+        self.nregs += 1
+        return self.nregs - 1
+
+    def emit(self, op, a=None, b=None, c=None, d=None):
+        self.instructions.append((op, a, b, c, d))
+        return len(self.instructions) - 1
+
+    def here(self):
+        return len(self.instructions)
+
+    def patch(self, at, field, target):
+        ins = list(self.instructions[at])
+        ins[field] = target
+        self.instructions[at] = tuple(ins)
+
+    def constant(self, value):
+        r = self.reg()
+        self.emit(CONST, r, value)
+        return r
+
+    def value(self, e, tail=False):
+        lower = getattr(self, LOWERERS.get(e.type, 'lower_unknown'))
+        if tail and e.type in TAIL_TYPES:
+            return lower(e, tail=True)
+        return lower(e)
+
+    def code(self, e, tail=False):
+        self.emit(RETURN, self.value(e, tail))
+        return Code(self.name, self.instructions, self.nregs)
+
+    def lower_unknown(self, e):
+        return self.error(f"unknown expression type: {e.type}")
+
+    def error(self, message):
+        self.emit(RAISE, message)
+        return self.constant(None)
+
+    def lower_passthrough(self, e, tail=False):
+        return self.value(e.left, tail)
+
+    def lower_stmnts(self, e, tail=False):
+        if not e.left:
+            return self.constant(None)
+        for s in e.left[:-1]:
+            self.value(s)
+        return self.value(e.left[-1], tail)
+
+    def lower_literal(self, e):
+        return self.constant(e.left)
+
+    def lower_binop(self, e):
+        if e.type == '-' and e.right is None:
+            return self.unary(NEG, e.left)
+
+        a = self.value(e.left)
+        b = self.value(e.right)
+        r = self.reg()
+        self.emit(BINOP, r, BINOPS[e.type], a, b)
+        return r
+
+    def unary(self, op, e):
+        a = self.value(e)
+        r = self.reg()
+        self.emit(op, r, a)
+        return r
+
+    def lower_len(self, e):
+        return self.unary(LEN, e.left)
+
+    def lower_not(self, e):
+        return self.unary(NOT, e.left)
+
+    def lower_fcall(self, e, tail=False):
+        f = self.reg()
+        self.emit(LOAD, f, e.left)
+        args = tuple(self.value(p) for p in e.right)
+        r = self.reg()
+        self.emit(TAILCALL if tail else CALL, r, f, args)
+        return r
+
+    def lower_var(self, e):
+        r = self.reg()
+        self.emit(LOAD, r, e.left)
+        return r
+
+    def lower_assign(self, e):
+        r = self.value(e.right)
+        self.emit(STORE, e.left.left, r)
+        return r
+
+    def lower_fdef(self, e):
+        fname = e.left.left
+        if not all(p.type == 'var' for p in e.left.right):
+            return self.error("expected parameter names")
+
+        code = Lowerer(fname).code(e.right, tail=True)
+        self.emit(DEF, fname, e, code)
+        return self.constant(None)
+
+    def lower_cmd(self, e):
+        # commands evaluate their arguments themselves, each from its own code
+        params = []
+        for p in e.right:
+            code = Lowerer(f'{e.left} argument').code(p)
+            params.append(Thunk(partial(execute, code), p))
+        r = self.reg()
+        self.emit(CMD, r, e.left, tuple(params))
+        return r
+
+    def lower_range(self, e):
+        if isinstance(e.left, list):
+            step = self.value(e.right[0])
+            left = self.value(e.left[0])
+            right = e.left[1]
+            type = e.right[1]
+        else:
+            step = None
+            left = self.value(e.left)
+            right = e.right
+            type = 'count'
+
+        infinite = right.type == 'Inf'
+        right = None if infinite else self.value(right)
+        r = self.reg()
+        self.emit(RANGE, r, (step, left, right), type, infinite)
+        return r
+
+    def lower_list(self, e):
+        values = tuple(self.value(x) for x in e.left)
+        r = self.reg()
+        self.emit(LIST, r, values)
+        return r
+
+    def lower_if(self, e, tail=False):
+        c = e.right
+        values = None
+        if c.type in COMPARISONS and c.left.type == 'idx':
+            values = literal_list(c.right)
+
+        t = self.reg()
+        if values is not None:
+            # var[a..b] == [1, 0, 1] without building either list
+            a = self.lower_idx(c.left, slice_view)
+            self.emit(ALL, t, BINOPS[c.type], a, values)
+        else:
+            self.emit(TEST, t, self.value(c))
+
+        r = self.reg()
+        skip = self.emit(JUMPIFNOT, t)
+        self.emit(MOVE, r, self.value(e.left, tail))
+        end = self.emit(JUMP)
+        self.patch(skip, 2, self.here())
+        self.emit(CONST, r, None)
+        self.patch(end, 1, self.here())
+        return r
+
+    def lower_cases(self, e, tail=False):
+        r = self.reg()
+        if not e.left:
+            self.emit(CONST, r, None)
+            return r
+
+        k = tail_case(e.left) if tail else None
+        exits = []
+        for i, x in enumerate(e.left):
+            self.emit(MOVE, r, self.value(x, tail and i == k))
+            if i == k and i + 1 < len(e.left):
+                names = tuple(n.left for n in e.left[i + 1 :] if n.type == 'var')
+                self.emit(SETTLE, r, names)
+            if i + 1 < len(e.left):
+                exits.append(self.emit(JUMPIFSOME, r))
+
+        for at in exits:
+            self.patch(at, 2, self.here())
+        return r
+
+    def lower_and_or(self, e):
+        r = self.reg()
+        self.emit(MOVE, r, self.value(e.left))
+        at = self.emit(JUMPIF if e.type == 'or' else JUMPIFNOT, r)
+        self.emit(MOVE, r, self.value(e.right))
+        self.patch(at, 2, self.here())
+        return r
+
+    def lower_idx(self, e, slice=slice_reduce):
+        bounds = slice_operands(e.right) if e.right.type == 'range' else None
+        r = self.reg()
+        if bounds is None:
+            i = self.value(e.right)
+            self.emit(INDEX, r, e.left, i)
+            return r
+
+        lo, hi, step = bounds
+        if step is not None:
+            step = self.value(step)
+        lo = self.value(lo)
+        hi = self.value(hi)
+        self.emit(SLICE, r, e.left, (lo, hi, step), slice)
+        return r
+
+    def lower_assign_item(self, e):
+        i = self.value(e.left.right)
+        v = self.value(e.right)
+        self.emit(SETITEM, e.left.left, i, v)
+        return v
+
+    def lower_lchain(self, e):
+        r = self.constant(True)
+        left = self.value(e.left)
+        for rhs in e.right:
+            right = self.reg()
+            self.emit(REDUCE, right, self.value(rhs.left))
+            # result and op(left, right): the operands are always evaluated
+            skip = self.emit(JUMPIFNOT, r)
+            self.emit(BINOP, r, BINOPS[rhs.type], left, right)
+            self.patch(skip, 2, self.here())
+            left = right
+        return r
+
+    def lower_for(self, e):
+        var, values = e.left
+        it = self.reg()
+        self.emit(ITER, it, self.value(values))
+
+        x = self.reg()
+        top = self.emit(NEXT, x, it)
+        self.emit(STORE, var.left, x)
+        self.value(e.right)
+        self.emit(JUMP, top)
+        self.patch(top, 3, self.here())
+        return self.constant(None)
+
+    def lower_inf(self, e):
+        return self.error('cannot evaluate Inf in this context')
+
+
+LOWERERS = {
+    None: 'lower_passthrough',
+    'stmnts': 'lower_stmnts',
+    'block': 'lower_stmnts',
+    'literal': 'lower_literal',
+    '#': 'lower_len',
+    'not': 'lower_not',
+    'and': 'lower_and_or',
+    'or': 'lower_and_or',
+    'list': 'lower_list',
+    'var': 'lower_var',
+    '=': 'lower_assign',
+    'fcall': 'lower_fcall',
+    'fdef': 'lower_fdef',
+    'cmd': 'lower_cmd',
+    'range': 'lower_range',
+    'if': 'lower_if',
+    'cases': 'lower_cases',
+    'idx': 'lower_idx',
+    'assign_item': 'lower_assign_item',
+    'lchain': 'lower_lchain',
+    'for': 'lower_for',
+    'Inf': 'lower_inf',
+} | {op: 'lower_binop' for op in BINOPS}
+
+
+def lower(program):
+    return Lowerer('<program>').code(program)
+
+
+def compile_vm(program):
+    code = lower(program)
+
+    def run(context=GLOBALS):
+        return execute(code, context)
+
+    return run
+
+
+def operand(kind, value):
+    if kind == 'r':
+        return f'r{value}'
+    elif kind == 'R':
+        return '(' + ', '.join('-' if i is None else f'r{i}' for i in value) + ')'
+    elif kind == 'j':
+        return f'-> {value}'
+    elif kind == 'f':
+        return value.__name__
+    elif kind == 'C':
+        return repr(value)
+    elif kind == 'T':
+        return '(' + ', '.join(repr(p.eval.args[0]) for p in value) + ')'
+    return repr(value)
+
+
+def nested(code):
+    # the codes of the functions and command arguments in code
+    for ins in code.instructions:
+        if ins[0] == DEF:
+            yield ins[3]
+        elif ins[0] == CMD:
+            for p in ins[3]:
+                yield p.eval.args[0]
+
+
+def codes(code):
+    yield code
+    for c in nested(code):
+        yield from codes(c)
+
+
+def disassemble(code):
+    lines = []
+    for c in codes(code):
+        if lines:
+            lines.append('')
+        lines.append(f'{c.name}:')
+        for pc, ins in enumerate(c.instructions):
+            kinds = OPERANDS[ins[0]]
+            args = [operand(k, v) for k, v in zip(kinds, ins[1:]) if k != '_']
+            lines.append(f"{pc:>6}  {OPNAMES[ins[0]]:<11} {', '.join(args)}".rstrip())
+
+    return '\n'.join(lines)
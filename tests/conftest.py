@@ -0,0 +1,18 @@
+import pytest
+
+from nanocalc import backend
+
+
+@pytest.fixture
+def array_backend():
+    backend.set_backend('array')
+    yield
+    backend.set_backend('list')
+
+
+@pytest.fixture
+def numpy_backend():
+    np = pytest.importorskip('numpy')
+    backend.set_backend('numpy')
+    yield np
+    backend.set_backend('list')
@@ -0,0 +1,269 @@
+import math
+import warnings
+from array import array
+
+import pytest
+
+from nanocalc import backend
+from nanocalc.common import EvalError
+from nanocalc.expr import reduce
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.session import ENGINES
+
+
+def parse_expression(input):
+    tokens = tokenize(input)
+    return parse(tokens)
+
+
+def test_default_backend():
+    assert backend.get_backend() == 'list'
+    assert isinstance(parse_expression('1..3').eval(), type(x for x in []))
+
+
+def test_unknown_backend():
+    with pytest.raises(EvalError):
+        backend.set_backend('fortran')
+
+
+def test_numpy_missing(monkeypatch):
+    monkeypatch.setattr(backend, 'np', None)
+    with pytest.raises(EvalError):
+        backend.set_backend('numpy')
+    assert backend.get_backend() == 'list'
+
+
+VECTORIZED = [
+    ('1..4', [1, 2, 3, 4]),
+    ('0..1..3', [0.0, 0.5, 1.0]),
+    ('(1..4) * 2', [2, 4, 6, 8]),
+    ('2 ^ (1..3)', [2, 4, 8]),
+    ('-(1..3)', [-1, -2, -3]),
+    ('[1, 2] + [3, 4]', [4, 6]),
+    ('(1..3) == [1, 0, 3]', [True, False, True]),
+    ('x = 1..5; x[2..3]', [2, 3]),
+    ('x = 1..5; x[[1, 5]]', [1, 5]),
+    ('sqrt([1, 4, 9])', [1.0, 2.0, 3.0]),
+    ('f(x) = x + 1; f(1..3)', [2, 3, 4]),
+]
+
+
+def run(program, engine):
+    return ENGINES[engine](program)()
+
+
+@pytest.mark.parametrize("expression, expected", VECTORIZED)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_vectorized(numpy_backend, expression, expected, engine):
+    actual = run(parse_expression(expression), engine)
+    assert backend.tolist(actual) == expected
+
+
+def test_ranges_are_arrays(numpy_backend):
+    np = numpy_backend
+    assert isinstance(parse_expression('1..3').eval(), np.ndarray)
+    assert isinstance(parse_expression('sin(0..1..5)').eval(), np.ndarray)
+
+
+def test_non_numeric_lists(numpy_backend):
+    assert parse_expression('["a", "b"] + "c"').eval() == ['ac', 'bc']
+
+
+def test_length_mismatch(numpy_backend):
+    with pytest.raises(EvalError):
+        parse_expression('(1..3) + [1, 2]').eval()
+
+
+def test_output(numpy_backend, capsys):
+    parse_expression('x = 1..3; print x; write x "\\n"; sum x').eval()
+
+    cap = capsys.readouterr()
+    assert cap.out == "[1, 2, 3]\n1\n2\n3\n"
+
+
+def test_python_scalars(numpy_backend, capsys):
+    code = 'x = 1..3; print x[[1, 2]] [x[1], 2]; [x[3], [x[2]]]'
+
+    actual = parse_expression(code).eval()
+
+    assert capsys.readouterr().out == "[1, 2] [1, 2]\n"
+    assert actual == [3, [2]]
+    assert type(actual[0]) is int
+
+
+def test_tolist_nested(numpy_backend):
+    np = numpy_backend
+
+    actual = backend.tolist([np.int64(1), [np.arange(2), array('d', [0.5])]])
+
+    assert actual == [1, [[0, 1], [0.5]]]
+    assert type(actual[0]) is int
+
+
+@pytest.mark.parametrize("name", ['list', 'numpy', 'array'])
+def test_division_by_zero(name):
+    if name == 'numpy':
+        pytest.importorskip('numpy')
+    backend.set_backend(name)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            for code in ['(1..3) / 0', '[1.0, 2.0] / [0, 1]', '(0..2) % 0']:
+                with pytest.raises(ZeroDivisionError):
+                    reduce(parse_expression(code).eval())
+
+            y = parse_expression('y = [1e308 * 10, 1]; y - y').eval()
+            assert math.isnan(y[0]) and y[1] == 0
+    finally:
+        backend.set_backend('list')
+
+
+@pytest.mark.parametrize("expression, expected", VECTORIZED)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_typed(array_backend, expression, expected, engine):
+    actual = run(parse_expression(expression), engine)
+    assert backend.tolist(actual) == expected
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ('1..3', array('q', [1, 2, 3])),
+        ('(1..3) / 2', array('d', [0.5, 1.0, 1.5])),
+        ('(1..3) > 1', [False, True, True]),
+        ('(1..3) * [1, 0.5, 1]', [1, 1.0, 3]),
+        ('2 ^ (62..64)', [2**62, 2**63, 2**64]),
+        ('["a", "b"] + "c"', ['ac', 'bc']),
+        ('[1, 2]', [1, 2]),
+        ('x = 1..4; x[2..3]', array('q', [2, 3])),
+        ('x = 1..3; x[2] = 5; x', array('q', [1, 5, 3])),
+        ('x = 1..3; sum x', 6),
+    ],
+)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_typed_values(array_backend, expression, expected, engine):
+    actual = run(parse_expression(expression), engine)
+    assert type(actual) is type(expected)
+    assert actual == expected
+
+
+EXACT = [
+    'x = 1..3; x[1] = 0.5; x',
+    'x = 1..3; x[2] = 2^70; x',
+    'x = 1..3; x[3] = 1 == 1; x',
+    'x = (1..3) / 2; x[1] = 2; x',
+    'x = 1..3; y = x; x[1] = 7; y',
+    'v = 1..3; f(k) = { v[k] = 0.5; k }; f(2); v',
+    'g(n) = { w = 1..3; w[n] = 1.5; w }; g(2)',
+    'g(n) = { w = 1..3; for i in 1..n { w[i] = i / 2 }; w }; g(3)',
+    '(1..3)^40',
+    '(1..3) * 3037000500',
+    '2^(60..64)',
+    '[2, 3]^[62, 2]',
+    'x = [2^62, 2^62]; x + 2^62',
+    '[1, 2, 3] - (-2^63)',
+    'x = 1..3; x or 2',
+    'x = 1..3; [not x, x and 0, (x > 5) or 1]',
+    '0 < (1..3) < 5',
+    'x = 1..3; y = x * 0; [0 < 2 < 3, 1 < x, y and 3]',
+    'v = [0, 0]; for i in 1..2 { v[i] = i ^ -1 }; v',
+    'v = [0, 0, 0]; for i in 1..3 { v[i] = i * 4000000000000000000 }; v',
+    'x = 1..5; y = x[4..6]; [y[1] * 4000000000000000000, y[3] ^ -1]',
+    'x = 1..3; -(x > 1)',
+    'x = [-2^63, 1]; -x',
+]
+
+
+@pytest.mark.parametrize("expression", EXACT)
+@pytest.mark.parametrize("name", ['numpy', 'array'])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_exact(expression, name, engine):
+    # the numbers of the list backend, also where they do not fit in int64
+    # or in the item type of an array
+    if name == 'numpy':
+        pytest.importorskip('numpy')
+    expected = reduce(run(parse_expression(expression), engine))
+    backend.set_backend(name)
+    try:
+        actual = backend.tolist(run(parse_expression(expression), engine))
+    finally:
+        backend.set_backend('list')
+    assert actual == expected
+    assert list(map(type, actual)) == list(map(type, expected))
+
+
+REDUCTIONS = [
+    'sum 1..100',
+    'prod 1..30',
+    'sum 4000000000000000000 + (0..0..3)',
+    'prod [-2^40, 2^30]',
+    'prod (1..5) / 2',
+    'sum (1..4) > 2',
+]
+
+
+@pytest.mark.parametrize("expression", REDUCTIONS)
+@pytest.mark.parametrize("name", ['numpy', 'array'])
+def test_reductions(expression, name):
+    # Python numbers, and the same ones as the list backend
+    if name == 'numpy':
+        pytest.importorskip('numpy')
+    expected = parse_expression(expression).eval()
+    backend.set_backend(name)
+    try:
+        actual = parse_expression(expression).eval()
+    finally:
+        backend.set_backend('list')
+    assert actual == expected
+    assert type(actual) is type(expected)
+
+
+def test_typed_numpy(array_backend):
+    np = pytest.importorskip('numpy')
+    x = parse_expression('x = 1..3').eval()
+    a = np.asarray(x)
+    a[0] = 7
+    assert x[0] == 7
+
+
+def test_typed_output(array_backend, capsys):
+    parse_expression('x = 1..3; print x; write x "\\n"; table x x/2').eval()
+
+    cap = capsys.readouterr()
+    assert cap.out == "[1, 2, 3]\n1\n2\n3\n1 0.5\n2 1.0\n3 1.5\n"
+
+
+@pytest.mark.parametrize("name", ['numpy', 'array'])
+def test_dump(name, capsys):
+    if name == 'numpy':
+        pytest.importorskip('numpy')
+    backend.set_backend(name)
+    try:
+        parse_expression('x = 1..3; y = x / 2; dump').eval()
+    finally:
+        backend.set_backend('list')
+
+    lines = capsys.readouterr().out.splitlines()
+    assert 'x = [1, 2, 3]' in lines
+    assert 'y = [0.5, 1.0, 1.5]' in lines
+
+
+@pytest.mark.parametrize("name", ['list', 'numpy', 'array'])
+@pytest.mark.parametrize("engine", ENGINES)
+def test_widened_alias(name, engine):
+    # an item an array can not hold goes to a list copy, which only the name
+    # assigned through is bound to; an item it can hold is seen by all
+    if name == 'numpy':
+        pytest.importorskip('numpy')
+    backend.set_backend(name)
+    try:
+        x, y = run(parse_expression('x = 1..3; y = x; y[1] = 0.5; [x, y]'), engine)
+        z = run(parse_expression('x = 1..3; y = x; y[1] = 7; x'), engine)
+    finally:
+        backend.set_backend('list')
+
+    expected = [1, 2, 3] if name != 'list' else [0.5, 2, 3]
+    assert backend.tolist(x) == expected
+    assert backend.tolist(y) == [0.5, 2, 3]
+    assert backend.tolist(z) == [7, 2, 3]
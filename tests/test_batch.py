@@ -0,0 +1,134 @@
+import math
+
+import pytest
+
+from nanocalc import Session, backend
+from nanocalc.batch import Batch
+from nanocalc.common import EvalError
+from nanocalc.session import ENGINES
+
+DEFINITIONS = """
+k = 2
+v = [1, 2]
+f(x, y) = sqrt(x^2 + y^2) * k + 1
+g(x) = { 0 if x < 0; x }
+h(x) = [x, x]
+p(x) = { print x; x }
+q(x) = h(x) + 1
+r(x, y) = f(x, y) - sqrt(y^2)
+"""
+
+X = [3, -1, 0, 2.5, 6]
+Y = [4, 2, 0, -1, 8]
+
+
+def rows(session, source, columns):
+    # the expected result: one evaluation per row
+    results = []
+    for x, y in zip(columns['x'], columns['y']):
+        session['x'] = x
+        session['y'] = y
+        results.append(session.eval(source))
+    return results
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize(
+    "source",
+    [
+        "f(x, y)",
+        "x * y - -x / 2 + k",
+        "x < y",
+        "sqrt(x^2) + pi",
+        "g(x) + g(y)",
+        "f(g(x), 1)",
+        "x + v",
+        "h(x) * 2",
+        "q(x)",
+        "r(x, y) + q(y)",
+        "x if x > 0",
+        "#v + x",
+        "k",
+    ],
+)
+def test_batch(engine, source):
+    session = Session(engine)
+    session.eval(DEFINITIONS)
+    columns = {'x': X, 'y': Y}
+
+    expected = rows(Session(engine), DEFINITIONS + source, columns)
+
+    assert session.batch(source)(columns) == expected
+
+
+@pytest.mark.parametrize(
+    "source", ["f(x, y)", "g(x) + 1", "f(g(x), y) < 10", "r(x, y)"]
+)
+def test_vectorized(monkeypatch, source):
+    session = Session()
+    session.eval(DEFINITIONS)
+
+    def rows(*args):
+        raise AssertionError("evaluated row by row")
+
+    monkeypatch.setattr(Batch, 'rows', rows)
+    session.batch(source)({'x': X, 'y': Y})
+
+
+def test_side_effects(capsys):
+    session = Session()
+    session.eval(DEFINITIONS)
+
+    assert session.batch("p(x) + 1")({'x': [1, 2, 3]}) == [2, 3, 4]
+    assert capsys.readouterr().out == "1\n2\n3\n"
+
+
+def test_scalars_and_tuples():
+    session = Session()
+
+    assert session.batch("x * y")({'x': (1, 2, 3), 'y': 10}) == [10, 20, 30]
+
+
+def test_reuse():
+    batch = Session().batch("x^2")
+
+    assert batch({'x': [1, 2]}) == [1, 4]
+    assert batch({'x': [3]}) == [9]
+
+
+@pytest.mark.parametrize("columns", [{'x': [1, 2], 'y': [1, 2, 3]}, {'x': 1}, {}])
+def test_invalid_columns(columns):
+    with pytest.raises(EvalError):
+        Session().batch("x + y")(columns)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_numpy(numpy_backend, engine):
+    np = numpy_backend
+    session = Session(engine)
+    session.eval(DEFINITIONS)
+    x = np.array(X, dtype=float)
+    y = np.array(Y, dtype=float)
+
+    actual = session.batch("f(x, y)")({'x': x, 'y': y})
+
+    assert isinstance(actual, np.ndarray)
+    expected = [math.sqrt(a * a + b * b) * 2 + 1 for a, b in zip(X, Y)]
+    assert actual.tolist() == pytest.approx(expected)
+
+    actual = session.batch("g(x)")({'x': list(X), 'y': y})
+    assert list(actual) == [3, 0, 0, 2.5, 6]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_numpy_negated_bools(numpy_backend, engine):
+    actual = Session(engine).batch("-(x > 1)")({'x': [1, 2, 3]})
+    assert backend.tolist(actual) == [0, -1, -1]
+
+
+def test_arrays_without_numpy_backend():
+    np = pytest.importorskip('numpy')
+
+    actual = Session().batch("x + 1")({'x': np.arange(3)})
+
+    assert actual == [1, 2, 3]
@@ -0,0 +1,127 @@
+import os
+import sys
+
+import pytest
+
+from nanocalc import Session, cache
+from nanocalc.__main__ import main
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def test_load_program(tmp_path):
+    source = "f(x) = x^2\nf(3) + 1"
+    program = cache.load_program(source, directory=tmp_path)
+
+    assert os.listdir(tmp_path) == [cache.cache_key(source)]
+    assert repr(program) == repr(parse(tokenize(source)))
+
+    cached = cache.load_program(source, directory=tmp_path)
+    assert repr(cached) == repr(program)
+    assert cached is not program
+
+
+def test_key():
+    assert cache.cache_key("1 + 2") == cache.cache_key("1 + 2")
+    assert cache.cache_key("1 + 2") != cache.cache_key("1 + 3")
+
+
+def test_optimized(tmp_path):
+    program = cache.load_program("2*pi", optimized=True, directory=tmp_path)
+
+    assert program.left[0].type == 'literal'
+    assert len(os.listdir(tmp_path)) == 1
+
+    program = cache.load_program("2*pi", directory=tmp_path)
+    assert program.left[0].type == '*'
+
+
+def test_context(tmp_path):
+    # folded for the context given, not for the module globals
+    session = Session(builtins={'sqrt': lambda x: -x})
+    source = "sqrt(4)"
+
+    program = cache.load_program(source, True, tmp_path, session.globals)
+    assert program.left[0].type == 'fcall'
+    assert session.run(program) == -4
+
+    program = cache.load_program(source, True, tmp_path)
+    assert program.left[0].type == 'literal'
+
+
+def test_prune(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'MAX_ENTRIES', 3)
+    sources = [f"{i} + 1" for i in range(5)]
+    for i, source in enumerate(sources):
+        cache.load_program(source, directory=tmp_path)
+        os.utime(tmp_path / cache.cache_key(source), (i, i))
+
+    expected = {cache.cache_key(s) for s in sources[2:]}
+    assert set(os.listdir(tmp_path)) == expected
+
+    # a hit counts as a use
+    cache.load_program(sources[2], directory=tmp_path)
+    cache.load_program("5 + 1", directory=tmp_path)
+    assert cache.cache_key(sources[2]) in os.listdir(tmp_path)
+    assert cache.cache_key(sources[3]) not in os.listdir(tmp_path)
+
+
+def test_prune_foreign(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'MAX_ENTRIES', 1)
+    foreign = ['notes.txt', 'tmpabc.tmp', 'f' * 63, 'F' * 64]
+    for i, name in enumerate(foreign):
+        (tmp_path / name).write_text("keep")
+        os.utime(tmp_path / name, (i, i))
+    (tmp_path / ('0' * 64)).mkdir()
+    os.utime(tmp_path / ('0' * 64), (0, 0))
+
+    for source in ["1 + 1", "2 + 1"]:
+        cache.load_program(source, directory=tmp_path)
+
+    expected = {*foreign, '0' * 64, cache.cache_key("2 + 1")}
+    assert set(os.listdir(tmp_path)) == expected
+
+
+@pytest.mark.parametrize("content", [b"", b"garbage", b"\x80\x05K\x01."])
+def test_invalid_entry(tmp_path, content):
+    source = "1 + 2"
+    (tmp_path / cache.cache_key(source)).write_bytes(content)
+
+    program = cache.load_program(source, directory=tmp_path)
+
+    assert program.eval() == 3
+    assert repr(cache.load(tmp_path / cache.cache_key(source))) == repr(program)
+
+
+def test_unwritable(tmp_path):
+    directory = tmp_path / 'file'
+    directory.write_text("")
+
+    assert cache.load_program("1 + 2", directory=directory).eval() == 3
+
+
+def run(monkeypatch, *args):
+    GLOBALS._d.clear()
+    monkeypatch.setattr(sys, 'argv', ['nc', *args])
+    assert main() == 0
+
+
+@pytest.mark.parametrize("args", [[], ['-O'], ['-e', 'closure']])
+def test_main(tmp_path, monkeypatch, capsys, args):
+    fname = os.path.join(EXAMPLES, 'nested-functions.nc')
+    monkeypatch.setenv('NANOCALC_CACHE_DIR', str(tmp_path))
+
+    run(monkeypatch, '--no-cache', '-f', fname, *args)
+    expected = capsys.readouterr().out
+    assert os.listdir(tmp_path) == []
+
+    run(monkeypatch, '-f', fname, *args)
+    assert capsys.readouterr().out == expected
+    assert len(os.listdir(tmp_path)) == 1
+
+    run(monkeypatch, '-f', fname, *args)
+    assert capsys.readouterr().out == expected
+    assert len(os.listdir(tmp_path)) == 1
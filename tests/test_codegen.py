@@ -0,0 +1,90 @@
+import ast
+import contextlib
+import io
+
+from nanocalc.codegen import compile_python, lower
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+
+
+def compile_expression(input):
+    tokens = tokenize(input)
+    program = parse(tokens)
+    return compile_python(program)
+
+
+def test_functions_are_python_functions():
+    program = parse(tokenize("f(x) = x^2 + 2*x + 1"))
+    module, _ = lower(program)
+
+    (program_def,) = module.body
+    funcs = [s for s in program_def.body if isinstance(s, ast.FunctionDef)]
+    assert len(funcs) == 1
+
+    compile_python(program)()
+    f = GLOBALS['f']
+    assert f.__code__.co_filename == '<nanocalc>'
+    assert f(1.5) == 6.25
+
+
+def test_read_before_assign():
+    code = """
+    y = 10
+    f(x) = {
+        z = y + x
+        y = 1
+        z + y
+    }
+    f(1)
+    """
+
+    f = compile_expression(code)
+
+    assert f() == 12
+
+
+def test_missing_arguments():
+    code = """
+    y = 5
+    f(x, y) = x + y
+    f(1)
+    """
+
+    f = compile_expression(code)
+
+    assert f() == 6
+
+
+def test_command_in_function(capsys):
+    code = """
+    f(x) = {
+        y = 2*x
+        print x y
+        y
+    }
+    f(3)
+    """
+
+    f = compile_expression(code)
+
+    assert f() == 6
+    cap = capsys.readouterr()
+    assert cap.out == "3 6\n"
+
+
+def test_fallback():
+    code = """
+    f(x) = {
+        print (y = x)
+        y
+    }
+    f(3)
+    """
+
+    program = parse(tokenize(code))
+    module, nodes = lower(program)
+
+    assert program.left[0] in nodes
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert compile_python(program)() == 3
@@ -0,0 +1,251 @@
+import contextlib
+import functools
+import glob
+import io
+import os
+import re
+
+import pytest
+
+from nanocalc import backend
+from nanocalc.common import EvalError, ExprError
+from nanocalc.expr import GLOBALS, reduce
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.session import ENGINES
+
+from test_arithmetic import TEST_DATA
+
+# What every engine should agree on with the tree walker. Tests of how one
+# engine works inside go in its own file.
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+# rule110.nc is quadratic in N; a smaller grid still covers every statement
+SMALLER = {'N = 512': 'N = 128'}
+
+
+def compile_expression(input, engine):
+    # function definitions always go to GLOBALS, so start from a clean slate
+    GLOBALS._d.clear()
+    tokens = tokenize(input)
+    program = parse(tokens)
+    return ENGINES[engine](program)
+
+
+@pytest.mark.parametrize("expression, expected", TEST_DATA)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_expr(expression, expected, engine):
+    f = compile_expression(expression, engine)
+    actual = f()
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_statements(engine, capsys):
+    code = """
+    f(x) = {
+        0 if x < 0
+        x^2
+    }
+    x = [-2, -1, 0, 1, 2]
+    table x f(x)
+    s = 0
+    for i in 1..4 {
+        s = s + i
+    }
+    print s 1 < 2 < 3 [1, 2] == [1, 2]
+    """
+
+    f = compile_expression(code, engine)
+    f()
+
+    cap = capsys.readouterr()
+    assert cap.out == "-2 0\n-1 0\n0 0\n1 1\n2 4\n10 True [True, True]\n"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_lazy_ranges(engine, capsys):
+    code = """
+    print #((1..4) * 2) 2 < (1..3) + 1 < 5
+    f(x) = { print x; x }
+    f(1..2)
+    y = 0
+    y = 1 if (1..3) > 0
+    print y
+    sum sqrt(1..Inf..1000)^2 - (1..1000)
+    """
+
+    f = compile_expression(code, engine)
+    actual = f()
+
+    cap = capsys.readouterr()
+    assert cap.out == "4 [True, True, True]\n1\n2\n1\n"
+    assert actual == pytest.approx(0.0, abs=1e-9)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_lazy_list_items(engine, capsys):
+    # a list literal holds lists, not the generators the items evaluate to
+    code = """
+    print [sin(0..1..2)]
+    x = [sin(0..1..2), (1..2) * 2]
+    print x x
+    y = x[2]
+    [#x[1], #x[1], y[2], #y]
+    """
+
+    f = compile_expression(code, engine)
+    actual = f()
+
+    cap = capsys.readouterr()
+    assert cap.out.splitlines() == [
+        "[[0.0, 0.8414709848078965]]",
+        "[[0.0, 0.8414709848078965], [2, 4]] [[0.0, 0.8414709848078965], [2, 4]]",
+    ]
+    assert actual == [2, 2, 4, 2]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_scopes(engine, capsys):
+    code = """
+    y = 10
+    f(x, z) = {
+        y = y + x
+        g(w) = y * w + x + z
+        g(2)
+    }
+    z = 100
+    print f(1) f(1, 2) y
+    h(n) = {
+        for i in 1..n
+            s = s + i
+        s
+    }
+    s = 0
+    print h(4) s
+    k(x) = { dump }
+    k(7)
+    """
+
+    f = compile_expression(code, engine)
+    f()
+
+    cap = capsys.readouterr()
+    lines = cap.out.splitlines()
+    assert lines[:2] == ["123 25 10", "10 0"]
+    assert "x = 7" in lines[2:]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_memo(engine, capsys):
+    code = """
+    fib(n) = {
+        n if n < 2
+        fib(n - 1) + fib(n - 2)
+    }
+    memo fib
+    print fib(60)
+    memo
+    """
+
+    f = compile_expression(code, engine)
+    f()
+
+    cap = capsys.readouterr()
+    assert cap.out.splitlines() == [
+        "1548008755920",
+        "fib: 58 hits, 61 misses, 61/1024 cached",
+    ]
+
+
+@pytest.mark.parametrize(
+    "code, expected",
+    [
+        # a range is used up by the first caller
+        ("f(n) = 1..n; memo f; a = f(3); b = f(3); [#a, #b]", [3, 3]),
+        # a list changed by one caller is not what the next one gets
+        ("g(n) = [n, n]; memo g; a = g(3); a[1] = 99; g(3)", [3, 3]),
+        ("g(n) = [[n], n]; memo g; a = g(3); b = a[1]; b[1] = 99; g(3)", [[3], 3]),
+    ],
+)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_memo_values(code, expected, engine):
+    f = compile_expression(code, engine)
+    assert reduce(f()) == expected
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_memo_rebound_builtin(engine, capsys):
+    # a builtin read by a memoized function is rebound after memo
+    code = """
+    f(x) = x * pi
+    memo f
+    print f(1)
+    pi = 4
+    print f(1)
+    """
+
+    f = compile_expression(code, engine)
+    f()
+
+    cap = capsys.readouterr()
+    assert cap.out.splitlines() == ["3.141592653589793", "4"]
+
+    with pytest.raises(EvalError, match="memo: f reads pi"):
+        compile_expression("pi = 3; f(x) = x * pi; memo f", engine)()
+
+
+def run(fname, engine, name='list'):
+    with open(fname) as f:
+        source = f.read()
+    for old, new in SMALLER.items():
+        source = source.replace(old, new)
+    program = parse(tokenize(source))
+
+    GLOBALS._d.clear()
+    backend.set_backend(name)
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            result = backend.tolist(reduce(ENGINES[engine](program)()))
+    finally:
+        backend.set_backend('list')
+
+    return result, out.getvalue()
+
+
+@functools.lru_cache
+def expected(fname):
+    try:
+        return run(fname, 'tree')
+    except ExprError as e:
+        return e
+
+
+# every engine on every backend, but the tree walker on lists that the
+# others are compared against
+RUNS = [
+    pytest.param(e, b, id=f'{e}-{b}')
+    for e in ENGINES
+    for b in backend.BACKENDS
+    if (e, b) != ('tree', 'list')
+]
+
+
+@pytest.mark.parametrize(
+    "fname", sorted(glob.glob(os.path.join(EXAMPLES, '*.nc'))), ids=os.path.basename
+)
+@pytest.mark.parametrize("engine, name", RUNS)
+def test_examples(fname, engine, name):
+    if name == 'numpy':
+        pytest.importorskip('numpy')
+
+    result = expected(fname)
+    if isinstance(result, ExprError):
+        with pytest.raises(type(result), match=re.escape(str(result))):
+            run(fname, engine, name)
+        return
+
+    assert run(fname, engine, name) == result
@@ -0,0 +1,62 @@
+import pytest
+
+from nanocalc.common import TokenError
+from nanocalc.lexer import tokenize
+
+
+def types_and_values(input):
+    return [(t.type, t.value) for t in tokenize(input)]
+
+
+TEST_DATA = [
+    ('1..5', [('number', 1), ('..', None), ('number', 5)]),
+    (
+        '0...1..2',
+        [('number', 0.0), ('..', None), ('number', 1), ('..', None), ('number', 2)],
+    ),
+    ('1...', [('number', 1.0), ('..', None)]),
+    ('1.5.3', [('number', 1.5), ('number', 0.3)]),
+    ('.5+. 1', [('number', 0.5), ('+', None), ('number', 0.0), ('number', 1)]),
+    ('3.e2 1e-3', [('number', 300.0), ('number', 0.001)]),
+    ("f'(x)", [('identifier', "f'"), ('(', None), ('identifier', 'x'), (')', None)]),
+    ('#x', [('#', None), ('identifier', 'x')]),
+    ('# comment\n1', [('eol', None), ('number', 1)]),
+    (
+        'a<=b!=c',
+        [
+            ('identifier', 'a'),
+            ('<=', None),
+            ('identifier', 'b'),
+            ('!=', None),
+            ('identifier', 'c'),
+        ],
+    ),
+    (
+        'print "a b" if Inf',
+        [('command', 'print'), ('string', 'a b'), ('if', None), ('Inf', None)],
+    ),
+    ('x\t\r y', [('identifier', 'x'), ('identifier', 'y')]),
+]
+
+
+@pytest.mark.parametrize("input, expected", TEST_DATA)
+def test_tokenize(input, expected):
+    actual = types_and_values(input)
+
+    assert actual == expected
+    assert [type(v) for _, v in actual] == [type(v) for _, v in expected]
+
+
+@pytest.mark.parametrize("input", ['$', '"abc', '1.', '2e'])
+def test_tokenize_error(input):
+    with pytest.raises(TokenError):
+        tokenize(input)
+
+
+def test_tokenize_long_input():
+    code = "x = x + 1.5 # step\n" * 20000
+
+    tokens = tokenize(code)
+
+    assert len(tokens) == 6 * 20000
+    assert tokens[-1].type == 'eol'
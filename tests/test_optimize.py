@@ -0,0 +1,215 @@
+import argparse
+import contextlib
+import glob
+import io
+import os
+import re
+
+import pytest
+
+from nanocalc import Session
+from nanocalc.__main__ import repl
+from nanocalc.common import ExprError
+from nanocalc.expr import BUILTINS, GLOBALS, Context, walk
+from nanocalc.lexer import tokenize
+from nanocalc.optimize import optimize
+from nanocalc.parser import parse
+
+from test_arithmetic import TEST_DATA
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def parse_expression(input):
+    tokens = tokenize(input)
+    return parse(tokens)
+
+
+def types(program):
+    return [e.type for e in walk(program)]
+
+
+@pytest.mark.parametrize("expression, expected", TEST_DATA)
+def test_expr(expression, expected):
+    program = parse_expression(expression)
+    actual = optimize(program).eval()
+
+    assert actual == program.eval()
+    assert actual == expected
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("2*pi/360", 0.017453292519943295),
+        ("sqrt(2)^2 - -1", 3.0000000000000004),
+        ("e^2 % 3", 1.3890560989306495),
+        ("-(2 + 3) * 4", -20),
+    ],
+)
+def test_fold(expression, expected):
+    program = optimize(parse_expression(expression))
+
+    assert types(program) == ['stmnts', 'literal']
+    assert program.eval() == expected
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "x = 3; y = x*1",
+        "x = 3; y = 1*x",
+        "x = 3; y = x^1",
+        "x = 3; y = x - 0",
+        "s = 0; for i in 1..3 { y = i*1 }",
+    ],
+)
+def test_identities(expression):
+    program = optimize(parse_expression(expression))
+
+    assert not {'*', '^', '-'} & set(types(program))
+
+
+@pytest.mark.parametrize(
+    "expression, op",
+    [
+        # bools, lists and unknown values are not numbers
+        ("y = (1 < 2)*1", '*'),
+        ("x = [1, 2]; y = x*1", '*'),
+        ("x = 1..3; y = x*1", '*'),
+        ("f(x) = x*1", '*'),
+        ("for x in [1, 2] { y = x*1 }", '*'),
+        ("x = 1; x = \"a\"; y = x*1", '*'),
+        # these change the type or sign of a number
+        ("x = 3; y = x/1", '/'),
+        ("x = -0.0; y = x + 0", '+'),
+        # these are left to fail or to be computed at run time
+        ("y = 1/0", '/'),
+        ("y = sqrt(-1)", 'fcall'),
+        ("y = 10^10^10", '^'),
+        # pi is rebound by the program
+        ("pi = 3; y = 2*pi", '*'),
+        ("f(pi) = 2*pi", '*'),
+    ],
+)
+def test_no_fold(expression, op):
+    program = optimize(parse_expression(expression))
+
+    assert op in types(program)
+
+
+def test_shadowed_in_context():
+    program = parse_expression("2*pi")
+    context = Context({'pi': 3}, parent=BUILTINS)
+
+    assert types(optimize(program, context)) == types(program)
+    assert optimize(program, context).eval(context) == 6
+
+
+def hoisted(program):
+    return [e.right.right for e in walk(program) if e.type == 'or']
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("a = 3; for i in 1..3 { y = sqrt(a*a) + i }", ["sqrt(a*a)"]),
+        ("a = 3; for i in 1..3 { y = (a + 1)*2 * i }", ["(a + 1)*2"]),
+        ("a = 3; for i in 1..3 { y = a*a*2*i + a*a*2 }", ["a*a*2"]),
+        ("a = 3; for i in 1..3 { y = (a + 1)*2 if i > 2 }", ["(a + 1)*2"]),
+        ("x = [1]; for i in 1..3 { y = #x*2 + i }", ["#x*2"]),
+    ],
+)
+def test_hoist(expression, expected):
+    program = optimize(parse_expression(expression))
+
+    expected = [parse_expression(x).left[0] for x in expected]
+
+    assert set(map(repr, hoisted(program))) == set(map(repr, expected))
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        # assigned in the body
+        "a = 3; for i in 1..3 { y = (a + 1)*2 * i; a = y }",
+        "a = 3; for i in 1..3 { for a in 1..2 { y = (a + 1)*2 } }",
+        "x = [1]; for i in 1..3 { y = #x*2 + i; x = [1, 2] }",
+        # depends on the loop variable
+        "for i in 1..3 { y = (i + 1)*2 }",
+        # not known to be a number, impure or not worth a guard
+        "a = [1, 2]; for i in 1..3 { y = (a + 1)*2 * i }",
+        "f(x) = x; a = 3; for i in 1..3 { y = f(a*a) * i }",
+        "x = [[1]]; for i in 1..3 { y = #x[1]*2 * i }",
+        "a = 3; for i in 1..3 { y = (a + 1) * i }",
+    ],
+)
+def test_no_hoist(expression):
+    program = optimize(parse_expression(expression))
+
+    assert hoisted(program) == []
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "a = 3; for i in 1..0 { y = 1/(a - 3) + 1 }",
+        "a = 3; for i in 1..3 { y = 1/(a - 3) + 1 if i > 3 }",
+    ],
+)
+def test_hoist_not_evaluated(expression):
+    program = optimize(parse_expression(expression))
+
+    assert hoisted(program)
+    run(program)
+
+
+def test_hoist_error():
+    program = optimize(parse_expression("a = 3; for i in 1..3 { y = 1/(a - 3) + 1 }"))
+
+    with pytest.raises(ZeroDivisionError):
+        run(program)
+
+
+def run(program):
+    GLOBALS._d.clear()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        result = program.eval()
+
+    return result, out.getvalue()
+
+
+@pytest.mark.parametrize(
+    "fname", sorted(glob.glob(os.path.join(EXAMPLES, '*.nc'))), ids=os.path.basename
+)
+def test_examples(fname):
+    with open(fname) as f:
+        program = parse(tokenize(f.read()))
+
+    try:
+        expected = run(program)
+    except ExprError as e:
+        with pytest.raises(type(e), match=re.escape(str(e))):
+            run(optimize(program))
+        return
+
+    actual = run(optimize(program))
+
+    assert actual == expected
+
+
+def test_partial():
+    # a function defined in one piece of a program may run after another
+    # rebinds pi
+    program = optimize(parse_expression("f(x) = x * pi * 2; 2 * pi"), partial=True)
+    assert types(program).count('literal') == 2
+    assert 'var' in types(program.left[0])
+
+
+@pytest.mark.parametrize("optimize_flag", [False, True])
+def test_repl_rebound_builtin(monkeypatch, capsys, optimize_flag):
+    monkeypatch.setattr('sys.stdin', io.StringIO("f(x) = x * pi\npi = 3\nf(1)\n"))
+    args = argparse.Namespace(tokens=False, optimize=optimize_flag)
+    repl(Session(optimize=optimize_flag), args)
+    assert capsys.readouterr().out == "= 3\n= 3\n"
@@ -0,0 +1,84 @@
+import io
+
+import pytest
+
+from nanocalc import Session
+from nanocalc.common import EvalError
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.output import Output
+from nanocalc.parser import parse
+from nanocalc.session import ENGINES
+
+
+def parse_expression(s):
+    return parse(tokenize(s))
+
+
+def test_output():
+    f = io.StringIO()
+    out = Output(f, 4)
+    out.write('ab')
+    assert f.getvalue() == ''
+    out.write('cd')
+    assert f.getvalue() == 'abcd'
+    out.write('e')
+    out.flush()
+    assert f.getvalue() == 'abcde'
+
+
+def test_unbuffered(capsys):
+    out = Output()
+    out.write('ab')
+    assert capsys.readouterr().out == 'ab'
+
+
+@pytest.mark.parametrize(
+    'source, expected',
+    [
+        ('print 1 [2, 3] "a"', '1 [2, 3] a\n'),
+        ('write [1, 2] " "', '1 2 '),
+        ('write [1, 2] "\\n"', '1\n2\n'),
+        ('write "a\\tb\\" "n"', 'a\tb\n'),
+        ('write "\\u00e9" "é"', 'é\xc3\xa9'),
+        ('write 1.5', '1.5'),
+        ('table 1..3 [4, 5, 6] 7', '1 4 7\n2 5 7\n3 6 7\n'),
+    ],
+)
+def test_commands(source, expected, capsys):
+    GLOBALS._d.clear()
+    parse_expression(source).eval()
+    assert capsys.readouterr().out == expected
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_session(engine):
+    f = io.StringIO()
+    session = Session(engine, file=f, output_size=1 << 20)
+    program = session.parse('for i in 1..3 { write i " " }; x = 4; print x; print "y"')
+    run = session.compile(program)
+    run(session.globals)
+    assert f.getvalue() == ''
+    session.flush()
+    assert f.getvalue() == '1 2 3 4\ny\n'
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_session_run(engine):
+    f = io.StringIO()
+    session = Session(engine, file=f)
+    session.eval('f(x) = { print x; x }; f(1) + f(2)')
+    assert f.getvalue() == '1\n2\n'
+
+    # what was printed before an error is still written
+    with pytest.raises(EvalError):
+        session.eval('print 3; [1, 2] + [1, 2, 3]')
+    assert f.getvalue() == '1\n2\n3\n'
+
+
+def test_batch():
+    f = io.StringIO()
+    session = Session(file=f)
+    session.eval('p(x) = { print x; x }')
+    assert session.batch('p(x)')({'x': [1, 2]}) == [1, 2]
+    assert f.getvalue() == '1\n2\n'
@@ -0,0 +1,145 @@
+import io
+
+import pytest
+
+from nanocalc import Session, parallel
+from nanocalc.common import EvalError
+from nanocalc.session import ENGINES
+
+PROGRAMS = [
+    """
+    f(x) = x*x + k
+    k = 3
+    for i in 1..40 { y = f(i); print(y) }
+    y
+    """,
+    """
+    a = 2
+    for i in 1..30 { x = i*sqrt(a*a + 1); print x }
+    x
+    """,
+    """
+    for i in [5, 4, 3, 2, 1, 6, 7, 8] {
+        for j in 1..i { z = i*j }
+        print i z
+    }
+    """,
+    """
+    s = 0
+    for i in 1..30 { s = s + i; print s }
+    s
+    """,
+    """
+    v = [0, 0, 0, 0, 0, 0, 0, 0]
+    for i in 1..8 { v[i-1] = i*i }
+    v
+    """,
+]
+
+
+def run(engine, source, optimize=False, jobs=None):
+    session = Session(engine, optimize)
+    result = parallel.run(session, session.parse(source), jobs)
+    return result, session.globals._d
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('optimize', [False, True])
+@pytest.mark.parametrize('source', PROGRAMS)
+def test_run(engine, optimize, source, capsys):
+    expected = run(engine, source, optimize, jobs=1)
+    serial = capsys.readouterr().out
+    actual = run(engine, source, optimize, jobs=2)
+    assert capsys.readouterr().out == serial
+    assert actual[0] == expected[0]
+    assert {k: v for k, v in actual[1].items() if not callable(v)} == {
+        k: v for k, v in expected[1].items() if not callable(v)
+    }
+
+
+def test_independent():
+    def independent(source):
+        session = Session()
+        program = session.parse(source)
+        for s in program.left[:-1]:
+            session.run(s)
+        return parallel.Loop(session, program, program.left[-1]).independent()
+
+    assert independent('for i in 1..10 { x = i; print x }')
+    assert independent('f(x) = x + 1\nfor i in 1..10 { print f(i) }')
+    assert independent('k = 1\nfor i in 1..10 { x = k; k = 2 }') is False
+    assert independent('s = 0\nfor i in 1..10 { s = s + i }') is False
+    assert independent('for i in 1..10 { x = x if i > 1; x = i }') is False
+    assert independent('v = [1]\nfor i in 1..10 { v[0] = i }') is False
+    assert independent('for i in 1..10 { f(x) = x + i }') is False
+    assert independent('f(x) = x + y\nfor i in 1..10 { y = i; f(i) }')
+    assert independent('f(x) = x + y\nfor i in 1..10 { f(i); y = i }') is False
+    assert independent('for i in 1..10 { for j in 1..i { z = j }\n z }') is False
+    assert independent('for i in 1..Inf { x = i }') is False
+    assert independent('f(x) = x\nfor i in 1..10 { memo f }') is False
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_error(engine, capsys):
+    source = 'for i in 1..40 { print(i); x = [1, 2] + [1, 2, 3] if i == 30 }'
+    with pytest.raises(EvalError):
+        run(engine, source, jobs=2)
+    out = capsys.readouterr().out.split()
+    assert out[:30] == [str(i) for i in range(1, 31)]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_division_by_zero(engine, capsys):
+    source = 'for i in 1..40 { print(i); x = 1 / (i - 30) }'
+    with pytest.raises(ZeroDivisionError):
+        run(engine, source, jobs=2)
+    out = capsys.readouterr().out.split()
+    assert out[:30] == [str(i) for i in range(1, 31)]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_builtin_error(engine, capsys):
+    # not an error evaluation reports, so it escapes the worker as it is
+    source = 'for i in 1..40 { print(i); x = sqrt(30 - i) }'
+    with pytest.raises(ValueError):
+        run(engine, source, jobs=2)
+    out = capsys.readouterr().out.split()
+    assert out == [str(i) for i in range(1, len(out) + 1)]
+
+
+def test_unpicklable():
+    # a lambda cannot be sent to the workers, so the loop runs serially
+    session = Session(builtins={'h': lambda x: x + 1})
+    program = session.parse('for i in 1..40 { y = h(i) }')
+    assert parallel.Loop(session, program, program.left[-1]).state() is None
+    parallel.run(session, program, 2)
+    assert session['y'] == 41
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_output(engine, capsys):
+    source = 'print 0\nfor i in 1..40 { x = i*i; print x }\nprint 99'
+    expected = ''.join(f'{i * i}\n' for i in range(41)) + '99\n'
+    for jobs in [1, 2]:
+        file = io.StringIO()
+        session = Session(engine, file=file)
+        parallel.run(session, session.parse(source), jobs)
+        assert file.getvalue() == expected
+    assert capsys.readouterr().out == ''
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_batch(engine):
+    setup = 'k = 2\nf(x, y) = sqrt(x^2 + y^2) * k'
+    columns = {'x': list(range(50)), 'y': 3}
+    session = Session(engine)
+    session.eval(setup)
+    expected = session.batch('f(x, y) + 1')(columns)
+    assert parallel.parallel_batch('f(x, y) + 1', columns, setup, engine, 2) == expected
+    assert parallel.parallel_batch('f(x, y) + 1', columns, setup, engine, 1) == expected
+
+
+def test_split():
+    assert parallel.split(list(range(5)), 2) == [[0, 1, 2], [3, 4]]
+    assert parallel.split(list(range(5)), 8) == [[i] for i in range(5)]
+    assert parallel.split([], 3) == []
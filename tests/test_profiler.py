@@ -0,0 +1,114 @@
+import io
+import re
+from collections import Counter
+
+import pytest
+
+from nanocalc.common import EvalError
+from nanocalc.expr import GLOBALS, Expr, walk
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.profiler import Profiler, label, locate
+
+
+def profile(code):
+    GLOBALS._d.clear()
+    offsets = []
+    tokens = tokenize(code, offsets=offsets)
+    program = parse(tokens)
+    profiler = Profiler(program, locate(program, tokens, offsets, code))
+    with profiler:
+        program.eval()
+    return profiler
+
+
+def test_offsets():
+    offsets = []
+    tokens = tokenize('x = 1  # one\ny', offsets=offsets)
+
+    assert len(offsets) == len(tokens)
+    assert offsets == [0, 2, 4, 12, 13]
+
+
+def test_locate():
+    code = 'x = 1\nfor i in 1..3 {\n  y = x + 22 if i > 1\n}'
+    offsets = []
+    tokens = tokenize(code, offsets=offsets)
+    program = parse(tokens)
+    positions = locate(program, tokens, offsets, code)
+
+    where = {label(e): positions[e] for e in walk(program)}
+    assert where['= x'] == (1, 1)
+    assert where['for'] == (2, 5)
+    assert where['if'] == (3, 3)
+    assert where['+'] == (3, 7)
+    assert where['literal 22'] == (3, 11)
+    assert where['>'] == (3, 17)
+
+
+def test_locate_mismatch():
+    code = 'x = 1 + 2'
+    offsets = []
+    tokens = tokenize(code, offsets=offsets)
+
+    assert locate(parse(tokenize('x = 1')), tokens, offsets, code) == {}
+
+
+def test_counts():
+    code = """
+    fib(n) = {
+        n if n < 2
+        fib(n - 1) + fib(n - 2)
+    }
+    s = 0
+    for i in 1..10 { s = s + i }
+    print fib(10) s
+    """
+
+    profiler = profile(code)
+
+    counts = Counter()
+    for e, s in profiler.stats.items():
+        counts[label(e)] += s[0]
+    assert counts['= s'] == 11
+    assert counts['cmd print'] == 1
+    assert dict((n, s[0]) for n, s in profiler.function_stats()) == {'fib': 177}
+    assert dict((n, s[0]) for n, s in profiler.command_stats()) == {'print': 1}
+
+    for count, total, own in profiler.stats.values():
+        assert 0 <= own <= total + 1e-9
+
+
+def test_tail_calls():
+    profiler = profile("g(n, a) = { a if n == 0; g(n - 1, a + n) }; g(1000, 0)")
+
+    assert dict((n, s[0]) for n, s in profiler.function_stats()) == {'g': 1001}
+    assert set(profiler.folded) == {'<program>', '<program>;g'}
+
+
+def test_report():
+    profiler = profile("f(x) = x^2; print f(3) f(4)")
+
+    out = io.StringIO()
+    profiler.report(out, n=3)
+    lines = out.getvalue().splitlines()
+
+    assert re.fullmatch(r'\d+ node evaluations in [0-9.]+s', lines[0])
+    assert lines[2].split() == ['calls', 'total', 'self', 'line:col', 'node']
+    assert len(lines[3:6]) == 3
+    assert re.search(r' 2 +[0-9.]+ +[0-9.]+  f$', out.getvalue(), re.M)
+    assert re.search(r' 1 +[0-9.]+ +[0-9.]+  print$', out.getvalue(), re.M)
+
+    folded = io.StringIO()
+    profiler.write_folded(folded)
+    for line in folded.getvalue().splitlines():
+        assert re.fullmatch(r'<program>(;(f|print))* \d+', line)
+
+
+def test_restores_eval():
+    saved = Expr._eval, Expr._tail
+
+    with pytest.raises(EvalError):
+        profile("x = Inf")
+
+    assert (Expr._eval, Expr._tail) == saved
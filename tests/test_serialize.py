@@ -0,0 +1,115 @@
+import glob
+import math
+import os
+
+import pytest
+
+from nanocalc.common import FormatError
+from nanocalc.expr import Expr, walk
+from nanocalc.lexer import tokenize
+from nanocalc.optimize import optimize
+from nanocalc.parser import parse
+from nanocalc.serialize import HEADER, MAGIC, serialize, deserialize
+
+from test_arithmetic import TEST_DATA
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def parse_expression(input):
+    tokens = tokenize(input)
+    return parse(tokens)
+
+
+def shape(program):
+    # node fields with the children replaced by their types
+    def value(x):
+        if isinstance(x, Expr):
+            return x.type
+        if isinstance(x, list):
+            return [value(y) for y in x]
+        return (type(x), repr(x))
+
+    return [(value(e), value(e.left), value(e.right)) for e in walk(program)]
+
+
+@pytest.mark.parametrize("expression, expected", TEST_DATA)
+def test_expr(expression, expected):
+    program = parse_expression(expression)
+    actual = deserialize(serialize(program))
+
+    assert repr(actual) == repr(program)
+    assert actual.eval() == expected
+
+
+@pytest.mark.parametrize(
+    "fname", sorted(glob.glob(os.path.join(EXAMPLES, '*.nc'))), ids=os.path.basename
+)
+@pytest.mark.parametrize("optimized", [False, True])
+def test_examples(fname, optimized):
+    with open(fname) as f:
+        program = parse(tokenize(f.read()))
+    if optimized:
+        program = optimize(program)
+
+    assert repr(deserialize(serialize(program))) == repr(program)
+
+
+@pytest.mark.parametrize(
+    "value", [0, -1, 2**63, -(2**100), 0.5, -0.0, math.inf, True, False, "", "å\n"]
+)
+def test_constants(value):
+    program = Expr('stmnts', [Expr('literal', value), Expr('literal', 1)])
+    actual = deserialize(serialize(program)).left[0].left
+
+    assert type(actual) is type(value)
+    assert repr(actual) == repr(value)
+
+
+def test_nan():
+    program = Expr('literal', math.nan)
+
+    assert math.isnan(deserialize(serialize(program)).left)
+
+
+def test_deep():
+    # deeper than the recursion limit
+    program = parse_expression("1" + " + 1" * 5000)
+    actual = deserialize(serialize(program))
+
+    assert shape(actual) == shape(program)
+
+
+def test_shared():
+    x = Expr('var', 'x')
+    program = Expr('+', x, x)
+    actual = deserialize(serialize(program))
+
+    assert actual.left is actual.right
+
+
+def test_compact():
+    source = "x = (x + 1) * 2 - f(x, 3) / 4\n" * 1000
+
+    assert len(serialize(parse_expression(source))) < len(source) / 5
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"NCAST",
+        b"garbage" * 10,
+        HEADER.pack(MAGIC, 99) + serialize(Expr('literal', 1))[HEADER.size :],
+        serialize(Expr('literal', 1))[:-4],
+        serialize(parse_expression("1 + 2"))[: HEADER.size] + b"\x78\x9c",
+    ],
+)
+def test_invalid(data):
+    with pytest.raises(FormatError):
+        deserialize(data)
+
+
+def test_unsupported():
+    with pytest.raises(FormatError):
+        serialize(Expr('literal', 1j))
@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+
+from nanocalc import Session
+from nanocalc.common import EvalError, ParseError
+from nanocalc.expr import GLOBALS
+from nanocalc.session import ENGINES
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("optimize", [False, True])
+def test_eval(engine, optimize):
+    session = Session(engine, optimize)
+
+    assert session.eval("f(x) = x^2 + 1; y = f(3)") == 10
+    assert session.eval("f(y) * 2") == 202
+    assert session['y'] == 10
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("optimize", [False, True])
+def test_rebound_builtin(engine, optimize):
+    session = Session(engine, optimize)
+
+    session.eval("f(x) = x * pi")
+    session.eval("pi = 3")
+    assert session.eval("f(1)") == 3
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_isolated(engine):
+    GLOBALS._d.clear()
+    a = Session(engine)
+    b = Session(engine)
+
+    a.eval("f(x) = x + 1; y = 2")
+    b.eval("f(x) = x + 2")
+
+    assert a.eval("f(1)") == 2
+    assert b.eval("f(1)") == 3
+    assert 'y' in a
+    assert 'y' not in b
+    assert GLOBALS._d == {}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_nested_functions(engine):
+    GLOBALS._d.clear()
+    session = Session(engine)
+
+    source = "f(x) = { g(y) = x + y; g(1) }\nf(2) + g(3)"
+
+    assert session.eval(source) == 3 + 5
+    assert 'g' in session
+    assert GLOBALS._d == {}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_memo(engine, capsys):
+    session = Session(engine)
+    other = Session(engine)
+
+    session.eval("fib(n) = { n if n < 2; fib(n - 1) + fib(n - 2) }; memo fib")
+    other.eval("fib(n) = n")
+
+    assert session.eval("fib(30)") == 832040
+    assert other.eval("fib(30)") == 30
+
+    session.eval("memo")
+    assert capsys.readouterr().out.startswith("fib: ")
+    other.eval("memo")
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_builtins(engine):
+    session = Session(engine, builtins={'g': 9.81, 'twice': lambda x: 2 * x})
+
+    assert session.eval("twice(g)") == 19.62
+    assert session.eval("g = 1; twice(g)") == 2
+    assert session.builtins['g'] == 9.81
+
+    with pytest.raises(EvalError, match="twice is not defined"):
+        Session(engine).eval("twice(g)")
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_commands(engine, capsys):
+    def shout(context, *args):
+        print(*[str(a.eval(context)).upper() for a in args])
+
+    session = Session(engine, commands={'shout': shout})
+
+    session.eval('x = "hi"; shout x "there"')
+    assert capsys.readouterr().out == "HI THERE\n"
+
+    with pytest.raises(ParseError, match="unexpected tokens"):
+        Session(engine).eval('shout "hi"')
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_threads(engine):
+    source = """
+    f(x) = x^2 + k
+    s = 0
+    for i in 1..2000 { s = s + f(i) }
+    s
+    """
+    results = {}
+
+    def run(k):
+        session = Session(engine)
+        session['k'] = k
+        results[k] = session.eval(source)
+
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    base = sum(i * i for i in range(1, 2001))
+    assert results == {k: base + 2000 * k for k in range(8)}
+
+
+def test_unknown_engine():
+    with pytest.raises(EvalError, match="unknown engine: fast"):
+        Session('fast')
@@ -0,0 +1,84 @@
+import pytest
+
+from nanocalc.common import EvalError
+from nanocalc.expr import GLOBALS, View, positions, slice_reduce, slice_view
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.session import ENGINES
+
+
+def parse_expression(s):
+    return parse(tokenize(s))
+
+
+def run(source, engine):
+    GLOBALS._d.clear()
+    program = parse_expression(source)
+    return ENGINES[engine](program)()
+
+
+def expected(var, left, right, step):
+    return [var[(i - 1) % len(var)] for i in range(left, right + 1, step)]
+
+
+@pytest.mark.parametrize('n', [1, 2, 5])
+def test_slice_reduce(n):
+    var = list(range(10, 10 + n))
+    for left in range(-7, 8):
+        for right in range(left - 1, left + 9):
+            for step in (1, 2, 3):
+                want = expected(var, left, right, step)
+                assert slice_reduce(var, left, right, step) == want
+                assert list(slice_view(var, left, right, step)) == want
+
+
+def test_positions():
+    assert positions(5, 2, 4, 1) == range(1, 4)
+    assert positions(5, 0, 2, 1) == range(-1, 2)
+    assert positions(5, 5, 7, 1) == range(-1, 2)
+    assert positions(5, 1, 5, 2) == range(0, 5, 2)
+    assert positions(5, 4, 8, 2) == range(-2, 3, 2)
+    assert positions(5, 1, 9, 2) is None
+    assert positions(5, 1, 6, 1) is None
+    assert not positions(5, 3, 2, 1)
+
+
+def test_view():
+    var = [1, 2, 3]
+    v = slice_view(var, 0, 2)
+    assert type(v) is View
+    assert len(v) == 3 and v[0] == 3 and list(v) == [3, 1, 2]
+    # slices that do not wrap are copied, which is faster for short ones
+    assert type(slice_view(var, 1, 2)) is list
+
+
+@pytest.mark.parametrize(
+    'source, result',
+    [
+        ('v = 1..5; v[2..4]', [2, 3, 4]),
+        ('v = 1..5; v[0..2]', [5, 1, 2]),
+        ('v = 1..5; v[4..7]', [4, 5, 1, 2]),
+        ('v = 1..5; v[1..5..+2]', [1, 3, 5]),
+        ('v = 1..5; v[4..8..+2]', [4, 1, 3]),
+        ('v = 1..5; v[1..12..+5]', [1, 1, 1]),
+        ('v = 1..5; v[3..2]', []),
+        ('v = 1..5; v[1..3..3]', [1, 2, 3]),
+        ('v = 1..5; w = v[1..2]; v[1] = 9; w', [1, 2]),
+        ('v = [0, 1, 1]; 1 if v[0..1] == [1, 0]', 1),
+        ('v = [0, 1, 1]; 1 if v[2..4] == [1, 1, 0]', 1),
+        ('v = [0, 1, 1]; 1 if v[2..4] != [1, 1, 0]', None),
+        ('v = [0, 1, 1]; 1 if v[1..3..+2] == [0, 1]', 1),
+        ('v = [0, 1, 1]; 1 if v[2] == [1, 1]', 1),
+        ('v = [0, 1, 2]; { 1 if v[3..4] < [3, 1]; 2 }', 1),
+        ('v = [0, 1, 2]; { 1 if v[3..4] < [3, 0]; 2 }', 2),
+    ],
+)
+@pytest.mark.parametrize('engine', ENGINES)
+def test_slices(source, result, engine):
+    assert run(source, engine) == result
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_length_mismatch(engine):
+    with pytest.raises(EvalError):
+        run('v = [0, 1, 1]; 1 if v[0..1] == [1, 0, 1]', engine)
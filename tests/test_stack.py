@@ -0,0 +1,70 @@
+import sys
+
+import pytest
+
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.stack import compile_stack, evaluate
+
+# deeper than the recursion limit
+DEPTH = 10 * sys.getrecursionlimit()
+
+
+def compile_expression(input):
+    tokens = tokenize(input)
+    program = parse(tokens)
+    return compile_stack(program)
+
+
+def test_deep_expression():
+    code = ' + '.join(['1'] * DEPTH)
+    program = parse(tokenize(code))
+
+    with pytest.raises(RecursionError):
+        program.eval()
+
+    assert evaluate(program) == DEPTH
+
+
+def test_deep_recursion():
+    code = f"""
+    depth(n) = {{ 0 if n == 0; 1 + depth(n - 1) }}
+    count(n) = {{ {{ c[1] = c[1] + 1; count(n - 1) }} if n > 0; nil }}
+    c = [0]
+    count({DEPTH})
+    [depth({DEPTH}), c[1]]
+    """
+
+    GLOBALS._d.clear()
+    f = compile_expression(code)
+
+    assert f() == [DEPTH, DEPTH]
+
+
+def test_command_arguments(capsys):
+    code = f"""
+    f(n) = {{ 0 if n == 0; 1 + f(n - 1) }}
+    print f({DEPTH}) {' + '.join(['1'] * DEPTH)}
+    """
+
+    GLOBALS._d.clear()
+    f = compile_expression(code)
+    f()
+
+    cap = capsys.readouterr()
+    assert cap.out == f"{DEPTH} {DEPTH}\n"
+
+
+def test_functions():
+    code = """
+    y = 5
+    f(x, y) = x + y
+    g(x) = { h(z) = z * x; h(2) }
+    [f(1), f(1, 2), g(3), f(1..3, 1)]
+    """
+
+    GLOBALS._d.clear()
+    f = compile_expression(code)
+
+    assert f() == [6, 3, 6, [2, 3, 4]]
@@ -1,6 +1,9 @@
+import pickle
 import pytest
+import tracemalloc
 import types
 
+from nanocalc.common import EvalError
 from nanocalc.lexer import tokenize
 from nanocalc.parser import parse
 
@@ -253,3 +256,172 @@ def test_range8():
     expected = [0, 1, 2]
 
     assert actual == expected
+
+
+def test_long_program():
+    code = "x = 0\n" + "x = x + 1\n" * 20000 + "x\n"
+
+    e = parse_expression(code)
+    v = e.eval()
+
+    assert len(e.left) == 20002
+    assert v == 20000
+
+
+def test_lazy_range():
+    code = "2 * sqrt(1..4) + (1..4)"
+
+    e = parse_expression(code)
+    v = e.eval()
+
+    assert isinstance(v, types.GeneratorType)
+    actual = list(v)
+    expected = [3.0, 2.0 + 2 * 2**0.5, 3.0 + 2 * 3**0.5, 8.0]
+
+    assert actual == pytest.approx(expected)
+
+
+def test_lazy_sum():
+    code = "sum sin(1..Inf..100000)^2 + cos(1..Inf..100000)^2"
+
+    e = parse_expression(code)
+
+    tracemalloc.start()
+    v = e.eval()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert v == pytest.approx(100000)
+    assert peak < 100000
+
+
+def test_lazy_length_mismatch():
+    code = "print (1..3) + (1..4)"
+
+    e = parse_expression(code)
+
+    with pytest.raises(EvalError):
+        e.eval()
+
+
+def test_lazy_user_function(capsys):
+    code = """
+    f(x) = { print x; x }
+    y = 1
+    f(1..3)
+    y
+    """
+
+    e = parse_expression(code)
+    e.eval()
+
+    cap = capsys.readouterr()
+    assert cap.out == "1\n2\n3\n"
+
+
+def test_nodes():
+    code = "f(x) = { x if x > 0; -x }; f(1..3)"
+
+    e = parse_expression(code)
+    copy = pickle.loads(pickle.dumps(e))
+
+    assert not hasattr(e, '__dict__')
+    assert repr(copy) == repr(e)
+    assert list(copy.eval()) == [1, 2, 3]
+
+
+def test_memo(capsys):
+    code = """
+    fib(n) = {
+        n if n < 2
+        fib(n - 1) + fib(n - 2)
+    }
+    memo fib 10
+    print fib(60)
+    memo
+    """
+
+    e = parse_expression(code)
+    e.eval()
+
+    cap = capsys.readouterr()
+    assert cap.out.splitlines() == [
+        "1548008755920",
+        "fib: 58 hits, 61 misses, 10/10 cached",
+    ]
+
+
+@pytest.mark.parametrize(
+    "code, message",
+    [
+        ("a = 1; f(x) = x + a; memo f", "memo: f reads a"),
+        ("pi = 3; f(x) = x * pi; memo f", "memo: f reads pi"),
+        ("a = 1; f(x) = { a = a + x; a }; memo f", "memo: f reads a"),
+        ("a = 1; f(x) = { a = x if x > 0; a }; memo f", "memo: f reads a"),
+        ("f(x) = { for i in 1..x { a = i }; a }; memo f", "memo: f reads a"),
+        ("f(x) = { print x; x }; memo f", "memo: f uses print"),
+        ("f(x) = { g(y) = y; x }; memo f", "memo: f defines g"),
+        ("f(x) = { x[1] = 0; x }; memo f", "memo: f assigns to x[]"),
+        ("g(x) = k(x); f(x) = g(x); memo f", "memo: f calls g, which calls k, which"),
+        ("memo sin", "memo: sin is a builtin"),
+        ("f(x) = x; memo f 0", "memo: expected a positive cache size"),
+    ],
+)
+def test_memo_impure(code, message):
+    e = parse_expression(code)
+
+    with pytest.raises(EvalError) as excinfo:
+        e.eval()
+
+    assert str(excinfo.value).startswith(message)
+
+
+def test_memo_locals():
+    code = """
+    a = 1
+    f(x) = { a = x * 2; { b = a if x > 0; 0 } + a }
+    memo f
+    f(3)
+    """
+
+    e = parse_expression(code)
+
+    assert e.eval() == 12
+
+
+def test_memo_redefined(capsys):
+    code = """
+    g(x) = x
+    f(x) = g(x) + 1
+    memo f
+    print f(1)
+    g(x) = 10 * x
+    print f(1)
+    a = 5
+    g(x) = x + a
+    print f(1)
+    a = 6
+    print f(1)
+    """
+
+    e = parse_expression(code)
+    e.eval()
+
+    cap = capsys.readouterr()
+    assert cap.out.split() == ['2', '11', '7', '8']
+
+
+def test_memo_typed(capsys):
+    code = """
+    f(x) = x*2
+    print f(1) f(1.0) f(1==1)
+    memo f
+    print f(1) f(1.0) f(1==1)
+    print f(1.0) f(1==1) f(1)
+    """
+
+    e = parse_expression(code)
+    e.eval()
+
+    cap = capsys.readouterr()
+    assert cap.out.splitlines() == ['2 2.0 2'] * 2 + ['2.0 2 2']
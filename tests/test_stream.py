@@ -0,0 +1,110 @@
+import io
+import os
+import sys
+
+import pytest
+
+from nanocalc import Session
+from nanocalc.__main__ import main
+from nanocalc.common import ParseError, TokenError
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.session import ENGINES
+from nanocalc.stream import statements
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def split(source):
+    return [repr(p) for p in statements(source.splitlines(keepends=True))]
+
+
+def test_statements():
+    assert split('x = 1\ny = 2; z = 3\n\n# comment\n') == [
+        repr(parse(tokenize('x = 1'))),
+        repr(parse(tokenize('y = 2; z = 3'))),
+    ]
+
+
+@pytest.mark.parametrize(
+    'source',
+    [
+        'f(x) = {\n  y = x + 1\n  y*2\n}\n',
+        'x = (1 + {\n2\n})\n',
+        'for i in 1..3\n  print i\n',
+        'for i in 1..3\n  for j in 1..i\n    print i j\n',
+        'for i in 1..3 {\n  print i\n}\n',
+        's = "a\nb # c\n"\n',
+        'g(x) = {\n  0 if x < 0\n  x\n}',
+    ],
+)
+def test_multiline(source):
+    assert split(source) == [repr(parse(tokenize(source)))]
+
+
+@pytest.mark.parametrize('name', sorted(os.listdir(EXAMPLES)))
+def test_examples(name):
+    with open(os.path.join(EXAMPLES, name)) as f:
+        source = f.read()
+    expected = parse(tokenize(source)).left
+    actual = [s for p in statements(source.splitlines(keepends=True)) for s in p.left]
+    assert repr(actual) == repr(expected)
+
+
+@pytest.mark.parametrize(
+    'source, error',
+    [
+        ('x = 1\n}\n', ParseError),
+        ('x = {\n1\n', ParseError),
+        ('for i in 1..3\n', ParseError),
+        ('x = (1\n]\n', ParseError),
+        ('x = 1 +\ny = 2\n', ParseError),
+        ('s = "a\n', TokenError),
+        ('x = $\n', TokenError),
+    ],
+)
+def test_error(source, error):
+    with pytest.raises(error):
+        split(source)
+
+
+def test_lazy():
+    def lines():
+        yield 'x = 1\n'
+        yield 'for i in 1..2\n'
+        raise AssertionError('read too far')
+
+    assert repr(next(statements(lines()))) == repr(parse(tokenize('x = 1')))
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+def test_session(optimize, capsys):
+    session = Session(optimize=optimize)
+    lines = ['a = 2\n', 'for i in 1..3 {\n', '  print i*sqrt(a*a)\n', '}\n', 'a\n']
+    results = [session.run(p) for p in session.statements(lines)]
+    assert results == [2, None, 2]
+    assert capsys.readouterr().out == '2.0\n4.0\n6.0\n'
+
+
+REBOUND = 'f(x) = x * pi\npi = 3\nprint f(1)\n'
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_rebound_builtin(optimize, engine, capsys):
+    # pi is read when f is called, after the statement that rebinds it
+    session = Session(engine, optimize)
+    for p in session.statements(REBOUND.splitlines(keepends=True)):
+        session.run(p)
+    assert capsys.readouterr().out == '3\n'
+
+
+@pytest.mark.parametrize('args', [[], ['-O']])
+def test_main_rebound_builtin(tmp_path, monkeypatch, capsys, args):
+    fname = tmp_path / 'rebound.nc'
+    fname.write_text(REBOUND)
+    for argv in [['-f', str(fname)], []]:
+        monkeypatch.setattr(sys, 'stdin', io.StringIO(REBOUND))
+        monkeypatch.setattr(sys, 'argv', ['nc', '-s', '--no-cache', *args, *argv])
+        assert main() == 0
+        assert capsys.readouterr().out == '3\n'
@@ -0,0 +1,109 @@
+import sys
+
+import pytest
+
+from nanocalc.expr import GLOBALS, TailCall, tail_case
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.session import ENGINES
+
+# deep enough that a Python frame per level would hit the recursion limit
+DEPTH = 10 * sys.getrecursionlimit()
+
+
+def parse_expression(s):
+    return parse(tokenize(s))
+
+
+def run(source, engine):
+    GLOBALS._d.clear()
+    program = parse_expression(source)
+    return ENGINES[engine](program)()
+
+
+def test_tail_case():
+    cases = parse_expression('{ 1 if x > 0; f(x) }').left[0].left
+    assert tail_case(cases) == 1
+    cases = parse_expression('{ f(x) if x > 0; nil; nil }').left[0].left
+    assert tail_case(cases) == 0
+    cases = parse_expression('{ nil; nil }').left[0].left
+    assert tail_case(cases) == 0
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_accumulator(engine):
+    source = f'g(n, a) = {{ a if n == 0; g(n - 1, a + n) }}; g({DEPTH}, 0)'
+    assert run(source, engine) == DEPTH * (DEPTH + 1) // 2
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_loop_with_nil(engine, capsys):
+    # examples/loop.nc, deeper
+    source = f'f(x) = {{ {{ write x; f(x + 1) }} if x < {DEPTH}; nil }}; f(0)'
+    assert run(source, engine) is None
+    assert capsys.readouterr().out == ''.join(map(str, range(DEPTH)))
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mutual_recursion(engine):
+    source = f"""
+    even(n) = {{ 1 if n == 0; odd(n - 1) }}
+    odd(n) = {{ 0 if n == 0; even(n - 1) }}
+    [even({DEPTH}), odd({DEPTH}), even(7)]
+    """
+    assert run(source, engine) == [1, 0, 0]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_not_in_tail_position(engine):
+    source = """
+    fib(n) = { n if n < 2; fib(n - 1) + fib(n - 2) }
+    first(x) = { first(x + 1) if x < 3; x }
+    [fib(15), first(0)]
+    """
+    assert run(source, engine) == [610, 3]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_assigned_nil(engine):
+    # a call followed by nil is only a tail call while nil is None
+    source = """
+    nil = 5
+    f(x) = { g(x) if x > 0; nil }
+    g(x) = { }
+    f(1)
+    """
+    assert run(source, engine) == 5
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_tail_calls(engine):
+    source = """
+    inc(x) = x + 1
+    h(x) = { y = x * 2; inc(y) }
+    k(x) = sqrt(x)
+    l(x) = inc(x)
+    [h(3), k(16), l(1..3), inc(h(1))]
+    """
+    assert run(source, engine) == [7, 4, [2, 3, 4], 4]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_memoized(engine):
+    source = """
+    g(n, a) = { a if n == 0; g(n - 1, a + n) }
+    memo g
+    g(100, 0)
+    """
+    assert run(source, engine) == 5050
+
+
+# the stack engine runs calls on its own stack and has no enter
+@pytest.mark.parametrize('engine', [e for e in ENGINES if e != 'stack'])
+def test_enter(engine):
+    run('f(x) = { x if x > 2; f(x + 1) }', engine)
+    f = GLOBALS['f']
+    assert f(0) == 3
+    call = f.enter(0)
+    assert type(call) is TailCall and call.args == [1]
+    assert f.enter(3) == 3
@@ -0,0 +1,72 @@
+from nanocalc.expr import GLOBALS
+from nanocalc.lexer import tokenize
+from nanocalc.parser import parse
+from nanocalc.vm import (
+    CALL,
+    DEF,
+    JUMP,
+    JUMPIFNOT,
+    NEXT,
+    OPNAMES,
+    OPERANDS,
+    TAILCALL,
+    compile_vm,
+    disassemble,
+    lower,
+)
+
+
+def ops(code):
+    return [ins[0] for ins in code.instructions]
+
+
+def test_operands():
+    assert set(OPERANDS) == set(range(len(OPNAMES)))
+
+
+def test_jumps():
+    code = lower(parse(tokenize("for i in 1..3 { x = i if i > 1 }")))
+
+    assert ops(code).count(NEXT) == 1
+    assert ops(code).count(JUMPIFNOT) == 1
+    assert ops(code).count(JUMP) == 2
+    for ins in code.instructions:
+        if ins[0] == JUMP:
+            assert 0 <= ins[1] <= len(code.instructions)
+
+
+def test_tail_calls():
+    code = """
+    f(n) = { n if n < 1; f(n - 1) }
+    g(n) = { n if n < 1; 1 + g(n - 1) }
+    """
+    program = parse(tokenize(code))
+    f, g = (ins[3] for ins in lower(program).instructions if ins[0] == DEF)
+
+    assert TAILCALL in ops(f) and CALL not in ops(f)
+    assert CALL in ops(g) and TAILCALL not in ops(g)
+
+    GLOBALS._d.clear()
+    compile_vm(program)()
+    assert GLOBALS['f'](100000) == 0
+
+
+def test_disassemble():
+    code = lower(parse(tokenize("f(x) = x + 1; y = f(2)")))
+
+    assert disassemble(code).splitlines() == [
+        "<program>:",
+        "     0  DEF         'f', <code f>",
+        "     1  CONST       r0, None",
+        "     2  LOAD        r1, 'f'",
+        "     3  CONST       r2, 2",
+        "     4  CALL        r3, r1, (r2)",
+        "     5  STORE       'y', r3",
+        "     6  RETURN      r3",
+        "",
+        "f:",
+        "     0  LOAD        r0, 'x'",
+        "     1  CONST       r1, 1",
+        "     2  BINOP       r2, add, r0, r1",
+        "     3  RETURN      r2",
+    ]